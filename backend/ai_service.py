@@ -2,40 +2,30 @@
 AI Service for generating character content and images using LLM APIs
 """
 import json
+import logging
+import time
 import requests
 import base64
 import urllib.parse
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Optional, Any, Tuple
+from typing import Callable, Dict, Iterator, List, Optional, Any, Tuple
 from pydantic import BaseModel
 from image_generator import generate_simple_image
+from metrics import AI_REQUEST_DURATION, AI_TOKENS
+from singleflight import single_flight
+import rate_limiter
+import provider_chain
+
+logger = logging.getLogger(__name__)
 
 class AISettings(BaseModel):
     provider: str  # 'kimi', 'openrouter', 'openai'
     api_key: str
     model: str
 
-class CharacterContent(BaseModel):
-    pinyin: str
-    alt_pinyin: Optional[str]
-    radical: str
-    stroke_count: int
-    stroke_order: str
-    illustration_desc: str
-    rhyme_text: str
-    ancient_forms: Dict[str, str]
-    etymology: str
-    word_groups: Dict[str, list]
-    famous_quotes: list
-    character_structure: Dict[str, Any]
-    meaning: str
-
 
-def generate_character_content(character: str, settings: AISettings) -> Optional[CharacterContent]:
-    """Generate character content using AI"""
-    
-    system_prompt = """你是一个专业的中文汉字教育专家。你的任务是为给定的汉字生成详细的学习内容。
+CHARACTER_SYSTEM_PROMPT = """你是一个专业的中文汉字教育专家。你的任务是为给定的汉字生成详细的学习内容。
 请按照以下JSON格式返回结果（不要包含任何其他文字）：
 
 {
@@ -117,197 +107,458 @@ def generate_character_content(character: str, settings: AISettings) -> Optional
 6. 字源解释要通俗易懂
 """
 
+
+class CharacterContent(BaseModel):
+    pinyin: str
+    alt_pinyin: Optional[str]
+    radical: str
+    stroke_count: int
+    stroke_order: str
+    illustration_desc: str
+    rhyme_text: str
+    ancient_forms: Dict[str, str]
+    etymology: str
+    word_groups: Dict[str, list]
+    famous_quotes: list
+    character_structure: Dict[str, Any]
+    meaning: str
+
+
+@single_flight('generate_character_content', exclude=('on_usage',))
+def generate_character_content(character: str, settings: AISettings,
+                               on_usage: Optional[Callable[["AIUsage"], None]] = None) -> Optional[CharacterContent]:
+    """Generate character content using AI"""
+    system_prompt = CHARACTER_SYSTEM_PROMPT
     user_prompt = f"请为汉字「{character}」生成完整的学习内容。"
     
     try:
-        if settings.provider == 'kimi':
-            return _call_kimi(system_prompt, user_prompt, settings)
-        elif settings.provider == 'openrouter':
-            return _call_openrouter(system_prompt, user_prompt, settings)
-        elif settings.provider == 'openai':
-            return _call_openai(system_prompt, user_prompt, settings)
-        elif settings.provider == 'siliconflow':
-            return _call_siliconflow(system_prompt, user_prompt, settings)
-        else:
-            raise ValueError(f"Unknown provider: {settings.provider}")
-    except Exception as e:
-        print(f"AI generation error: {e}")
-        import traceback
-        traceback.print_exc()
+        content, usage = _complete(system_prompt, user_prompt, settings)
+        if on_usage:
+            on_usage(usage)
+        return _parse_content(content)
+    except Exception:
+        logger.exception("AI generation failed", extra={'character': character, 'provider': settings.provider})
         return None
 
 
-def _call_kimi(system_prompt: str, user_prompt: str, settings: AISettings) -> Optional[CharacterContent]:
-    """Call Kimi API - supports both .cn and .ai platforms"""
-    # Use .ai endpoint for international keys
-    url = "https://api.moonshot.ai/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {settings.api_key}",
-        "Content-Type": "application/json"
-    }
-    
-    # Use the model from settings
-    model = settings.model
+def _parse_content(content: str) -> Optional[CharacterContent]:
+    """Parse AI response content into CharacterContent"""
+    # Fires on every generation - sampled so DEBUG stays affordable
+    logger.debug("Parsing content", extra={'preview': content[:200], 'sample_rate': 0.1})
     
-    data = {
-        "model": model,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ],
-        "temperature": 0.7
-    }
+    # Try to extract JSON from markdown code block if present
+    if "```json" in content:
+        content = content.split("```json")[1].split("```")[0]
+    elif "```" in content:
+        content = content.split("```")[1].split("```")[0]
     
-    print(f"Calling Kimi API with model: {model}")
+    content = content.strip()
     
     try:
-        response = requests.post(url, headers=headers, json=data, timeout=60)
-        
-        print(f"Response status: {response.status_code}")
-        
-        if response.status_code == 401:
-            raise Exception("API Key 无效或已过期，请检查您的 Kimi API Key")
-        elif response.status_code == 429:
-            raise Exception("API 调用频率超限，请稍后再试")
-        elif response.status_code != 200:
-            print(f"Error response: {response.text}")
-            raise Exception(f"API 返回错误: {response.status_code}")
-        
-        result = response.json()
-        content = result['choices'][0]['message']['content']
-        
-        print(f"Received content length: {len(content)}")
-        
-        # Parse JSON from response
-        return _parse_content(content)
-    except Exception as e:
-        print(f"Error in _call_kimi: {e}")
-        import traceback
-        traceback.print_exc()
+        data = json.loads(content)
+        return CharacterContent(**data)
+    except json.JSONDecodeError as e:
+        logger.warning("Failed to parse JSON: %s", e, extra={'content': content[:1000]})
         return None
 
 
-def _call_openrouter(system_prompt: str, user_prompt: str, settings: AISettings) -> Optional[CharacterContent]:
-    """Call OpenRouter API"""
-    url = "https://openrouter.ai/api/v1/chat/completions"
+# ==================== Provider Calls ====================
+
+# OpenAI-compatible chat completion endpoints per provider
+# rate_limit: (requests per minute, burst) per API key, sized for entry-level
+# tiers - override with AI_RATE_LIMIT_<PROVIDER> (see rate_limiter.py)
+PROVIDER_ENDPOINTS = {
+    'kimi': {
+        'url': "https://api.moonshot.ai/v1/chat/completions",
+        'default_model': "kimi-latest",
+        'headers': {},
+        'rate_limit': (60, 5),
+    },
+    'openrouter': {
+        'url': "https://openrouter.ai/api/v1/chat/completions",
+        'default_model': None,
+        'headers': {"HTTP-Referer": "http://localhost:5173", "X-Title": "Chinese Learning App"},
+        'rate_limit': (120, 10),
+    },
+    'openai': {
+        'url': "https://api.openai.com/v1/chat/completions",
+        'default_model': "gpt-4o",
+        'headers': {},
+        'rate_limit': (300, 20),
+    },
+    'siliconflow': {
+        'url': "https://api.siliconflow.cn/v1/chat/completions",
+        'default_model': "Qwen/Qwen2.5-7B-Instruct",
+        'headers': {},
+        'max_tokens': 2048,
+        'rate_limit': (60, 5),
+    },
+}
+
+
+def _build_chat_request(system_prompt: str, user_prompt: str, settings: AISettings,
+                        stream: bool = False) -> Tuple[str, Dict, Dict]:
+    """Build (url, headers, body) for an OpenAI-compatible chat completion call"""
+    endpoint = PROVIDER_ENDPOINTS.get(settings.provider)
+    if endpoint is None:
+        raise ValueError(f"Unknown provider: {settings.provider}")
+    
     headers = {
         "Authorization": f"Bearer {settings.api_key}",
         "Content-Type": "application/json",
-        "HTTP-Referer": "http://localhost:5173",
-        "X-Title": "Chinese Learning App"
+        **endpoint['headers']
     }
     data = {
-        "model": settings.model,
+        "model": settings.model or endpoint['default_model'],
         "messages": [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt}
         ],
         "temperature": 0.7
     }
-    
-    try:
-        response = requests.post(url, headers=headers, json=data, timeout=60)
-        response.raise_for_status()
-        
-        result = response.json()
-        content = result['choices'][0]['message']['content']
-        
-        return _parse_content(content)
-    except Exception as e:
-        print(f"Error in _call_openrouter: {e}")
-        import traceback
-        traceback.print_exc()
-        return None
+    if 'max_tokens' in endpoint:
+        data["max_tokens"] = endpoint['max_tokens']
+    if stream:
+        data["stream"] = True
+    return endpoint['url'], headers, data
 
 
-def _call_openai(system_prompt: str, user_prompt: str, settings: AISettings) -> Optional[CharacterContent]:
-    """Call OpenAI API (GPT-4o)"""
-    url = "https://api.openai.com/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {settings.api_key}",
-        "Content-Type": "application/json"
-    }
-    data = {
-        "model": settings.model or "gpt-4o",
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ],
-        "temperature": 0.7
-    }
+def _post(settings: AISettings, url: str, headers: Dict, data: Dict,
+          max_retries: int = rate_limiter.MAX_RETRIES, **kwargs) -> requests.Response:
+    """POST to a provider under its rate limit, retrying throttled and transient failures"""
+    endpoint = PROVIDER_ENDPOINTS.get(settings.provider, {})
+    limit = rate_limiter.limit_for(settings.provider, endpoint.get('rate_limit'))
+    return rate_limiter.call(settings.provider, settings.api_key, limit,
+                             lambda: requests.post(url, headers=headers, json=data, **kwargs), max_retries)
+
+
+class AIUsage(BaseModel):
+    """Token usage and latency of one provider call"""
+    provider: str
+    model: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+    latency_ms: int = 0
+
+
+def _chat_completion(system_prompt: str, user_prompt: str, settings: AISettings,
+                     max_retries: int = rate_limiter.MAX_RETRIES) -> Tuple[str, AIUsage]:
+    """Call one provider (non-streaming) and return (content, usage)"""
+    url, headers, data = _build_chat_request(system_prompt, user_prompt, settings)
     
+    started = time.perf_counter()
+    outcome = 'error'
     try:
-        print(f"Calling OpenAI API with model: {settings.model or 'gpt-4o'}")
-        response = requests.post(url, headers=headers, json=data, timeout=60)
-        response.raise_for_status()
-        
-        result = response.json()
-        content = result['choices'][0]['message']['content']
-        
-        print(f"Received content length: {len(content)}")
-        return _parse_content(content)
-    except Exception as e:
-        print(f"Error in _call_openai: {e}")
-        import traceback
-        traceback.print_exc()
-        return None
+        # Short connect timeout: an unreachable provider should fail over quickly
+        response = _post(settings, url, headers, data, max_retries, timeout=(10, 60))
+        if response.status_code == 200:
+            outcome = 'success'
+    finally:
+        elapsed = time.perf_counter() - started
+        AI_REQUEST_DURATION.observe(elapsed, provider=settings.provider, operation='chat', outcome=outcome)
+    latency_ms = int(elapsed * 1000)
+    
+    if response.status_code == 401:
+        raise Exception("API Key 无效或已过期，请检查您的 API Key")
+    elif response.status_code == 429:
+        raise Exception("API 调用频率超限，请稍后再试")
+    elif response.status_code != 200:
+        logger.warning("Provider error response",
+                       extra={'provider': settings.provider, 'status': response.status_code, 'body': response.text[:500]})
+        raise Exception(f"API 返回错误: {response.status_code}")
+    
+    result = response.json()
+    content = result['choices'][0]['message']['content']
+    usage = result.get('usage') or {}
+    AI_TOKENS.inc(usage.get('prompt_tokens', 0), provider=settings.provider, kind='prompt')
+    AI_TOKENS.inc(usage.get('completion_tokens', 0), provider=settings.provider, kind='completion')
+    
+    return content, AIUsage(
+        provider=settings.provider,
+        model=data['model'] or '',
+        prompt_tokens=usage.get('prompt_tokens', 0),
+        completion_tokens=usage.get('completion_tokens', 0),
+        total_tokens=usage.get('total_tokens', 0),
+        latency_ms=latency_ms
+    )
+
+
+def _complete(system_prompt: str, user_prompt: str, settings: AISettings) -> Tuple[str, AIUsage]:
+    """_chat_completion with failover down the provider chain (usage names the provider that answered)"""
+    return provider_chain.run(settings, lambda candidate, max_retries:
+                              _chat_completion(system_prompt, user_prompt, candidate, max_retries))
+
+
+# ==================== Field-Selective Generation ====================
+
+# Compact one-line schema per CharacterContent field
+CHARACTER_FIELD_SCHEMA = {
+    "pinyin": '"拼音（带声调）"',
+    "alt_pinyin": '"备选读音，没有则为空"',
+    "radical": '"部首"',
+    "stroke_count": '数字',
+    "stroke_order": '"笔顺，笔画Unicode符号，空格分隔"',
+    "illustration_desc": '"插图描述（20字以内）"',
+    "rhyme_text": '"四句儿歌，每句5-7字"',
+    "ancient_forms": '{"bronze": "金文", "seal": "小篆", "clerical": "隶书"}',
+    "etymology": '"字源解释，包括造字原理，通俗易懂"',
+    "word_groups": '{"<读音>": ["常用词语", ...]}',
+    "famous_quotes": '[{"quote": "名句", "author": "作者", "source": "出处"}]',
+    "character_structure": '{"base_char": "基础字", "related": [{"char": "相关字", "pinyin": "拼音", "meaning": "解释"}]}',
+    "meaning": '"基本释义"',
+}
 
+CHARACTER_FIELDS = list(CHARACTER_FIELD_SCHEMA)
 
-def _call_siliconflow(system_prompt: str, user_prompt: str, settings: AISettings) -> Optional[CharacterContent]:
-    """Call SiliconFlow API (国内, 便宜)"""
-    url = "https://api.siliconflow.cn/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {settings.api_key}",
-        "Content-Type": "application/json"
-    }
-    data = {
-        "model": settings.model or "Qwen/Qwen2.5-7B-Instruct",
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ],
-        "temperature": 0.7,
-        "max_tokens": 2048
-    }
+# Only sent when stroke_order is requested
+STROKE_SYMBOLS_COMPACT = ("笔画符号：横一 竖丨 撇丿 捺㇏ 点丶 提㇀ 横折㇕ 横撇㇇ 横钩㇖ 竖钩亅 竖提㇄ "
+                          "竖弯钩乚 斜钩㇂ 卧钩㇃ 撇折㇜ 撇点㇛ 横折钩㇆ 横折提㇊ 横折弯㇍ 横折折㇅ "
+                          "横折折折㇎ 横斜钩㇈ 竖折㇗ 竖折折㇞ 竖折折折㇡。例：天 = 一 一 丿 ㇏")
+
+
+def missing_character_fields(row: Dict) -> List[str]:
+    """List the generatable fields that are empty on a character row"""
+    missing = []
+    for field in CHARACTER_FIELDS:
+        value = row.get(field)
+        if field == 'alt_pinyin':
+            continue  # Legitimately empty for most characters
+        if value is None or value == "" or value == {} or value == [] or (field == 'stroke_count' and value == 0):
+            missing.append(field)
+    return missing
+
+
+def build_partial_prompt(fields: List[str]) -> str:
+    """Build a compact system prompt that asks for only the given fields"""
+    lines = ["你是中文汉字教育专家，内容面向中小学生。只返回一个JSON对象，不要其他文字，且只包含以下字段："]
+    lines.extend(f'"{field}": {CHARACTER_FIELD_SCHEMA[field]}' for field in fields)
+    if 'stroke_order' in fields:
+        lines.append(STROKE_SYMBOLS_COMPACT)
+    return "\n".join(lines)
+
+
+def generate_character_fields(character: str, fields: List[str], settings: AISettings,
+                              known: Optional[Dict] = None) -> Tuple[Optional[Dict], Optional[AIUsage]]:
+    """Generate only the selected character fields with a compact prompt
+
+    known: existing values (e.g. pinyin, meaning) sent as context so the new
+    fields stay consistent with the card.
+    Returns (fields dict or None, usage or None).
+    """
+    fields = [field for field in fields if field in CHARACTER_FIELD_SCHEMA]
+    if not fields:
+        return {}, None
+    
+    context = []
+    for key in ('pinyin', 'meaning'):
+        if known and known.get(key) and key not in fields:
+            context.append(f"{key}: {known[key]}")
+    user_prompt = f"汉字「{character}」"
+    if context:
+        user_prompt += "（已知 " + "；".join(context) + "）"
     
     try:
-        print(f"Calling SiliconFlow API with model: {settings.model or 'Qwen/Qwen2.5-7B-Instruct'}")
-        response = requests.post(url, headers=headers, json=data, timeout=60)
-        response.raise_for_status()
-        
-        result = response.json()
-        content = result['choices'][0]['message']['content']
-        
-        print(f"Received content length: {len(content)}")
-        return _parse_content(content)
+        content, usage = _complete(build_partial_prompt(fields), user_prompt, settings)
     except Exception as e:
-        print(f"Error in _call_siliconflow: {e}")
-        import traceback
-        traceback.print_exc()
-        return None
+        logger.warning("AI partial generation failed: %s", e, extra={'character': character, 'fields': fields})
+        return None, None
+    
+    data = _extract_json(content)
+    if data is None:
+        return None, usage
+    
+    result = {field: data[field] for field in fields if field in data}
+    if 'stroke_count' in result:
+        try:
+            result['stroke_count'] = int(result['stroke_count'])
+        except (TypeError, ValueError):
+            del result['stroke_count']
+    return result, usage
 
 
-def _parse_content(content: str) -> Optional[CharacterContent]:
-    """Parse AI response content into CharacterContent"""
-    print(f"Parsing content: {content[:200]}...")
-    
-    # Try to extract JSON from markdown code block if present
+def _extract_json(content: str) -> Optional[Dict]:
+    """Extract a JSON object from an LLM response (handles markdown code blocks)"""
     if "```json" in content:
         content = content.split("```json")[1].split("```")[0]
     elif "```" in content:
         content = content.split("```")[1].split("```")[0]
     
-    content = content.strip()
-    
     try:
-        data = json.loads(content)
-        return CharacterContent(**data)
+        return json.loads(content.strip())
     except json.JSONDecodeError as e:
-        print(f"Failed to parse JSON: {e}")
-        print(f"Content: {content}")
+        logger.warning("Failed to parse JSON: %s", e)
         return None
 
 
+# ==================== Streaming Generation ====================
+
+def _stream_chat(system_prompt: str, user_prompt: str, settings: AISettings,
+                 max_retries: int = rate_limiter.MAX_RETRIES) -> Iterator[str]:
+    """Call one provider with stream=true and yield content deltas as they arrive"""
+    url, headers, data = _build_chat_request(system_prompt, user_prompt, settings, stream=True)
+    
+    # Timed from request to [DONE]; timeout is (connect, read between chunks)
+    with AI_REQUEST_DURATION.time(provider=settings.provider, operation='stream'), \
+            _post(settings, url, headers, data, max_retries, stream=True, timeout=(10, 60)) as response:
+        if response.status_code == 401:
+            raise Exception("API Key 无效或已过期")
+        elif response.status_code == 429:
+            raise Exception("API 调用频率超限，请稍后再试")
+        elif response.status_code != 200:
+            raise Exception(f"API 返回错误: {response.status_code}")
+        
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            payload = line[len("data:"):].strip()
+            if payload == "[DONE]":
+                break
+            try:
+                chunk = json.loads(payload)
+            except json.JSONDecodeError:
+                continue
+            choices = chunk.get('choices') or []
+            if not choices:
+                continue
+            delta = choices[0].get('delta', {}).get('content')
+            if delta:
+                yield delta
+
+
+class IncrementalJSONParser:
+    """Incremental parser that emits top-level JSON object fields as soon as they complete
+
+    Feed raw LLM text chunks (markdown fences and leading prose are skipped);
+    each call to feed() returns the (key, value) pairs completed by that chunk.
+    """
+    
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.started = False
+        self.finished = False
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.key = None
+        self.key_start = None
+        self.value_start = None
+        self.fields: Dict[str, Any] = {}
+    
+    def feed(self, chunk: str) -> list:
+        """Consume a text chunk and return newly completed (key, value) pairs"""
+        self.buffer += chunk
+        completed = []
+        
+        while self.pos < len(self.buffer) and not self.finished:
+            ch = self.buffer[self.pos]
+            
+            if not self.started:
+                if ch == '{':
+                    self.started = True
+                    self.depth = 1
+                self.pos += 1
+                continue
+            
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == '\\':
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    if self.depth == 1 and self.key is None and self.key_start is not None:
+                        self.key = json.loads(self.buffer[self.key_start:self.pos + 1])
+                        self.key_start = None
+                self.pos += 1
+                continue
+            
+            if ch == '"':
+                self.in_string = True
+                if self.depth == 1 and self.key is None and self.value_start is None:
+                    self.key_start = self.pos
+            elif ch == ':' and self.depth == 1 and self.key is not None and self.value_start is None:
+                self.value_start = self.pos + 1
+            elif ch in '{[':
+                self.depth += 1
+            elif ch in '}]':
+                self.depth -= 1
+                if self.depth == 0:
+                    self._complete_value(self.pos, completed)
+                    self.finished = True
+            elif ch == ',' and self.depth == 1:
+                self._complete_value(self.pos, completed)
+            
+            self.pos += 1
+        
+        return completed
+    
+    def _complete_value(self, end: int, completed: list):
+        if self.key is None or self.value_start is None:
+            return
+        raw = self.buffer[self.value_start:end].strip()
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            value = raw
+        self.fields[self.key] = value
+        completed.append((self.key, value))
+        self.key = None
+        self.value_start = None
+
+
+def stream_character_content(character: str, settings: AISettings) -> Iterator[Tuple[str, Any]]:
+    """Stream character content generation as ("field", {...}) events and a final ("done", ...)
+
+    The final event carries the validated CharacterContent, or ("error", message).
+    """
+    user_prompt = f"请为汉字「{character}」生成完整的学习内容。"
+    parser = IncrementalJSONParser()
+    
+    try:
+        for delta in provider_chain.stream(settings, lambda candidate, max_retries:
+                                           _stream_chat(CHARACTER_SYSTEM_PROMPT, user_prompt, candidate, max_retries)):
+            for key, value in parser.feed(delta):
+                yield "field", {"name": key, "value": value}
+    except Exception as e:
+        yield "error", f"API 调用失败: {e}"
+        return
+    
+    try:
+        content = CharacterContent(**parser.fields)
+    except Exception as e:
+        yield "error", f"AI 返回内容解析失败: {e}"
+        return
+    yield "done", content.model_dump()
+
+
+def stream_word_content(word: str, settings: AISettings) -> Iterator[Tuple[str, Any]]:
+    """Stream word content generation as ("field", {...}) events and a final ("done", ...)"""
+    user_prompt = f"请为词语 \"{word}\" 生成学习内容。"
+    parser = IncrementalJSONParser()
+    
+    try:
+        for delta in provider_chain.stream(settings, lambda candidate, max_retries:
+                                           _stream_chat(WORD_SYSTEM_PROMPT, user_prompt, candidate, max_retries)):
+            for key, value in parser.feed(delta):
+                yield "field", {"name": key, "value": value}
+    except Exception as e:
+        yield "error", f"API 调用失败: {e}"
+        return
+    
+    if not parser.fields:
+        yield "error", "AI 返回内容解析失败"
+        return
+    yield "done", {
+        'pinyin': parser.fields.get('pinyin', ''),
+        'english_translation': parser.fields.get('english_translation', ''),
+        'example_sentence': parser.fields.get('example_sentence', ''),
+        'example_pinyin': parser.fields.get('example_pinyin', ''),
+        'example_translation': parser.fields.get('example_translation', '')
+    }
+
+
 def build_image_prompt(character: str, description: str) -> str:
     """Build AI image generation prompt with consistent style
     
@@ -338,8 +589,7 @@ def generate_free_image(prompt: str, output_path: str) -> Tuple[bool, str]:
         # Use Flux model for better quality
         image_url = f"https://image.pollinations.ai/prompt/{encoded_prompt}?width=1024&height=1024&nologo=true&seed=42&enhance=true"
         
-        print(f"Calling Pollinations.ai (free)...")
-        print(f"Image URL: {image_url[:80]}...")
+        logger.debug("Calling Pollinations.ai", extra={'url': image_url[:80]})
         
         # Download the image
         headers = {
@@ -351,16 +601,14 @@ def generate_free_image(prompt: str, output_path: str) -> Tuple[bool, str]:
             with open(output_path, 'wb') as f:
                 f.write(response.content)
             file_size = len(response.content)
-            print(f"✅ Free image saved: {output_path} ({file_size} bytes)")
+            logger.info("Free image saved", extra={'path': output_path, 'bytes': file_size})
             return True, f"免费图片生成成功！({file_size} bytes)"
         else:
             return False, f"下载图片失败: {response.status_code}"
             
     except Exception as e:
         error_msg = f"免费图片生成出错: {str(e)}"
-        print(error_msg)
-        import traceback
-        traceback.print_exc()
+        logger.exception(error_msg)
         return False, error_msg
 
 
@@ -386,7 +634,7 @@ def generate_siliconflow_image(prompt: str, api_key: str, output_path: str) -> T
             "num_inference_steps": 4,  # 快速生成
         }
         
-        print(f"Calling SiliconFlow API (Flux.1-schnell)...")
+        logger.debug("Calling SiliconFlow API (Flux.1-schnell)")
         response = requests.post(url, headers=headers, json=data, timeout=120)
         
         if response.status_code == 200:
@@ -401,20 +649,18 @@ def generate_siliconflow_image(prompt: str, api_key: str, output_path: str) -> T
                 with open(output_path, 'wb') as f:
                     f.write(image_data)
                 file_size = len(image_data)
-                print(f"✅ SiliconFlow image saved: {output_path} ({file_size} bytes)")
+                logger.info("SiliconFlow image saved", extra={'path': output_path, 'bytes': file_size})
                 return True, f"硅基流动图片生成成功！({file_size} bytes)"
             else:
                 return False, "API 返回数据格式错误"
         else:
             error_msg = response.text
-            print(f"SiliconFlow API error: {error_msg}")
+            logger.warning("SiliconFlow API error", extra={'status': response.status_code, 'body': error_msg[:500]})
             return False, f"SiliconFlow API 错误: {error_msg[:200]}"
             
     except Exception as e:
         error_msg = f"SiliconFlow 生成出错: {str(e)}"
-        print(error_msg)
-        import traceback
-        traceback.print_exc()
+        logger.exception(error_msg)
         return False, error_msg
 
 
@@ -439,7 +685,7 @@ def generate_dalle_image(prompt: str, api_key: str, output_path: str) -> Tuple[b
             "n": 1
         }
         
-        print(f"Calling DALL-E 3 API...")
+        logger.debug("Calling DALL-E 3 API")
         response = requests.post(url, headers=headers, json=data, timeout=120)
         
         if response.status_code == 200:
@@ -447,27 +693,25 @@ def generate_dalle_image(prompt: str, api_key: str, output_path: str) -> Tuple[b
             image_url = result['data'][0]['url']
             
             # Download the image
-            print(f"Downloading image from: {image_url[:50]}...")
+            logger.debug("Downloading DALL-E image", extra={'url': image_url[:50]})
             img_response = requests.get(image_url, timeout=60)
             
             if img_response.status_code == 200:
                 with open(output_path, 'wb') as f:
                     f.write(img_response.content)
                 file_size = len(img_response.content)
-                print(f"✅ DALL-E image saved: {output_path} ({file_size} bytes)")
+                logger.info("DALL-E image saved", extra={'path': output_path, 'bytes': file_size})
                 return True, f"DALL-E 图片生成成功！({file_size} bytes)"
             else:
                 return False, f"下载图片失败: {img_response.status_code}"
         else:
             error_msg = response.text
-            print(f"DALL-E API error: {error_msg}")
+            logger.warning("DALL-E API error", extra={'status': response.status_code, 'body': error_msg[:500]})
             return False, f"DALL-E API 错误: {error_msg[:200]}"
             
     except Exception as e:
         error_msg = f"DALL-E 生成出错: {str(e)}"
-        print(error_msg)
-        import traceback
-        traceback.print_exc()
+        logger.exception(error_msg)
         return False, error_msg
 
 
@@ -484,12 +728,11 @@ def generate_character_image(character: str, illustration_desc: str, settings: A
         Tuple of (success: bool, message: str, image_path: Optional[str])
     """
     try:
-        print(f"Generating image for character: {character}")
-        print(f"Description: {illustration_desc}")
+        logger.info("Generating image", extra={'character': character, 'provider': settings.provider})
         
         # Build the full prompt with style
         full_prompt = build_image_prompt(character, illustration_desc)
-        print(f"Image prompt:\n{full_prompt}")
+        logger.debug("Image prompt", extra={'character': character, 'prompt': full_prompt})
         
         # Use timestamp to create unique filename (preserves old images)
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -498,46 +741,44 @@ def generate_character_image(character: str, illustration_desc: str, settings: A
         
         # Option 1: SiliconFlow (国内, 便宜 ~¥0.01/张)
         if settings.provider == 'siliconflow' and settings.api_key:
-            print("Using SiliconFlow (Flux.1-schnell)...")
+            logger.debug("Using SiliconFlow (Flux.1-schnell)")
             success, msg = generate_siliconflow_image(full_prompt, settings.api_key, str(output_path))
             if success:
                 return True, msg, f"/images/characters/{filename}"
             else:
-                print(f"SiliconFlow failed: {msg}")
+                logger.warning("SiliconFlow failed: %s", msg)
         
         # Option 2: Pollinations.ai (completely free) - DEFAULT for all providers
-        print("Trying Pollinations.ai (free)...")
+        logger.debug("Trying Pollinations.ai")
         success, msg = generate_free_image(full_prompt, str(output_path))
         if success:
             return True, msg, f"/images/characters/{filename}"
         else:
-            print(f"Free service failed: {msg}")
+            logger.warning("Free service failed: %s", msg)
         
         # Option 3: Try DALL-E 3 if using OpenAI provider
         if settings.provider == 'openai' and settings.api_key:
-            print("Using DALL-E 3 for image generation...")
+            logger.debug("Using DALL-E 3 for image generation")
             success, msg = generate_dalle_image(full_prompt, settings.api_key, str(output_path))
             if success:
                 return True, msg, f"/images/characters/{filename}"
             else:
-                print(f"DALL-E failed: {msg}")
+                logger.warning("DALL-E failed: %s", msg)
         
         # Option 4: Fallback to local simple image generator
-        print(f"Using local image generator...")
+        logger.debug("Using local image generator")
         image_path = generate_simple_image(character, illustration_desc, output_dir, filename)
         
         if image_path:
             file_size = output_path.stat().st_size
-            print(f"✅ Local image generated: {image_path} ({file_size} bytes)")
+            logger.info("Local image generated", extra={'path': image_path, 'bytes': file_size})
             return True, f"本地图片生成成功！({file_size} bytes)", image_path
         else:
             return False, "图片生成失败", None
         
     except Exception as e:
         error_msg = f"图片生成出错: {str(e)}"
-        print(error_msg)
-        import traceback
-        traceback.print_exc()
+        logger.exception(error_msg)
         return False, error_msg, None
 
 
@@ -623,10 +864,7 @@ if __name__ == "__main__":
     print("AI Service module loaded successfully")
 
 
-def generate_word_content(word: str, settings: AISettings) -> Optional[Dict]:
-    """Generate word content (pinyin, translation, example sentence) using AI"""
-    
-    system_prompt = """你是一个专业的中文词汇教育专家。你的任务是为给定的中文词语生成详细的学习内容。
+WORD_SYSTEM_PROMPT = """你是一个专业的中文词汇教育专家。你的任务是为给定的中文词语生成详细的学习内容。
 请按照以下JSON格式返回结果（不要包含任何其他文字）：
 
 {
@@ -642,42 +880,51 @@ def generate_word_content(word: str, settings: AISettings) -> Optional[Dict]:
 2. 造句要简单易懂，适合初学者
 3. 英文翻译要准确自然"""
 
+
+@single_flight('generate_word_content')
+def generate_word_content(word: str, settings: AISettings) -> Optional[Dict]:
+    """Generate word content (pinyin, translation, example sentence) using AI"""
     user_prompt = f"请为词语 \"{word}\" 生成学习内容。"
 
     try:
-        if settings.provider == 'kimi':
-            result = _call_kimi_api(system_prompt, user_prompt, settings)
-        elif settings.provider == 'openrouter':
-            result = _call_openrouter_api(system_prompt, user_prompt, settings)
-        else:
-            return None
-        
-        if result:
-            # Parse JSON from response
-            try:
-                # Try to extract JSON if wrapped in markdown
-                if '```json' in result:
-                    json_str = result.split('```json')[1].split('```')[0].strip()
-                elif '```' in result:
-                    json_str = result.split('```')[1].split('```')[0].strip()
-                else:
-                    json_str = result.strip()
-                
-                data = json.loads(json_str)
-                return {
-                    'pinyin': data.get('pinyin', ''),
-                    'english_translation': data.get('english_translation', ''),
-                    'example_sentence': data.get('example_sentence', ''),
-                    'example_pinyin': data.get('example_pinyin', ''),
-                    'example_translation': data.get('example_translation', '')
-                }
-            except json.JSONDecodeError as e:
-                print(f"Failed to parse JSON: {e}")
-                print(f"Raw response: {result}")
-                return None
-        
+        content, _ = _complete(WORD_SYSTEM_PROMPT, user_prompt, settings)
+    except Exception:
+        logger.exception("Word generation failed", extra={'word': word})
         return None
-    
-    except Exception as e:
-        print(f"Error generating word content: {e}")
+
+    data = _extract_json(content)
+    if data is None:
+        return None
+    return {
+        'pinyin': data.get('pinyin', ''),
+        'english_translation': data.get('english_translation', ''),
+        'example_sentence': data.get('example_sentence', ''),
+        'example_pinyin': data.get('example_pinyin', ''),
+        'example_translation': data.get('example_translation', '')
+    }
+
+
+WORD_DEFINITION_PROMPT = """你是一个中文词典专家。请为给定的词语生成详细的解释。
+请按照以下JSON格式返回：
+
+{
+    "pinyin": "拼音（带声调）",
+    "chinese_meaning": "中文详细解释",
+    "english_translation": "英文翻译"
+}
+
+要求：
+1. 拼音必须带声调
+2. 中文解释要详细、准确
+3. 英文翻译要地道"""
+
+
+@single_flight('generate_word_definition')
+def generate_word_definition(word: str, settings: AISettings) -> Optional[Dict]:
+    """Generate a dictionary entry (pinyin, Chinese meaning, English) for a saved word"""
+    try:
+        content, _ = _complete(WORD_DEFINITION_PROMPT, f"请解释词语：{word}", settings)
+    except Exception:
+        logger.exception("Word definition failed", extra={'word': word})
         return None
+    return _extract_json(content)
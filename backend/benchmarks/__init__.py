@@ -0,0 +1,11 @@
+"""
+Benchmark and load-test suite
+
+Run from backend/:
+
+    python -m benchmarks.db_bench      # database.py micro-benchmarks (SQLite / Postgres)
+    python -m benchmarks.load_test     # end-to-end HTTP load with a stubbed AI provider
+
+Both write a JSON result file and, given --baseline, exit non-zero when a
+measurement regresses past the tolerance.
+"""
@@ -0,0 +1,139 @@
+"""
+Shared helpers: database selection, latency statistics and baseline comparison
+"""
+import json
+import math
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+BASELINE_DIR = Path(__file__).parent / "baselines"
+
+# A result regresses when p50/p95 grow or throughput drops by more than this
+DEFAULT_TOLERANCE = 0.25
+# ...and the latency change is also larger than this (sub-millisecond noise)
+MIN_DELTA_MS = 0.2
+
+
+def use_sqlite(path: Path):
+    """Point db_manager at a SQLite file (call before importing database)"""
+    os.environ['DATABASE_TYPE'] = 'sqlite'
+    os.environ['SQLITE_PATH'] = str(path)
+
+
+def use_postgres(url: str):
+    """Point db_manager at a PostgreSQL URL (call before importing database)"""
+    os.environ['DATABASE_TYPE'] = 'postgresql'
+    os.environ['DATABASE_URL'] = url
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: List[float], elapsed: Optional[float] = None, errors: int = 0) -> Dict:
+    """Summarize per-call latencies (seconds) into ms percentiles and throughput"""
+    values = sorted(latencies)
+    total = elapsed if elapsed is not None else sum(values)
+    return {
+        'samples': len(values),
+        'errors': errors,
+        'ops_per_sec': round(len(values) / total, 2) if total > 0 else 0.0,
+        'mean_ms': round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+        'p50_ms': round(percentile(values, 50) * 1000, 3),
+        'p95_ms': round(percentile(values, 95) * 1000, 3),
+        'p99_ms': round(percentile(values, 99) * 1000, 3),
+    }
+
+
+def time_calls(fn, args_iter, min_seconds: float = 1.0, min_calls: int = 5, max_calls: int = 1000) -> List[float]:
+    """Call fn(*args) repeatedly and return per-call latencies in seconds"""
+    latencies = []
+    started = time.perf_counter()
+    for args in args_iter:
+        t0 = time.perf_counter()
+        fn(*args)
+        latencies.append(time.perf_counter() - t0)
+        count = len(latencies)
+        if count >= max_calls:
+            break
+        if count >= min_calls and time.perf_counter() - started >= min_seconds:
+            break
+    return latencies
+
+
+def write_results(path: Path, suite: str, results: Dict[str, Dict], config: Dict):
+    """Write results with enough environment detail to judge comparability"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    payload = {
+        'suite': suite,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'config': config,
+        'results': results,
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    print(f"📝 Results written to {path}")
+
+
+def compare(results: Dict[str, Dict], baseline_path: Path, tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    """Return human-readable regressions of results against a saved baseline"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)['results']
+
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        for metric in ('p50_ms', 'p95_ms'):
+            before, after = previous[metric], current[metric]
+            if after > before * (1 + tolerance) and after - before > MIN_DELTA_MS:
+                regressions.append(f"{name}: {metric} {before:.3f} -> {after:.3f}")
+        before, after = previous['ops_per_sec'], current['ops_per_sec']
+        if after < before * (1 - tolerance):
+            regressions.append(f"{name}: ops_per_sec {before:.1f} -> {after:.1f}")
+        if current.get('errors', 0) > previous.get('errors', 0):
+            regressions.append(f"{name}: errors {previous.get('errors', 0)} -> {current['errors']}")
+    return regressions
+
+
+def print_table(results: Dict[str, Dict]):
+    width = max((len(name) for name in results), default=10)
+    print(f"{'benchmark':<{width}}  {'ops/s':>10}  {'p50 ms':>9}  {'p95 ms':>9}  {'p99 ms':>9}  {'n':>6}")
+    for name, r in results.items():
+        print(f"{name:<{width}}  {r['ops_per_sec']:>10.1f}  {r['p50_ms']:>9.3f}  "
+              f"{r['p95_ms']:>9.3f}  {r['p99_ms']:>9.3f}  {r['samples']:>6}")
+
+
+def finish(results: Dict[str, Dict], suite: str, config: Dict, output: Path,
+           baseline: Optional[Path], save_baseline: bool, tolerance: float) -> int:
+    """Write results, optionally save/compare a baseline; return the exit code"""
+    print_table(results)
+    write_results(output, suite, results, config)
+    if save_baseline:
+        target = baseline or BASELINE_DIR / f"{suite}.json"
+        write_results(target, suite, results, config)
+        return 0
+    if baseline:
+        if not baseline.exists():
+            print(f"⚠️  Baseline {baseline} not found - run with --save-baseline first")
+            return 2
+        regressions = compare(results, baseline, tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) beyond {tolerance:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\n✅ No regressions beyond {tolerance:.0%} against {baseline}")
+    return 0
@@ -0,0 +1,219 @@
+"""
+End-to-end load test for the FastAPI app
+
+Serves main.app with uvicorn on a local port (SQLite, synthetic data), points
+the AI provider at an in-process stub that answers like an OpenAI-compatible
+chat endpoint after a fixed delay, and drives a weighted mix of API calls
+from concurrent clients. Reports throughput and p50/p95/p99 per scenario.
+
+Usage:
+    python -m benchmarks.load_test                              # 20s, 16 clients
+    python -m benchmarks.load_test --duration 60 --concurrency 32
+    python -m benchmarks.load_test --save-baseline              # write benchmarks/baselines/load.json
+    python -m benchmarks.load_test --baseline benchmarks/baselines/load.json
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import requests
+
+from benchmarks import common
+
+SEED = 42
+
+# (scenario, weight)
+SCENARIOS = [
+    ('character_detail', 35),
+    ('user_progress_update', 20),
+    ('user_stats', 15),
+    ('today_characters', 10),
+    ('ai_generate_content', 10),
+    ('word_lookup', 5),
+    ('all_words', 5),
+]
+
+STUB_CONTENT = {
+    "pinyin": "bǎ", "alt_pinyin": "", "radical": "扌", "stroke_count": 7,
+    "stroke_order": "一亅丿一乛丨乚", "illustration_desc": "一只手握住把手",
+    "rhyme_text": "提手旁，巴字边", "ancient_forms": {"oracle": "", "bronze": "", "seal": ""},
+    "etymology": "形声字", "word_groups": {"常用": ["把手", "一把"]},
+    "famous_quotes": [], "character_structure": {"type": "左右结构"}, "meaning": "握住",
+}
+
+
+class StubProviderHandler(BaseHTTPRequestHandler):
+    """OpenAI-compatible /chat/completions stand-in with fixed latency"""
+    delay = 0.05
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.delay)
+        body = json.dumps({
+            "choices": [{"message": {"role": "assistant", "content": json.dumps(STUB_CONTENT, ensure_ascii=False)}}],
+            "usage": {"prompt_tokens": 120, "completion_tokens": 80, "total_tokens": 200},
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_stub_provider(delay: float) -> str:
+    StubProviderHandler.delay = delay
+    server = ThreadingHTTPServer(('127.0.0.1', _free_port()), StubProviderHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/v1/chat/completions"
+
+
+def start_api_server():
+    """Run main.app under uvicorn in a background thread; return (base_url, server)"""
+    import uvicorn
+    import main
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host='127.0.0.1', port=port, log_level='warning'))
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.time() + 30
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError("API server did not start")
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}", server
+
+
+def make_request(session: requests.Session, base: str, scenario: str, data: Dict, rng: random.Random):
+    if scenario == 'character_detail':
+        return session.get(f"{base}/api/characters/{rng.choice(data['characters'])}")
+    if scenario == 'user_progress_update':
+        return session.post(f"{base}/api/users/{rng.choice(data['user_ids'])}/progress", json={
+            'character_id': rng.choice(data['character_ids']),
+            'is_learned': rng.random() < 0.5,
+            'proficiency': rng.randint(0, 100),
+        })
+    if scenario == 'user_stats':
+        return session.get(f"{base}/api/users/{rng.choice(data['user_ids'])}/stats")
+    if scenario == 'today_characters':
+        return session.get(f"{base}/api/characters/today")
+    if scenario == 'ai_generate_content':
+        return session.post(f"{base}/api/ai/generate-content", json={
+            'character': rng.choice(data['characters']),
+            'provider': 'kimi', 'api_key': 'bench-stub', 'model': 'stub',
+        })
+    if scenario == 'word_lookup':
+        return session.get(f"{base}/api/word/{rng.choice(data['characters'])}子")
+    if scenario == 'all_words':
+        return session.get(f"{base}/api/words")
+    raise ValueError(scenario)
+
+
+def run_load(base: str, data: Dict, concurrency: int, duration: float, warmup: float) -> Tuple[Dict, float]:
+    """Closed-loop clients: each sends its next request as soon as the last returns"""
+    names = [name for name, _ in SCENARIOS]
+    weights = [weight for _, weight in SCENARIOS]
+    samples: Dict[str, List[float]] = {name: [] for name in names}
+    errors: Dict[str, int] = {name: 0 for name in names}
+    lock = threading.Lock()
+    start_at = time.perf_counter() + warmup
+    stop_at = start_at + duration
+
+    def client(index: int):
+        rng = random.Random(SEED + index)
+        session = requests.Session()
+        while True:
+            now = time.perf_counter()
+            if now >= stop_at:
+                break
+            scenario = rng.choices(names, weights)[0]
+            t0 = time.perf_counter()
+            try:
+                ok = make_request(session, base, scenario, data, rng).status_code < 500
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - t0
+            if t0 >= start_at:
+                with lock:
+                    samples[scenario].append(elapsed)
+                    if not ok:
+                        errors[scenario] += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    results = {f"load/{name}": common.summarize(samples[name], duration, errors[name]) for name in names}
+    results['load/overall'] = common.summarize([v for name in names for v in samples[name]], duration,
+                                               sum(errors.values()))
+    return results, duration
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end API load test with a stubbed AI provider")
+    parser.add_argument('--duration', type=float, default=20.0, help="measured seconds")
+    parser.add_argument('--warmup', type=float, default=3.0, help="unmeasured seconds before measuring")
+    parser.add_argument('--concurrency', type=int, default=16, help="concurrent clients")
+    parser.add_argument('--scale', type=int, default=1000, help="synthetic characters/progress rows")
+    parser.add_argument('--ai-latency-ms', type=float, default=50.0, help="stub provider response delay")
+    parser.add_argument('--output', type=Path, default=Path(tempfile.gettempdir()) / "chineseflow_load_test.json")
+    parser.add_argument('--baseline', type=Path, default=None, help="compare against (or save to) this file")
+    parser.add_argument('--save-baseline', action='store_true', help="store this run as the baseline")
+    parser.add_argument('--tolerance', type=float, default=common.DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    # Before main/database are imported: private SQLite file, quiet request logging
+    workdir = Path(tempfile.mkdtemp(prefix="chineseflow_load_"))
+    common.use_sqlite(workdir / "load.db")
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ['AI_RATE_LIMIT_STORE'] = str(workdir / "rate_limits.db")
+
+    from benchmarks import synthetic
+    import ai_service
+    import database
+    from db_manager import get_db
+
+    database.init_db()
+    conn = get_db()
+    data = synthetic.populate(conn, characters=args.scale, progress_rows=args.scale, seed=SEED)
+    conn.close()
+
+    ai_service.PROVIDER_ENDPOINTS['kimi']['url'] = start_stub_provider(args.ai_latency_ms / 1000)
+    # The stub has no rate limit to respect
+    ai_service.PROVIDER_ENDPOINTS['kimi']['rate_limit'] = None
+    base, server = start_api_server()
+    print(f"▶ {args.concurrency} clients for {args.duration:.0f}s against {base} "
+          f"(scale {args.scale:,}, stub AI {args.ai_latency_ms:.0f} ms)")
+
+    results, _ = run_load(base, data, args.concurrency, args.duration, args.warmup)
+    server.should_exit = True
+
+    config = {
+        'duration': args.duration, 'concurrency': args.concurrency, 'scale': args.scale,
+        'ai_latency_ms': args.ai_latency_ms, 'scenarios': dict(SCENARIOS), 'seed': SEED,
+    }
+    return common.finish(results, 'load', config, args.output, args.baseline, args.save_baseline, args.tolerance)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+Response serialization benchmark on the /api/words payload
+
+Serves the same 10k-word payload (the shape get_all_words returns) through
+the response paths a route can take and times full requests with the
+TestClient, so routing, encoding and the HTTP round trip are all included:
+
+    default         plain return, FastAPI's stock JSONResponse (jsonable_encoder + json.dumps)
+    response_model  plain return with a Pydantic response_model (re-validation first)
+    fast            FastJSONResponse returned directly (orjson, no validation)
+
+No database is involved - the payload is generated in memory.
+
+Usage:
+    python -m benchmarks.serialization_bench
+    python -m benchmarks.serialization_bench --words 50000
+    python -m benchmarks.serialization_bench --save-baseline
+"""
+import argparse
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Optional
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+import serialization
+from benchmarks import common
+from serialization import FastJSONResponse
+
+DEFAULT_WORDS = 10000
+SEED = 42
+
+
+class WordModel(BaseModel):
+    id: int
+    word: str
+    pinyin: Optional[str] = None
+    chinese_meaning: Optional[str] = None
+    english_translation: Optional[str] = None
+    character_id: Optional[int] = None
+    related_character: Optional[str] = None
+    display: Optional[bool] = None
+    is_ai_generated: Optional[bool] = None
+    created_at: Optional[datetime] = None
+
+
+def make_words(count: int, seed: int = SEED) -> List[dict]:
+    """get_all_words-shaped rows with Chinese text and PostgreSQL-style datetimes"""
+    rng = random.Random(seed)
+    base = datetime(2026, 1, 1)
+    words = []
+    for i in range(count):
+        chars = ''.join(chr(0x4e00 + rng.randrange(0x5000)) for _ in range(rng.randint(2, 4)))
+        words.append({
+            'id': i + 1,
+            'word': chars,
+            'pinyin': ' '.join(rng.choice(['bǎ', 'shǒu', 'wò', 'lǜ', 'zhuā']) for _ in chars),
+            'chinese_meaning': chars * 6,
+            'english_translation': f"synthetic translation number {i}",
+            'character_id': rng.randrange(1, 3500),
+            'related_character': chars[0],
+            'display': bool(i % 2),
+            'is_ai_generated': bool(i % 3 == 0),
+            'created_at': base + timedelta(seconds=i),
+        })
+    return words
+
+
+def build_app(words: List[dict]) -> FastAPI:
+    app = FastAPI(default_response_class=JSONResponse)
+
+    @app.get("/default")
+    def default():
+        return words
+
+    @app.get("/response_model", response_model=List[WordModel])
+    def response_model():
+        return words
+
+    @app.get("/fast")
+    def fast():
+        return FastJSONResponse(words)
+
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Response serialization benchmark")
+    parser.add_argument('--words', type=int, default=DEFAULT_WORDS, help="payload size (default: 10000)")
+    parser.add_argument('--min-seconds', type=float, default=2.0, help="minimum timing window per path")
+    parser.add_argument('--output', type=Path,
+                        default=Path(tempfile.gettempdir()) / "chineseflow_serialization_bench.json")
+    parser.add_argument('--baseline', type=Path, default=None, help="compare against (or save to) this file")
+    parser.add_argument('--save-baseline', action='store_true', help="store this run as the baseline")
+    parser.add_argument('--tolerance', type=float, default=common.DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    words = make_words(args.words)
+    client = TestClient(build_app(words))
+
+    paths = ['default', 'response_model', 'fast']
+
+    results, sizes = {}, {}
+    for path in paths:
+        response = client.get(f"/{path}")  # warm-up, and check every path returns the same rows
+        assert response.status_code == 200 and len(response.json()) == len(words), path
+        sizes[path] = len(response.content)
+
+        latencies = common.time_calls(lambda: client.get(f"/{path}"), iter(lambda: (), None),
+                                      min_seconds=args.min_seconds, min_calls=10)
+        results[f"words_{args.words}/{path}"] = common.summarize(latencies)
+
+    config = {
+        'words': args.words,
+        'seed': SEED,
+        'orjson': serialization.ORJSON_AVAILABLE,
+        'payload_bytes': sizes,
+    }
+    return common.finish(results, 'serialization', config, args.output,
+                         args.baseline, args.save_baseline, args.tolerance)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
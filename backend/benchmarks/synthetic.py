@@ -0,0 +1,106 @@
+"""
+Deterministic synthetic data for benchmarks
+
+Fills the characters, words, users and user_character_progress tables with
+realistic-looking rows at a given scale using multi-row INSERTs, so setup
+stays fast even at 100k rows on either dialect.
+"""
+import json
+import random
+from typing import Dict, List
+
+# Multi-row INSERT chunk, kept under SQLite's bound-parameter limit
+MAX_PARAMS = 900
+
+# Progress rows per synthetic user
+ROWS_PER_USER = 1000
+
+CJK_START = 0x4E00
+CJK_COUNT = 0x9FA5 - 0x4E00 + 1
+
+
+def synthetic_character(i: int) -> str:
+    """Unique character text: real CJK code points first, suffixed once they run out"""
+    ch = chr(CJK_START + i % CJK_COUNT)
+    return ch if i < CJK_COUNT else f"{ch}{i // CJK_COUNT}"
+
+
+def _bulk_insert(cursor, table: str, columns: List[str], rows: List[tuple]):
+    """INSERT rows in multi-row VALUES chunks (same SQL on SQLite and PostgreSQL)"""
+    per_row = "(" + ", ".join("?" * len(columns)) + ")"
+    chunk = max(1, MAX_PARAMS // len(columns))
+    for start in range(0, len(rows), chunk):
+        batch = rows[start:start + chunk]
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES " + ", ".join([per_row] * len(batch))
+        cursor.execute(sql, [value for row in batch for value in row])
+
+
+def reset(conn):
+    """Empty the benchmark tables (PostgreSQL; SQLite runs use a fresh file)"""
+    cursor = conn.cursor()
+    cursor.execute("TRUNCATE characters, words, users, user_character_progress RESTART IDENTITY CASCADE")
+    conn.commit()
+
+
+def populate(conn, characters: int, progress_rows: int, seed: int = 42) -> Dict[str, List]:
+    """Insert `characters` characters (plus one word each) and `progress_rows` progress rows"""
+    rng = random.Random(seed)
+    cursor = conn.cursor()
+
+    char_rows = []
+    for i in range(characters):
+        char = synthetic_character(i)
+        char_rows.append((
+            char, f"pīn{i % 400}", "", "口", 1 + i % 24, "一丨丿丶乛" * 2,
+            f"插图描述 {char}", f"/images/characters/{char}.png", f"{char}字歌，好好学。",
+            json.dumps({"oracle": f"甲骨文{char}", "bronze": f"金文{char}", "seal": f"篆书{char}"}, ensure_ascii=False),
+            f"{char}的字源说明。" * 3,
+            json.dumps({"常用": [f"{char}子", f"{char}们", f"大{char}"]}, ensure_ascii=False),
+            json.dumps([{"text": f"{char}之名句", "source": "古诗"}], ensure_ascii=False),
+            json.dumps({"type": "单一结构", "components": [char]}, ensure_ascii=False),
+            f"{char}的意思",
+        ))
+    _bulk_insert(cursor, "characters", [
+        "character", "pinyin", "alt_pinyin", "radical", "stroke_count", "stroke_order",
+        "illustration_desc", "illustration_image", "rhyme_text", "ancient_forms", "etymology",
+        "word_groups", "famous_quotes", "character_structure", "meaning",
+    ], char_rows)
+
+    cursor.execute("SELECT id, character FROM characters ORDER BY id")
+    id_rows = cursor.fetchall()
+    character_ids = [row['id'] for row in id_rows]
+    character_texts = [row['character'] for row in id_rows]
+
+    word_rows = [
+        (f"{char}子", f"pīn{n % 400} zi", f"{char}的词", f"word {n}", char_id, n % 2 == 0, False)
+        for n, (char_id, char) in enumerate(zip(character_ids, character_texts))
+    ]
+    _bulk_insert(cursor, "words", [
+        "word", "pinyin", "chinese_meaning", "english_translation", "character_id", "display", "is_ai_generated",
+    ], word_rows)
+
+    user_count = max(1, -(-progress_rows // ROWS_PER_USER))
+    _bulk_insert(cursor, "users", ["username", "display_name"],
+                 [(f"bench_{u}", f"Bench User {u}") for u in range(user_count)])
+    cursor.execute("SELECT id FROM users WHERE username LIKE 'bench_%' ORDER BY id")
+    user_ids = [row['id'] for row in cursor.fetchall()]
+
+    progress = []
+    per_user = min(ROWS_PER_USER, len(character_ids))
+    for user_id in user_ids:
+        for char_id in rng.sample(character_ids, per_user):
+            if len(progress) >= progress_rows:
+                break
+            learned = rng.random() < 0.6
+            progress.append((user_id, char_id, learned, rng.randint(0, 100), rng.randint(0, 20),
+                             f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"))
+    _bulk_insert(cursor, "user_character_progress", [
+        "user_id", "character_id", "is_learned", "proficiency", "review_count", "learned_date",
+    ], progress)
+
+    conn.commit()
+    return {
+        'character_ids': character_ids,
+        'characters': character_texts,
+        'user_ids': user_ids,
+    }
@@ -0,0 +1,75 @@
+"""
+Parsing helpers for the JSON fields of a character card
+
+word_groups entries are free text written for print, e.g.
+
+    {"ba3": ["bǎ 把握", "把守", ...], "ba4": ["bà 刀把子", "话把儿(被人作为谈笑资料的言论或行为)"]}
+
+The first entry of a reading may be prefixed with its pinyin and any entry
+may carry a parenthesised note; only the Chinese word itself is wanted when
+indexing.
+"""
+import json
+import re
+from typing import Any, Dict, List, Tuple
+
+# CJK Unified Ideographs (+ Extension A) and compatibility ideographs
+HAN_RANGES = r'\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+
+_HAN_RE = re.compile(rf'[{HAN_RANGES}]')
+_NOTE_RE = re.compile(r'[(（][^)）]*[)）]')
+_SEPARATOR_RE = re.compile(r'[\s,，、;；/]+')
+
+
+def parse_json(val, default):
+    """Parse a JSON column (PostgreSQL returns dict/list, SQLite returns string)"""
+    if val is None:
+        return default
+    if isinstance(val, str):
+        return json.loads(val or json.dumps(default))
+    return val
+
+
+def han_characters(text: str) -> List[str]:
+    """The Chinese characters of text, in order"""
+    return _HAN_RE.findall(text or '')
+
+
+def entry_words(entry: str) -> List[str]:
+    """Words in one word_groups entry: "bǎ 把握" -> ["把握"], "话把儿(注释)" -> ["话把儿"]"""
+    words = []
+    for piece in _SEPARATOR_RE.split(_NOTE_RE.sub(' ', entry or '')):
+        word = ''.join(han_characters(piece))
+        if word:
+            words.append(word)
+    return words
+
+
+def word_group_words(word_groups: Any) -> List[Tuple[str, int, str]]:
+    """[(tone_key, position, word)] from a word_groups value, in card order"""
+    groups = parse_json(word_groups, {})
+    if not isinstance(groups, dict):
+        return []
+    words = []
+    for tone_key, entries in groups.items():
+        if isinstance(entries, str):
+            entries = [entries]
+        position = 0
+        for entry in entries or []:
+            for word in entry_words(entry if isinstance(entry, str) else ''):
+                words.append((tone_key, position, word))
+                position += 1
+    return words
+
+
+def structure_links(character_structure: Any) -> Dict[str, Any]:
+    """{'base_char': str or None, 'related': [chars]} from a character_structure value"""
+    structure = parse_json(character_structure, {})
+    if not isinstance(structure, dict):
+        return {'base_char': None, 'related': []}
+    related = []
+    for item in structure.get('related') or []:
+        char = item.get('char') if isinstance(item, dict) else item
+        if isinstance(char, str) and han_characters(char):
+            related.append(han_characters(char)[0])
+    return {'base_char': structure.get('base_char') or None, 'related': related}
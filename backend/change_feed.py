@@ -0,0 +1,180 @@
+"""
+Live change feed for connected clients
+
+database.py publishes an event after every committed write to a card, a word
+or a user's progress. Clients subscribe to topics over SSE
+(/api/changes/stream) or a WebSocket (/api/changes/ws):
+
+    content          every card and word change
+    character:<id>   one card and its words
+    progress:<id>    one user's progress
+
+Events are small ({"type": "character", "id": 12, "action": "upsert"}) -
+clients refetch what they show, or pull /api/bundle/delta.
+
+Each subscriber keeps pending events keyed by (type, id), so a burst of
+writes to one row is delivered once, and flushes them at most every
+COALESCE_SECONDS as one batch. A subscriber that falls more than MAX_PENDING
+rows behind (slow network, stalled tab) gets a single "resync" event instead
+of an ever-growing queue. Publishing never blocks the writer.
+
+The feed is per process: run one worker, or have clients also sync through
+/api/bundle/delta.
+"""
+import asyncio
+import logging
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+TOPIC_RE = re.compile(r'^(content|character:\d+|progress:\d+)$')
+
+# Batching window for bursts of writes
+COALESCE_SECONDS = 0.25
+# Distinct pending rows before a subscriber is told to resync instead
+MAX_PENDING = 500
+MAX_TOPICS = 50
+MAX_SUBSCRIBERS = 1000
+# Idle connections get a keep-alive this often
+HEARTBEAT_SECONDS = 15
+# A WebSocket client that takes longer than this to accept a batch is dropped
+SEND_TIMEOUT_SECONDS = 10
+
+SUBSCRIBERS = metrics.gauge("change_feed_subscribers", "Connected change feed subscribers")
+EVENTS_DELIVERED = metrics.counter("change_feed_events_total", "Change feed events by outcome",
+                                   ["outcome"])
+
+
+class TooManySubscribers(Exception):
+    """The feed is at MAX_SUBSCRIBERS"""
+
+
+def parse_topics(topics: Iterable[str]) -> Set[str]:
+    """Validated topic set; raises ValueError for unknown topics"""
+    parsed = {topic.strip() for topic in topics if topic and topic.strip()}
+    invalid = sorted(topic for topic in parsed if not TOPIC_RE.match(topic))
+    if invalid:
+        raise ValueError(f"Unknown topics: {', '.join(invalid)} "
+                         f"(use content, character:<id> or progress:<user_id>)")
+    if len(parsed) > MAX_TOPICS:
+        raise ValueError(f"At most {MAX_TOPICS} topics per connection")
+    return parsed
+
+
+class Subscription:
+    """One connected client: its topics and the events not yet sent to it"""
+
+    def __init__(self, topics: Set[str], loop: asyncio.AbstractEventLoop):
+        self.topics = set(topics)
+        self._loop = loop
+        self._lock = threading.Lock()
+        self._pending: "OrderedDict[tuple, Dict]" = OrderedDict()
+        self._overflowed = False
+        self._ready = asyncio.Event()
+
+    def offer(self, key: tuple, event: Dict):
+        """Queue an event (any thread); a newer event for the same row replaces the older one"""
+        with self._lock:
+            if self._overflowed:
+                EVENTS_DELIVERED.inc(outcome='dropped')
+                return
+            if key in self._pending:
+                self._pending.move_to_end(key)
+                EVENTS_DELIVERED.inc(outcome='coalesced')
+            self._pending[key] = event
+            if len(self._pending) > MAX_PENDING:
+                self._pending.clear()
+                self._overflowed = True
+                EVENTS_DELIVERED.inc(outcome='overflow')
+        self._loop.call_soon_threadsafe(self._ready.set)
+
+    async def next_batch(self, timeout: float = HEARTBEAT_SECONDS) -> Optional[List[Dict]]:
+        """The next batch of events, [{"type": "resync"}] after an overflow, or None on timeout"""
+        while True:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+            # Let the rest of a burst arrive and coalesce
+            await asyncio.sleep(COALESCE_SECONDS)
+            with self._lock:
+                self._ready.clear()
+                if self._overflowed:
+                    self._overflowed = False
+                    return [{'type': 'resync'}]
+                batch = list(self._pending.values())
+                self._pending.clear()
+            # Empty when a wake-up arrived for events already sent in the last batch
+            if batch:
+                EVENTS_DELIVERED.inc(len(batch), outcome='sent')
+                return batch
+
+
+class ChangeFeed:
+    """Topic fan-out to subscriptions"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions: List[Subscription] = []
+
+    def subscribe(self, topics: Set[str]) -> Subscription:
+        """Register a subscriber on the running event loop"""
+        with self._lock:
+            if len(self._subscriptions) >= MAX_SUBSCRIBERS:
+                raise TooManySubscribers(f"Change feed is at its limit of {MAX_SUBSCRIBERS} subscribers")
+            subscription = Subscription(topics, asyncio.get_running_loop())
+            self._subscriptions.append(subscription)
+        SUBSCRIBERS.inc()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+                SUBSCRIBERS.dec()
+
+    def publish(self, topics: Iterable[str], key: tuple, event: Dict):
+        """Deliver event to every subscriber of any of topics (never blocks on subscribers)"""
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        if not subscriptions:
+            return
+        topics = set(topics)
+        for subscription in subscriptions:
+            if subscription.topics & topics:
+                try:
+                    subscription.offer(key, event)
+                except RuntimeError:
+                    # Its event loop has shut down
+                    self.unsubscribe(subscription)
+
+
+feed = ChangeFeed()
+
+
+def content_changed(entity: str, entity_id: int, action: str, character_id: Optional[int] = None):
+    """A card ('character') or word was upserted or deleted"""
+    topics = ['content']
+    card_id = entity_id if entity == 'character' else character_id
+    if card_id is not None:
+        topics.append(f'character:{card_id}')
+    event = {'type': entity, 'id': entity_id, 'action': action}
+    if entity == 'word':
+        event['character_id'] = character_id
+    feed.publish(topics, (entity, entity_id), event)
+
+
+def progress_changed(user_id: int, character_id: int, is_learned: bool, proficiency: Optional[int]):
+    """A user's progress on one card changed"""
+    feed.publish([f'progress:{user_id}'], ('progress', user_id, character_id), {
+        'type': 'progress',
+        'user_id': user_id,
+        'character_id': character_id,
+        'is_learned': is_learned,
+        'proficiency': proficiency,
+    })
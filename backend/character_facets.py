@@ -0,0 +1,230 @@
+"""
+Faceted browsing of character cards by radical, stroke count, tone and pinyin
+
+character_facets holds one row per character with the normalised facet
+values (toneless and tone-numbered pinyin, tone, radical, stroke count).
+database.py refreshes a character's row in the same transaction as every
+write to it.
+
+browse() answers a filtered, paginated page plus the counts for every facet
+in a single UNION ALL query. Facet counts are "disjunctive": the radical
+counts apply every filter except the radical one, so the UI can show how
+many characters each alternative radical would give.
+
+Usage:
+    python character_facets.py --rebuild
+"""
+import argparse
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import pinyin_utils
+from db_manager import get_db
+
+logger = logging.getLogger(__name__)
+
+FACETS = ('radical', 'stroke_count', 'tone')
+
+SORTS = {
+    'stroke_count': "f.stroke_count, f.pinyin_numbered, f.character_id",
+    'pinyin': "f.pinyin_numbered, f.stroke_count, f.character_id",
+    'radical': "f.radical, f.stroke_count, f.character_id",
+    'recent': "f.character_id DESC",
+}
+
+MAX_PAGE_SIZE = 200
+
+
+def facet_values(row) -> Tuple:
+    """(radical, stroke_count, pinyin_toneless, pinyin_numbered, tone) for a characters row"""
+    pinyin = row['pinyin'] or ''
+    return (
+        row['radical'] or None,
+        row['stroke_count'] or None,
+        pinyin_utils.toneless(pinyin),
+        pinyin_utils.numbered(pinyin),
+        pinyin_utils.tone(pinyin) or None,
+    )
+
+
+def index_character(cursor, character_id: int):
+    """Refresh one character's facet row (removes it when the character is gone)"""
+    cursor.execute("SELECT radical, stroke_count, pinyin FROM characters WHERE id = ?", (character_id,))
+    row = cursor.fetchone()
+    if row is None:
+        cursor.execute("DELETE FROM character_facets WHERE character_id = ?", (character_id,))
+        return
+    cursor.execute("""
+        INSERT INTO character_facets
+        (character_id, radical, stroke_count, pinyin_toneless, pinyin_numbered, tone)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (character_id) DO UPDATE SET
+            radical = excluded.radical,
+            stroke_count = excluded.stroke_count,
+            pinyin_toneless = excluded.pinyin_toneless,
+            pinyin_numbered = excluded.pinyin_numbered,
+            tone = excluded.tone
+    """, (character_id, *facet_values(row)))
+
+
+def rebuild() -> int:
+    """Recompute every facet row (one transaction)"""
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DELETE FROM character_facets")
+        cursor.execute("SELECT id, radical, stroke_count, pinyin FROM characters")
+        rows = [(row['id'], *facet_values(row)) for row in cursor.fetchall()]
+        if rows:
+            cursor.executemany("""
+                INSERT INTO character_facets
+                (character_id, radical, stroke_count, pinyin_toneless, pinyin_numbered, tone)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, rows)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    logger.info("Character facets rebuilt", extra={'characters': len(rows)})
+    return len(rows)
+
+
+def ensure_index():
+    """Build the facet rows once for databases that predate them"""
+    conn = get_db(readonly=True)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT (SELECT COUNT(*) FROM characters) AS characters,
+               (SELECT COUNT(*) FROM character_facets) AS facets
+    """)
+    row = cursor.fetchone()
+    conn.close()
+
+    if row['characters'] != row['facets']:
+        rebuild()
+
+
+def _filters(radical: Optional[str], stroke_count: Optional[int], tone: Optional[int],
+             pinyin: Optional[str]) -> Dict[str, Tuple[str, List[Any]]]:
+    """Facet name -> (SQL condition, params); 'pinyin' narrows every facet"""
+    filters = {}
+    if radical:
+        filters['radical'] = ("f.radical = ?", [radical])
+    if stroke_count:
+        filters['stroke_count'] = ("f.stroke_count = ?", [stroke_count])
+    if tone:
+        filters['tone'] = ("f.tone = ?", [tone])
+    if pinyin:
+        # "ba" matches ba1..ba5 and bai/ban/...; "ba3" only third-tone readings
+        has_tone = any(ch.isdigit() for ch in pinyin)
+        value = pinyin_utils.numbered(pinyin) if has_tone else pinyin_utils.toneless(pinyin)
+        column = 'f.pinyin_numbered' if has_tone else 'f.pinyin_toneless'
+        escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        filters['pinyin'] = (f"{column} LIKE ? ESCAPE '\\'", [escaped + '%'])
+    return filters
+
+
+def _where(filters: Dict[str, Tuple[str, List[Any]]], skip: Optional[str] = None) -> Tuple[str, List[Any]]:
+    clauses, params = [], []
+    for name, (clause, values) in filters.items():
+        if name != skip:
+            clauses.append(clause)
+            params.extend(values)
+    return (f"WHERE {' AND '.join(clauses)}" if clauses else ""), params
+
+
+def browse(radical: Optional[str] = None, stroke_count: Optional[int] = None,
+           tone: Optional[int] = None, pinyin: Optional[str] = None,
+           page: int = 1, page_size: int = 50, sort: str = 'stroke_count') -> Dict:
+    """One page of characters matching the filters, with the total and per-facet counts"""
+    if sort not in SORTS:
+        raise ValueError(f"Unknown sort: {sort}")
+    page = max(page, 1)
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    filters = _filters(radical, stroke_count, tone, pinyin)
+
+    # Rows: ('item', position, id, ...) for the page, ('total', ...), then (facet, value, count)
+    parts, params = [], []
+    where, where_params = _where(filters)
+    parts.append(f"""
+        SELECT * FROM (
+            SELECT 'item' AS facet, NULL AS value,
+                   ROW_NUMBER() OVER (ORDER BY {SORTS[sort]}) AS n,
+                   c.id AS character_id, c.character, c.pinyin,
+                   f.radical, f.stroke_count, f.pinyin_numbered
+            FROM character_facets f
+            JOIN characters c ON c.id = f.character_id
+            {where}
+            ORDER BY {SORTS[sort]}
+            LIMIT ? OFFSET ?
+        ) AS page_items
+    """)
+    params += where_params + [page_size, (page - 1) * page_size]
+
+    parts.append(f"""
+        SELECT 'total', NULL, COUNT(*), NULL, NULL, NULL, NULL, NULL, NULL
+        FROM character_facets f {where}
+    """)
+    params += where_params
+
+    for facet in FACETS:
+        facet_where, facet_params = _where(filters, skip=facet)
+        parts.append(f"""
+            SELECT '{facet}', CAST(f.{facet} AS TEXT), COUNT(*), NULL, NULL, NULL, NULL, NULL, NULL
+            FROM character_facets f {facet_where}
+            GROUP BY f.{facet}
+        """)
+        params += facet_params
+
+    conn = get_db(readonly=True)
+    cursor = conn.cursor()
+    cursor.execute(" UNION ALL ".join(parts), params)
+    rows = cursor.fetchall()
+    conn.close()
+
+    items, total = [], 0
+    facets: Dict[str, List[Dict]] = {facet: [] for facet in FACETS}
+    for row in rows:
+        if row['facet'] == 'item':
+            items.append((row['n'], {
+                'id': row['character_id'],
+                'character': row['character'],
+                'pinyin': row['pinyin'],
+                'pinyin_numbered': row['pinyin_numbered'],
+                'radical': row['radical'],
+                'stroke_count': row['stroke_count'],
+            }))
+        elif row['facet'] == 'total':
+            total = row['n']
+        elif row['value'] is not None:
+            value = row['value'] if row['facet'] == 'radical' else int(row['value'])
+            facets[row['facet']].append({'value': value, 'count': row['n']})
+
+    for facet, counts in facets.items():
+        counts.sort(key=lambda entry: entry['value'] if facet != 'radical' else -entry['count'])
+
+    return {
+        'total': total,
+        'page': page,
+        'page_size': page_size,
+        'items': [item for _, item in sorted(items, key=lambda pair: pair[0])],
+        'facets': facets,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Character facet index")
+    parser.add_argument("--rebuild", action="store_true", help="recompute every facet row")
+    args = parser.parse_args(argv)
+
+    if args.rebuild:
+        print(f"Indexed facets for {rebuild()} characters")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
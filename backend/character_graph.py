@@ -0,0 +1,240 @@
+"""
+Character relationship graph
+
+character_edges is an adjacency list built from each card:
+
+- component: the card is built on character_structure.base_char
+- derived:   characters listed in character_structure.related are built on the card
+- radical:   the card's radical (cards sharing it are siblings)
+- word:      other characters appearing in the card's word_groups (weight = number of words)
+
+Edges are keyed by the source card and refreshed in the same transaction as
+every write to it. Traversal follows edges both ways (an incoming "derived"
+edge reads as "component" from the other side), so related() answers
+"which cards share this component" with indexed lookups, one query per
+depth level.
+
+Usage:
+    python character_graph.py --rebuild
+    python character_graph.py 把 --depth 2
+"""
+import argparse
+import logging
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from card_fields import han_characters, structure_links, word_group_words
+from db_manager import get_db
+
+logger = logging.getLogger(__name__)
+
+# When a character is reached several ways, report the strongest relation
+_PRIORITY = {'component': 0, 'derived': 1, 'word': 2, 'radical': 3}
+
+MAX_DEPTH = 3
+MAX_RESULTS = 200
+
+# Rows fetched per direction and level, relative to the result limit
+FANOUT_FACTOR = 4
+
+
+def card_edges(row) -> List[Tuple[str, str, int]]:
+    """[(target, relation, weight)] for one characters row"""
+    char = row['character']
+    edges = {}
+
+    links = structure_links(row['character_structure'])
+    if links['base_char'] and links['base_char'] != char:
+        edges[(links['base_char'], 'component')] = 1
+    for related in links['related']:
+        if related != char:
+            edges[(related, 'derived')] = 1
+
+    if row['radical'] and row['radical'] != char:
+        edges[(row['radical'], 'radical')] = 1
+
+    co_occurring = Counter()
+    for _, _, word in word_group_words(row['word_groups']):
+        co_occurring.update(set(han_characters(word)) - {char})
+    for other, count in co_occurring.items():
+        edges[(other, 'word')] = count
+
+    return [(target, relation, weight) for (target, relation), weight in edges.items()]
+
+
+def index_character(cursor, character_id: int):
+    """Replace one card's outgoing edges (drops them when the card is gone)"""
+    cursor.execute("DELETE FROM character_edges WHERE source_id = ?", (character_id,))
+    cursor.execute("""
+        SELECT character, radical, character_structure, word_groups
+        FROM characters WHERE id = ?
+    """, (character_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return
+    edges = [(character_id, row['character'], target, relation, weight)
+             for target, relation, weight in card_edges(row)]
+    if edges:
+        cursor.executemany("""
+            INSERT INTO character_edges (source_id, source, target, relation, weight)
+            VALUES (?, ?, ?, ?, ?)
+        """, edges)
+
+
+def rebuild() -> int:
+    """Recompute every edge (one transaction); returns the number of edges"""
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DELETE FROM character_edges")
+        cursor.execute("SELECT id, character, radical, character_structure, word_groups FROM characters")
+        edges = [(row['id'], row['character'], target, relation, weight)
+                 for row in cursor.fetchall()
+                 for target, relation, weight in card_edges(row)]
+        if edges:
+            cursor.executemany("""
+                INSERT INTO character_edges (source_id, source, target, relation, weight)
+                VALUES (?, ?, ?, ?, ?)
+            """, edges)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    logger.info("Character graph rebuilt", extra={'edges': len(edges)})
+    return len(edges)
+
+
+def ensure_index():
+    """Build the graph once for databases that predate it"""
+    conn = get_db(readonly=True)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT EXISTS (SELECT 1 FROM character_edges) AS indexed,
+               EXISTS (SELECT 1 FROM characters) AS has_characters
+    """)
+    row = cursor.fetchone()
+    conn.close()
+
+    if row['has_characters'] and not row['indexed']:
+        rebuild()
+
+
+def _neighbours(cursor, frontier: List[str], fanout: int):
+    """Rows (origin, neighbour, relation, weight) one hop from frontier, both directions
+
+    Each direction is capped at fanout rows, strongest first: common characters
+    have thousands of incoming word edges.
+    """
+    marks = ', '.join('?' * len(frontier))
+    cursor.execute(f"""
+        SELECT * FROM (
+            SELECT e.source AS origin, e.target AS neighbour, e.relation, e.weight
+            FROM character_edges e
+            WHERE e.source IN ({marks}) AND e.relation <> 'radical'
+            ORDER BY e.weight DESC
+            LIMIT ?
+        ) AS outgoing
+        UNION ALL
+        SELECT * FROM (
+            SELECT e.target, e.source,
+                   CASE e.relation WHEN 'component' THEN 'derived' WHEN 'derived' THEN 'component'
+                                   ELSE e.relation END,
+                   e.weight
+            FROM character_edges e
+            WHERE e.target IN ({marks}) AND e.relation <> 'radical'
+            ORDER BY e.weight DESC
+            LIMIT ?
+        ) AS incoming
+        UNION ALL
+        SELECT * FROM (
+            SELECT mine.source, sibling.source, 'radical', 1
+            FROM character_edges mine
+            JOIN character_edges sibling
+              ON sibling.target = mine.target AND sibling.relation = 'radical'
+             AND sibling.source <> mine.source
+            WHERE mine.source IN ({marks}) AND mine.relation = 'radical'
+            LIMIT ?
+        ) AS siblings
+    """, [*frontier, fanout, *frontier, fanout, *frontier, fanout])
+    return cursor.fetchall()
+
+
+def related(character: str, depth: int = 1, limit: int = 50) -> Optional[Dict]:
+    """Characters within depth hops of a card, nearest and strongest first (None if no card)"""
+    depth = max(1, min(depth, MAX_DEPTH))
+    limit = max(1, min(limit, MAX_RESULTS))
+
+    conn = get_db(readonly=True)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT id FROM characters WHERE character = ?", (character,))
+        if cursor.fetchone() is None:
+            return None
+
+        found: Dict[str, Dict] = {}
+        visited = {character}
+        frontier = [character]
+        for level in range(1, depth + 1):
+            best: Dict[str, Dict] = {}
+            for row in _neighbours(cursor, frontier, FANOUT_FACTOR * limit):
+                neighbour = row['neighbour']
+                if neighbour in visited:
+                    continue
+                candidate = {'character': neighbour, 'relation': row['relation'], 'depth': level,
+                             'via': row['origin'], 'weight': row['weight']}
+                current = best.get(neighbour)
+                if current is None or (_PRIORITY[row['relation']], -row['weight']) < \
+                        (_PRIORITY[current['relation']], -current['weight']):
+                    best[neighbour] = candidate
+            ranked = sorted(best.values(), key=lambda r: (_PRIORITY[r['relation']], -r['weight'], r['character']))
+            for entry in ranked[:limit - len(found)]:
+                found[entry['character']] = entry
+            visited.update(best)
+            frontier = [entry['character'] for entry in ranked]
+            if not frontier or len(found) >= limit:
+                break
+
+        cards = {}
+        if found:
+            chars = list(found)
+            cursor.execute(f"""
+                SELECT id, character, pinyin FROM characters
+                WHERE character IN ({', '.join('?' * len(chars))})
+            """, chars)
+            cards = {row['character']: row for row in cursor.fetchall()}
+    finally:
+        conn.close()
+
+    results = []
+    for entry in found.values():
+        card = cards.get(entry['character'])
+        entry['id'] = card['id'] if card else None
+        entry['pinyin'] = card['pinyin'] if card else None
+        results.append(entry)
+    return {'character': character, 'depth': depth, 'related': results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Character relationship graph")
+    parser.add_argument("character", nargs="?", help="show characters related to this card")
+    parser.add_argument("--rebuild", action="store_true", help="recompute every edge")
+    parser.add_argument("--depth", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    if args.rebuild:
+        print(f"Indexed {rebuild()} edges")
+    if args.character:
+        result = related(args.character, args.depth)
+        if result is None:
+            print(f"No card for {args.character}")
+            return
+        for entry in result['related']:
+            card = '' if entry['id'] else '  (no card)'
+            print(f"{entry['depth']}  {entry['character']}  {entry['relation']:<9} via {entry['via']}{card}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Relational index of each card's word groups
+
+characters.word_groups stays the source of truth (it is what the card
+renders). character_word_groups mirrors it as one row per listed word -
+(character_id, tone_key, position, word) - linked to the matching words row
+when one exists, so "which words does 把 list" and "which cards list 把握"
+are indexed lookups instead of parsing every card's JSON.
+
+database.py keeps the rows in sync: a character write replaces that card's
+rows, and a word write re-links rows by word text.
+
+Usage:
+    python character_word_groups.py --backfill
+"""
+import argparse
+import logging
+from typing import Dict, List
+
+from card_fields import word_group_words
+from db_manager import get_db
+
+logger = logging.getLogger(__name__)
+
+_INSERT = """
+    INSERT INTO character_word_groups (character_id, tone_key, position, word, word_id)
+    VALUES (?, ?, ?, ?, (SELECT MIN(id) FROM words WHERE word = ?))
+"""
+
+
+def _rows(character_id: int, word_groups) -> List[tuple]:
+    return [(character_id, tone_key, position, word, word)
+            for tone_key, position, word in word_group_words(word_groups)]
+
+
+def index_character(cursor, character_id: int):
+    """Replace one card's rows from its word_groups (drops them when the card is gone)"""
+    cursor.execute("DELETE FROM character_word_groups WHERE character_id = ?", (character_id,))
+    cursor.execute("SELECT word_groups FROM characters WHERE id = ?", (character_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return
+    rows = _rows(character_id, row['word_groups'])
+    if rows:
+        cursor.executemany(_INSERT, rows)
+
+
+def relink_word(cursor, word_id: int):
+    """Point rows at the right words row after a word is added, renamed or deleted"""
+    cursor.execute("""
+        UPDATE character_word_groups
+        SET word_id = (SELECT MIN(w.id) FROM words w WHERE w.word = character_word_groups.word)
+        WHERE word_id = ? OR word = (SELECT word FROM words WHERE id = ?)
+    """, (word_id, word_id))
+
+
+def backfill() -> int:
+    """Rebuild every row from the cards (one transaction); returns the row count"""
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DELETE FROM character_word_groups")
+        cursor.execute("SELECT id, word_groups FROM characters")
+        rows = [entry for row in cursor.fetchall() for entry in _rows(row['id'], row['word_groups'])]
+        if rows:
+            cursor.executemany(_INSERT, rows)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    logger.info("Word groups backfilled", extra={'rows': len(rows)})
+    return len(rows)
+
+
+def ensure_index():
+    """Backfill once for databases that predate the table"""
+    conn = get_db(readonly=True)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT EXISTS (SELECT 1 FROM character_word_groups) AS indexed,
+               EXISTS (SELECT 1 FROM characters WHERE word_groups IS NOT NULL) AS has_groups
+    """)
+    row = cursor.fetchone()
+    conn.close()
+
+    if row['has_groups'] and not row['indexed']:
+        backfill()
+
+
+def words_for_character(character: str) -> Dict[str, List[Dict]]:
+    """A card's word groups by tone key, each word joined to its words row"""
+    conn = get_db(readonly=True)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT g.tone_key, g.position, g.word, g.word_id,
+               w.pinyin, w.chinese_meaning, w.english_translation
+        FROM characters c
+        JOIN character_word_groups g ON g.character_id = c.id
+        LEFT JOIN words w ON w.id = g.word_id
+        WHERE c.character = ?
+        ORDER BY g.tone_key, g.position
+    """, (character,))
+    rows = cursor.fetchall()
+    conn.close()
+
+    groups: Dict[str, List[Dict]] = {}
+    for row in rows:
+        groups.setdefault(row['tone_key'], []).append({
+            'word': row['word'],
+            'word_id': row['word_id'],
+            'pinyin': row['pinyin'],
+            'chinese_meaning': row['chinese_meaning'],
+            'english_translation': row['english_translation'],
+        })
+    return groups
+
+
+def characters_for_word(word: str) -> List[Dict]:
+    """Cards whose word groups list word"""
+    conn = get_db(readonly=True)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT c.id, c.character, c.pinyin, g.tone_key, g.position
+        FROM character_word_groups g
+        JOIN characters c ON c.id = g.character_id
+        WHERE g.word = ?
+        ORDER BY c.id, g.tone_key, g.position
+    """, (word,))
+    rows = cursor.fetchall()
+    conn.close()
+
+    return [{
+        'id': row['id'],
+        'character': row['character'],
+        'pinyin': row['pinyin'],
+        'tone_key': row['tone_key'],
+        'position': row['position'],
+    } for row in rows]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Relational index of card word groups")
+    parser.add_argument("--backfill", action="store_true", help="rebuild every row from the cards")
+    args = parser.parse_args(argv)
+
+    if args.backfill:
+        print(f"Indexed {backfill()} word group entries")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+Versioned offline content bundle with delta sync
+
+Every character/word write appends (entity, entity_id) to content_changes in
+the same transaction; its seq is the content version. Clients:
+
+1. download /api/bundle once - a gzip'd JSON-lines snapshot of every card
+   and word, tagged with the version it is current as of
+2. then poll /api/bundle/delta?since=<version> for the rows changed after
+   it (current rows, or tombstones for deleted ones) and the new version
+
+Line 1 of a bundle is a header ({"type": "bundle", "version": ..., "counts":
+...}); every further line is {"type": "character"|"word", ...row}.
+
+A PostgreSQL transaction can commit after a later seq is already visible, so
+the version handed to clients stops before any seq gap younger than
+GAP_GRACE_SECONDS; older gaps are rolled-back transactions and are skipped.
+
+Usage:
+    python content_bundle.py            # build the current bundle into data/bundles
+    python content_bundle.py --prune    # also drop change-log rows past retention
+"""
+import argparse
+import gzip
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from card_fields import parse_json
+from db_manager import get_db
+from serialization import dumps
+from singleflight import single_flight
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_DIR = Path(__file__).parent / "data" / "bundles"
+# Older bundle files are deleted when a new one is built
+KEEP_BUNDLES = 3
+
+# A seq gap younger than this may be a transaction that has not committed yet
+GAP_GRACE_SECONDS = 30
+
+# Change-log rows older than this are pruned; clients further behind re-download the bundle
+CHANGE_RETENTION_DAYS = int(os.getenv('CONTENT_CHANGE_RETENTION_DAYS', '90'))
+
+# A delta larger than this is not worth it - the client should re-download the bundle
+MAX_DELTA_CHANGES = 5000
+
+JSON_COLUMNS = {
+    'ancient_forms': {},
+    'word_groups': {},
+    'famous_quotes': [],
+    'character_structure': {},
+}
+
+
+class DeltaUnavailable(Exception):
+    """No delta can bring this version up to date - the client must re-download the bundle"""
+
+
+def record_change(cursor, entity: str, entity_id: int):
+    """Log a write to a character or word (call inside the writing transaction)"""
+    cursor.execute("INSERT INTO content_changes (entity, entity_id, changed_at) VALUES (?, ?, ?)",
+                   (entity, entity_id, time.time()))
+
+
+def _walk(rows, since: int) -> Tuple[int, List]:
+    """(version, rows) for the contiguous prefix of rows after since
+
+    A seq gap is skipped once the row after it is older than GAP_GRACE_SECONDS
+    (the missing seq was rolled back); a fresh gap may still commit, so the
+    version stops in front of it and the client picks it up next time.
+    """
+    version, taken = since, []
+    fresh_after = time.time() - GAP_GRACE_SECONDS
+    for row in rows:
+        if row['seq'] != version + 1 and row['changed_at'] > fresh_after:
+            break
+        version = row['seq']
+        taken.append(row)
+    return version, taken
+
+
+def _log_bounds(cursor) -> Tuple[Optional[int], int]:
+    """(lowest version a delta can start from or None while the log is empty, latest seq)"""
+    cursor.execute("SELECT MIN(seq) AS oldest, COALESCE(MAX(seq), 0) AS latest FROM content_changes")
+    row = cursor.fetchone()
+    return (None if row['oldest'] is None else row['oldest'] - 1), row['latest']
+
+
+def current_version(cursor) -> int:
+    """Highest version every client may safely sync from"""
+    cursor.execute("""
+        SELECT COALESCE(MAX(seq), 0) AS settled FROM content_changes WHERE changed_at <= ?
+    """, (time.time() - GAP_GRACE_SECONDS,))
+    settled = max(cursor.fetchone()['settled'], _log_bounds(cursor)[0] or 0)
+    # Only the last GAP_GRACE_SECONDS of the log can hold an in-flight gap
+    cursor.execute("SELECT seq, changed_at FROM content_changes WHERE seq > ? ORDER BY seq", (settled,))
+    version, _ = _walk(cursor.fetchall(), settled)
+    return version
+
+
+def _changes_since(cursor, since: int) -> Tuple[int, List[Tuple[str, int]]]:
+    """(version, [(entity, entity_id)]) changed after since, each entity once"""
+    oldest, latest = _log_bounds(cursor)
+    if oldest is not None and since < oldest:
+        raise DeltaUnavailable(f"Changes before version {oldest} have been pruned")
+    if since > latest:
+        raise DeltaUnavailable(f"Version {since} is newer than this server's {latest}")
+
+    cursor.execute("""
+        SELECT seq, entity, entity_id, changed_at FROM content_changes
+        WHERE seq > ?
+        ORDER BY seq
+        LIMIT ?
+    """, (since, MAX_DELTA_CHANGES + 1))
+    rows = cursor.fetchall()
+    if len(rows) > MAX_DELTA_CHANGES:
+        raise DeltaUnavailable(f"More than {MAX_DELTA_CHANGES} changes since version {since}")
+
+    version, taken = _walk(rows, since)
+    return version, list(dict.fromkeys((row['entity'], row['entity_id']) for row in taken))
+
+
+def _character_row(row) -> Dict:
+    card = dict(row)
+    for column, default in JSON_COLUMNS.items():
+        if column in card:
+            card[column] = parse_json(card[column], default)
+    return card
+
+
+def _fetch(cursor, table: str, ids: List[int]) -> List[Dict]:
+    if not ids:
+        return []
+    cursor.execute(f"SELECT * FROM {table} WHERE id IN ({', '.join('?' * len(ids))}) ORDER BY id", ids)
+    rows = cursor.fetchall()
+    return [_character_row(row) if table == 'characters' else dict(row) for row in rows]
+
+
+def get_delta(since: int) -> Dict:
+    """Rows changed after version since; raises DeltaUnavailable when the client must re-download"""
+    conn = get_db(readonly=True)
+    cursor = conn.cursor()
+    try:
+        version, changed = _changes_since(cursor, since)
+        character_ids = [entity_id for entity, entity_id in changed if entity == 'character']
+        word_ids = [entity_id for entity, entity_id in changed if entity == 'word']
+        characters = _fetch(cursor, 'characters', character_ids)
+        words = _fetch(cursor, 'words', word_ids)
+    finally:
+        conn.close()
+
+    # Anything changed but no longer there was deleted
+    found_characters = {row['id'] for row in characters}
+    found_words = {row['id'] for row in words}
+    return {
+        'since': since,
+        'version': version,
+        'characters': characters,
+        'words': words,
+        'deleted': {
+            'characters': [i for i in character_ids if i not in found_characters],
+            'words': [i for i in word_ids if i not in found_words],
+        },
+    }
+
+
+def bundle_path(version: int) -> Path:
+    return BUNDLE_DIR / f"content-{version}.jsonl.gz"
+
+
+@single_flight('content_bundle')
+def build_bundle() -> Tuple[int, Path]:
+    """Write (or reuse) the bundle for the current version; returns (version, path)"""
+    conn = get_db(readonly=True)
+    cursor = conn.cursor()
+    try:
+        # Version first: rows read afterwards are at least this new, and a
+        # client replaying deltas from here re-applies anything newer
+        version = current_version(cursor)
+        path = bundle_path(version)
+        if path.exists():
+            return version, path
+
+        cursor.execute("SELECT * FROM characters ORDER BY id")
+        characters = [_character_row(row) for row in cursor.fetchall()]
+        cursor.execute("SELECT * FROM words ORDER BY id")
+        words = [dict(row) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+    BUNDLE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    header = {'type': 'bundle', 'version': version,
+              'counts': {'characters': len(characters), 'words': len(words)}}
+    # mtime=0 keeps the bytes (and so the ETag) identical across rebuilds
+    with gzip.GzipFile(tmp, 'wb', compresslevel=6, mtime=0) as f:
+        f.write(dumps(header) + b'\n')
+        for card in characters:
+            f.write(dumps({'type': 'character', **card}) + b'\n')
+        for word in words:
+            f.write(dumps({'type': 'word', **word}) + b'\n')
+    tmp.replace(path)
+
+    for old in sorted(BUNDLE_DIR.glob("content-*.jsonl.gz"), key=lambda p: p.stat().st_mtime)[:-KEEP_BUNDLES]:
+        old.unlink(missing_ok=True)
+
+    logger.info("Content bundle built", extra={'version': version, 'bytes': path.stat().st_size, **header['counts']})
+    return version, path
+
+
+def prune_changes(retention_days: int = CHANGE_RETENTION_DAYS) -> int:
+    """Drop change-log rows older than retention_days; returns the number removed"""
+    cutoff = time.time() - retention_days * 86400
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        # The newest row always stays: MIN(seq) is what tells a stale client it is too old
+        cursor.execute("""
+            DELETE FROM content_changes
+            WHERE changed_at < ? AND seq < (SELECT MAX(seq) FROM content_changes)
+        """, (cutoff,))
+        removed = cursor.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    logger.info("Content change log pruned", extra={'removed': removed})
+    return removed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline content bundle")
+    parser.add_argument("--prune", action="store_true", help=f"drop change-log rows older than {CHANGE_RETENTION_DAYS} days")
+    args = parser.parse_args(argv)
+
+    if args.prune:
+        print(f"Pruned {prune_changes()} change-log rows")
+    version, path = build_bundle()
+    print(f"Bundle v{version}: {path} ({path.stat().st_size:,} bytes)")
+
+
+if __name__ == "__main__":
+    main()
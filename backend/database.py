@@ -3,37 +3,151 @@ SQLite Database for Chinese Learning Platform - Traditional Character Card Forma
 """
 import sqlite3
 import json
-from datetime import datetime
+import logging
+from datetime import datetime, timedelta
 from pathlib import Path
 from typing import List, Optional, Dict, Any
 from dataclasses import dataclass
 
+import metrics
+from singleflight import single_flight
+from statements import statement
+import change_feed
+from card_fields import parse_json as _parse_json
+
+logger = logging.getLogger(__name__)
+
 DB_PATH = Path(__file__).parent / "data" / "chinese_learning.db"
 
 
 # Import database manager for PostgreSQL support
 try:
-    from db_manager import get_db, init_db as _init_db, get_db_type
+    from db_manager import get_db, init_db as _init_db, get_db_type, run_write, note_user_write
+    import search_index
+    import character_facets
+    import character_graph
+    import character_word_groups
+    import content_bundle
+    import review_log
+    import learning_rollups
     POSTGRES_SUPPORT = True
 except ImportError:
     POSTGRES_SUPPORT = False
-    def get_db():
+    search_index = None
+    character_facets = None
+    character_graph = None
+    character_word_groups = None
+    content_bundle = None
+    review_log = None
+    learning_rollups = None
+    def get_db(readonly: bool = False, user_id=None):
         """Fallback to SQLite"""
         DB_PATH.parent.mkdir(exist_ok=True)
         conn = sqlite3.connect(str(DB_PATH))
         conn.row_factory = sqlite3.Row
         return conn
+    def note_user_write(user_id):
+        pass
+    def run_write(fn):
+        conn = get_db()
+        try:
+            result = fn(conn.cursor())
+            conn.commit()
+            return result
+        finally:
+            conn.close()
     def _init_db():
         pass
     def get_db_type():
         return 'sqlite'
 
 
+# ==================== Statements ====================
+# Hot queries, declared once and run as prepared statements on PostgreSQL
+
+CHARACTER_BY_TEXT = statement('character_by_text', "SELECT * FROM characters WHERE character = ?")
+
+CHARACTER_BY_ID = statement('character_by_id', "SELECT * FROM characters WHERE id = ?")
+
+WORDS_BY_CHARACTER = statement('words_by_character', """
+    SELECT * FROM words 
+    WHERE character_id = ?
+    ORDER BY created_at DESC
+""")
+
+WORD_BY_TEXT = statement('word_by_text', """
+    SELECT w.*, c.character as related_character
+    FROM words w
+    LEFT JOIN characters c ON w.character_id = c.id
+    WHERE w.word = ?
+""")
+
+USER_PROGRESS = statement('user_progress', """
+    SELECT ucp.*, c.character, c.pinyin
+    FROM user_character_progress ucp
+    JOIN characters c ON ucp.character_id = c.id
+    WHERE ucp.user_id = ?
+    ORDER BY ucp.learned_date DESC
+""")
+
+# One round trip instead of SELECT then UPDATE/INSERT (same syntax on SQLite 3.24+)
+UPSERT_USER_PROGRESS = statement('upsert_user_progress', """
+    INSERT INTO user_character_progress 
+    (user_id, character_id, is_learned, proficiency, learned_date)
+    VALUES (?, ?, ?, ?, CURRENT_DATE)
+    ON CONFLICT (user_id, character_id) DO UPDATE SET
+        is_learned = excluded.is_learned,
+        proficiency = COALESCE(?, user_character_progress.proficiency),
+        review_count = user_character_progress.review_count + 1,
+        last_reviewed = CURRENT_TIMESTAMP,
+        updated_at = CURRENT_TIMESTAMP
+""")
+
+PROGRESS_IS_LEARNED = statement('progress_is_learned', """
+    SELECT is_learned FROM user_character_progress WHERE user_id = ? AND character_id = ?
+""")
+
+USER_LEARNING_STATS = statement('user_learning_stats', """
+    SELECT
+        COUNT(CASE WHEN is_learned THEN 1 END) AS learned,
+        COUNT(CASE WHEN NOT is_learned THEN 1 END) AS in_progress,
+        AVG(proficiency) AS avg_proficiency,
+        COUNT(CASE WHEN learned_date >= ? THEN 1 END) AS recent
+    FROM user_character_progress
+    WHERE user_id = ?
+""")
+
+
+# ==================== Derived Indexes ====================
+# Called inside the transaction that changed the row, before commit
+
+def _after_character_write(cursor, character_id: int):
+    if not POSTGRES_SUPPORT:
+        return
+    search_index.index_character(cursor, character_id)
+    character_facets.index_character(cursor, character_id)
+    character_graph.index_character(cursor, character_id)
+    character_word_groups.index_character(cursor, character_id)
+    content_bundle.record_change(cursor, 'character', character_id)
+
+
+def _after_word_write(cursor, word_id: int):
+    if not POSTGRES_SUPPORT:
+        return
+    search_index.index_word(cursor, word_id)
+    character_word_groups.relink_word(cursor, word_id)
+    content_bundle.record_change(cursor, 'word', word_id)
+
+
 def init_db():
     """Initialize database with tables for traditional character card format"""
     # Use db_manager's init if available
     if POSTGRES_SUPPORT:
         _init_db()
+        search_index.ensure_index()
+        character_facets.ensure_index()
+        character_graph.ensure_index()
+        character_word_groups.ensure_index()
         return
     
     # Fallback to SQLite init
@@ -159,7 +273,7 @@ def init_db():
     
     conn.commit()
     conn.close()
-    print("✅ Database initialized with traditional character card format")
+    logger.info("Database initialized with traditional character card format")
 
 
 def add_character_full(
@@ -180,11 +294,10 @@ def add_character_full(
     meaning: str = ""
 ) -> int:
     """Add a new character with full traditional format details"""
-    conn = get_db()
-    cursor = conn.cursor()
+    db_type = get_db_type()
     
-    try:
-        db_type = get_db_type()
+    def write(cursor):
+        replaced = None
         
         if db_type == 'postgresql':
             # PostgreSQL uses INSERT ... ON CONFLICT
@@ -240,8 +353,11 @@ def add_character_full(
                     INSERT INTO character_schedule (character_id, scheduled_date)
                     VALUES (?, CURRENT_DATE)
                 """, (char_id,))
+            _after_character_write(cursor, char_id)
         else:
-            # SQLite uses INSERT OR REPLACE
+            # SQLite uses INSERT OR REPLACE (a replaced row gets a new id)
+            cursor.execute("SELECT id FROM characters WHERE character = ?", (character,))
+            replaced = cursor.fetchone()
             cursor.execute("""
                 INSERT OR REPLACE INTO characters 
                 (character, pinyin, alt_pinyin, radical, stroke_count, stroke_order,
@@ -277,15 +393,20 @@ def add_character_full(
                     INSERT INTO character_schedule (character_id, scheduled_date)
                     VALUES (?, DATE('now'))
                 """, (char_id,))
-        
-        conn.commit()
-        return char_id
+            if replaced and replaced['id'] != char_id:
+                _after_character_write(cursor, replaced['id'])
+            _after_character_write(cursor, char_id)
+        return char_id, replaced['id'] if replaced and replaced['id'] != char_id else None
+    
+    try:
+        char_id, replaced_id = run_write(write)
     except Exception as e:
-        print(f"Error adding character: {e}")
-        conn.rollback()
+        logger.error("Error adding character: %s", e)
         return 0
-    finally:
-        conn.close()
+    if replaced_id:
+        change_feed.content_changed('character', replaced_id, 'delete')
+    change_feed.content_changed('character', char_id, 'upsert')
+    return char_id
 
 
 def update_character_by_id(
@@ -307,120 +428,181 @@ def update_character_by_id(
     meaning: str = None
 ) -> bool:
     """Update character by ID - partial update (only update non-None fields)"""
-    conn = get_db()
-    cursor = conn.cursor()
+    # Build dynamic update query
+    fields = []
+    values = []
     
-    try:
-        # Build dynamic update query
-        fields = []
-        values = []
-        
-        if character is not None:
-            fields.append("character = ?")
-            values.append(character)
-        if pinyin is not None:
-            fields.append("pinyin = ?")
-            values.append(pinyin)
-        if alt_pinyin is not None:
-            fields.append("alt_pinyin = ?")
-            values.append(alt_pinyin)
-        if radical is not None:
-            fields.append("radical = ?")
-            values.append(radical)
-        if stroke_count is not None:
-            fields.append("stroke_count = ?")
-            values.append(stroke_count)
-        if stroke_order is not None:
-            fields.append("stroke_order = ?")
-            values.append(stroke_order)
-        if illustration_desc is not None:
-            fields.append("illustration_desc = ?")
-            values.append(illustration_desc)
-        if illustration_image is not None:
-            fields.append("illustration_image = ?")
-            values.append(illustration_image)
-        if rhyme_text is not None:
-            fields.append("rhyme_text = ?")
-            values.append(rhyme_text)
-        if ancient_forms is not None:
-            fields.append("ancient_forms = ?")
-            values.append(json.dumps(ancient_forms, ensure_ascii=False))
-        if etymology is not None:
-            fields.append("etymology = ?")
-            values.append(etymology)
-        if word_groups is not None:
-            fields.append("word_groups = ?")
-            values.append(json.dumps(word_groups, ensure_ascii=False))
-        if famous_quotes is not None:
-            fields.append("famous_quotes = ?")
-            values.append(json.dumps(famous_quotes, ensure_ascii=False))
-        if character_structure is not None:
-            fields.append("character_structure = ?")
-            values.append(json.dumps(character_structure, ensure_ascii=False))
-        if meaning is not None:
-            fields.append("meaning = ?")
-            values.append(meaning)
-        
-        if not fields:
-            return True  # Nothing to update
-        
-        values.append(character_id)
-        
-        query = f"UPDATE characters SET {', '.join(fields)} WHERE id = ?"
+    if character is not None:
+        fields.append("character = ?")
+        values.append(character)
+    if pinyin is not None:
+        fields.append("pinyin = ?")
+        values.append(pinyin)
+    if alt_pinyin is not None:
+        fields.append("alt_pinyin = ?")
+        values.append(alt_pinyin)
+    if radical is not None:
+        fields.append("radical = ?")
+        values.append(radical)
+    if stroke_count is not None:
+        fields.append("stroke_count = ?")
+        values.append(stroke_count)
+    if stroke_order is not None:
+        fields.append("stroke_order = ?")
+        values.append(stroke_order)
+    if illustration_desc is not None:
+        fields.append("illustration_desc = ?")
+        values.append(illustration_desc)
+    if illustration_image is not None:
+        fields.append("illustration_image = ?")
+        values.append(illustration_image)
+    if rhyme_text is not None:
+        fields.append("rhyme_text = ?")
+        values.append(rhyme_text)
+    if ancient_forms is not None:
+        fields.append("ancient_forms = ?")
+        values.append(json.dumps(ancient_forms, ensure_ascii=False))
+    if etymology is not None:
+        fields.append("etymology = ?")
+        values.append(etymology)
+    if word_groups is not None:
+        fields.append("word_groups = ?")
+        values.append(json.dumps(word_groups, ensure_ascii=False))
+    if famous_quotes is not None:
+        fields.append("famous_quotes = ?")
+        values.append(json.dumps(famous_quotes, ensure_ascii=False))
+    if character_structure is not None:
+        fields.append("character_structure = ?")
+        values.append(json.dumps(character_structure, ensure_ascii=False))
+    if meaning is not None:
+        fields.append("meaning = ?")
+        values.append(meaning)
+    
+    if not fields:
+        return True  # Nothing to update
+    
+    values.append(character_id)
+    
+    def write(cursor):
+        query = f"UPDATE characters SET {', '.join(fields)}, updated_at = CURRENT_TIMESTAMP WHERE id = ?"
         cursor.execute(query, values)
-        conn.commit()
-        return cursor.rowcount > 0
+        updated = cursor.rowcount > 0
+        if updated:
+            _after_character_write(cursor, character_id)
+        return updated
+    
+    try:
+        updated = run_write(write)
     except Exception as e:
-        print(f"Error updating character: {e}")
-        conn.rollback()
+        logger.error("Error updating character: %s", e)
         return False
-    finally:
-        conn.close()
+    if updated:
+        change_feed.content_changed('character', character_id, 'upsert')
+    return updated
+
+
+def get_characters_for_illustration() -> List[Dict]:
+    """Get the fields needed to render illustrations for every character"""
+    conn = get_db(readonly=True)
+    cursor = conn.cursor()
+    
+    cursor.execute("""
+        SELECT id, character, illustration_desc, illustration_image
+        FROM characters
+        ORDER BY id
+    """)
+    rows = cursor.fetchall()
+    conn.close()
+    
+    return [{
+        'id': row['id'],
+        'character': row['character'],
+        'illustration_desc': row['illustration_desc'] or '',
+        'illustration_image': row['illustration_image'] or ''
+    } for row in rows]
+
+
+def update_character_images(images: Dict[int, str]) -> int:
+    """Bulk update illustration_image paths (character_id -> image path)"""
+    if not images:
+        return 0
+    
+    def write(cursor):
+        cursor.executemany("""
+            UPDATE characters
+            SET illustration_image = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, [(path, char_id) for char_id, path in images.items()])
+        if POSTGRES_SUPPORT:
+            # Only the image changed - no derived index needs refreshing
+            for char_id in images:
+                content_bundle.record_change(cursor, 'character', char_id)
+    
+    try:
+        run_write(write)
+    except Exception as e:
+        logger.error("Error updating character images: %s", e)
+        return 0
+    for char_id in images:
+        change_feed.content_changed('character', char_id, 'upsert')
+    return len(images)
 
 
+def _row_to_character(row) -> Dict:
+    """Convert a characters row to the traditional card dict"""
+    return {
+        'id': row['id'],
+        'character': row['character'],
+        'pinyin': row['pinyin'],
+        'alt_pinyin': row['alt_pinyin'],
+        'radical': row['radical'],
+        'stroke_count': row['stroke_count'],
+        'stroke_order': row['stroke_order'],
+        'illustration_desc': row['illustration_desc'],
+        'illustration_image': row['illustration_image'],
+        'rhyme_text': row['rhyme_text'],
+        'ancient_forms': _parse_json(row['ancient_forms'], {}),
+        'etymology': row['etymology'],
+        'word_groups': _parse_json(row['word_groups'], {}),
+        'famous_quotes': _parse_json(row['famous_quotes'], []),
+        'character_structure': _parse_json(row['character_structure'], {}),
+        'meaning': row['meaning'],
+        'created_at': _format_datetime(row['created_at'])
+    }
+
+
+@single_flight('get_character_full')
 def get_character_full(char: str) -> Optional[Dict]:
     """Get full character details in traditional format"""
-    conn = get_db()
+    conn = get_db(readonly=True)
     cursor = conn.cursor()
     
-    cursor.execute("SELECT * FROM characters WHERE character = ?", (char,))
+    cursor.execute(CHARACTER_BY_TEXT, (char,))
     row = cursor.fetchone()
     conn.close()
     
     if row:
-        # Helper to parse JSON fields (PostgreSQL returns dict/list, SQLite returns string)
-        def parse_json(val, default):
-            if val is None:
-                return default
-            if isinstance(val, str):
-                return json.loads(val or json.dumps(default))
-            return val
-        
-        return {
-            'id': row['id'],
-            'character': row['character'],
-            'pinyin': row['pinyin'],
-            'alt_pinyin': row['alt_pinyin'],
-            'radical': row['radical'],
-            'stroke_count': row['stroke_count'],
-            'stroke_order': row['stroke_order'],
-            'illustration_desc': row['illustration_desc'],
-            'illustration_image': row['illustration_image'],
-            'rhyme_text': row['rhyme_text'],
-            'ancient_forms': parse_json(row['ancient_forms'], {}),
-            'etymology': row['etymology'],
-            'word_groups': parse_json(row['word_groups'], {}),
-            'famous_quotes': parse_json(row['famous_quotes'], []),
-            'character_structure': parse_json(row['character_structure'], {}),
-            'meaning': row['meaning'],
-            'created_at': _format_datetime(row['created_at'])
-        }
+        return _row_to_character(row)
+    return None
+
+
+def get_character_by_id(character_id: int) -> Optional[Dict]:
+    """Get full character details by ID"""
+    conn = get_db(readonly=True)
+    cursor = conn.cursor()
+    
+    cursor.execute(CHARACTER_BY_ID, (character_id,))
+    row = cursor.fetchone()
+    conn.close()
+    
+    if row:
+        return _row_to_character(row)
     return None
 
 
 def get_all_characters() -> List[Dict]:
     """Get all characters (summary)"""
-    conn = get_db()
+    conn = get_db(readonly=True)
     cursor = conn.cursor()
     
     cursor.execute("""
@@ -441,6 +623,37 @@ def get_all_characters() -> List[Dict]:
     } for row in rows]
 
 
+def browse_characters(radical: Optional[str] = None, stroke_count: Optional[int] = None,
+                      tone: Optional[int] = None, pinyin: Optional[str] = None,
+                      page: int = 1, page_size: int = 50, sort: str = 'stroke_count') -> Dict:
+    """Filtered, paginated character list with per-facet counts"""
+    if not POSTGRES_SUPPORT:
+        raise RuntimeError("Character facets need db_manager")
+    return character_facets.browse(radical=radical, stroke_count=stroke_count, tone=tone,
+                                   pinyin=pinyin, page=page, page_size=page_size, sort=sort)
+
+
+def get_related_characters(character: str, depth: int = 1, limit: int = 50) -> Optional[Dict]:
+    """Characters related to a card through structure, radical and word groups"""
+    if not POSTGRES_SUPPORT:
+        raise RuntimeError("Character graph needs db_manager")
+    return character_graph.related(character, depth=depth, limit=limit)
+
+
+def get_character_word_groups(character: str) -> Dict[str, List[Dict]]:
+    """Words listed on a card, by tone key, joined to their words rows"""
+    if not POSTGRES_SUPPORT:
+        raise RuntimeError("Word group index needs db_manager")
+    return character_word_groups.words_for_character(character)
+
+
+def get_characters_for_word(word_text: str) -> List[Dict]:
+    """Cards whose word groups list a word"""
+    if not POSTGRES_SUPPORT:
+        raise RuntimeError("Word group index needs db_manager")
+    return character_word_groups.characters_for_word(word_text)
+
+
 def _format_datetime(val):
     """Format datetime value for JSON (handles both string and datetime)"""
     if val is None:
@@ -452,7 +665,7 @@ def _format_datetime(val):
 
 def get_todays_characters() -> List[Dict]:
     """Get all characters (from character schedule)"""
-    conn = get_db()
+    conn = get_db(readonly=True)
     cursor = conn.cursor()
     
     cursor.execute("""
@@ -478,7 +691,7 @@ def get_todays_characters() -> List[Dict]:
 
 def get_learned_characters() -> List[Dict]:
     """Get all learned characters"""
-    conn = get_db()
+    conn = get_db(readonly=True)
     cursor = conn.cursor()
     
     cursor.execute("""
@@ -505,50 +718,47 @@ def get_learned_characters() -> List[Dict]:
 
 def update_character_progress(character_id: int, proficiency: int = None):
     """Update learning progress for a character"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    cursor.execute(
-        "SELECT id FROM character_progress WHERE character_id = ?",
-        (character_id,)
-    )
-    row = cursor.fetchone()
-    
-    if row:
-        if proficiency is not None:
-            cursor.execute("""
-                UPDATE character_progress 
-                SET review_count = review_count + 1,
-                    last_reviewed = CURRENT_TIMESTAMP,
-                    proficiency = ?
-                WHERE character_id = ?
-            """, (proficiency, character_id))
+    def write(cursor):
+        cursor.execute(
+            "SELECT id FROM character_progress WHERE character_id = ?",
+            (character_id,)
+        )
+        row = cursor.fetchone()
+        
+        if row:
+            if proficiency is not None:
+                cursor.execute("""
+                    UPDATE character_progress 
+                    SET review_count = review_count + 1,
+                        last_reviewed = CURRENT_TIMESTAMP,
+                        proficiency = ?
+                    WHERE character_id = ?
+                """, (proficiency, character_id))
+            else:
+                cursor.execute("""
+                    UPDATE character_progress 
+                    SET review_count = review_count + 1,
+                        last_reviewed = CURRENT_TIMESTAMP
+                    WHERE character_id = ?
+                """, (character_id,))
         else:
             cursor.execute("""
-                UPDATE character_progress 
-                SET review_count = review_count + 1,
-                    last_reviewed = CURRENT_TIMESTAMP
-                WHERE character_id = ?
-            """, (character_id,))
-    else:
+                INSERT INTO character_progress (character_id, proficiency)
+                VALUES (?, ?)
+            """, (character_id, proficiency or 0))
+        
         cursor.execute("""
-            INSERT INTO character_progress (character_id, proficiency)
-            VALUES (?, ?)
-        """, (character_id, proficiency or 0))
+            UPDATE character_schedule 
+            SET is_learned = TRUE 
+            WHERE character_id = ? AND scheduled_date = DATE('now')
+        """, (character_id,))
     
-    cursor.execute("""
-        UPDATE character_schedule 
-        SET is_learned = TRUE 
-        WHERE character_id = ? AND scheduled_date = DATE('now')
-    """, (character_id,))
-    
-    conn.commit()
-    conn.close()
+    run_write(write)
 
 
 def get_learning_stats() -> Dict:
     """Get learning statistics"""
-    conn = get_db()
+    conn = get_db(readonly=True)
     cursor = conn.cursor()
     
     cursor.execute("SELECT COUNT(*) as count FROM characters")
@@ -707,7 +917,7 @@ def seed_sample_data():
         meaning="十个十；泛指数目多"
     )
     
-    print("✅ Sample data seeded successfully")
+    logger.info("Sample data seeded successfully")
 
 
 # ==================== Word Operations ====================
@@ -716,37 +926,35 @@ def add_word(word: str, pinyin: str = "", chinese_meaning: str = "",
              english_translation: str = "", character_id: int = None,
              display: bool = False, is_ai_generated: bool = False) -> int:
     """Add a new word to the database"""
-    conn = get_db()
-    cursor = conn.cursor()
+    # psycopg2 has no lastrowid - PostgreSQL returns the new id instead
+    returning = " RETURNING id" if get_db_type() == 'postgresql' else ""
     
-    try:
+    def write(cursor):
         cursor.execute("""
             INSERT INTO words (word, pinyin, chinese_meaning, english_translation, 
                               character_id, display, is_ai_generated)
             VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (word, pinyin, chinese_meaning, english_translation, 
+        """ + returning, (word, pinyin, chinese_meaning, english_translation, 
               character_id, display, is_ai_generated))
-        conn.commit()
-        word_id = cursor.lastrowid
+        word_id = cursor.fetchone()['id'] if returning else cursor.lastrowid
+        _after_word_write(cursor, word_id)
         return word_id
+    
+    try:
+        word_id = run_write(write)
     except Exception as e:
-        print(f"Error adding word: {e}")
-        conn.rollback()
+        logger.error("Error adding word: %s", e)
         return 0
-    finally:
-        conn.close()
+    change_feed.content_changed('word', word_id, 'upsert', character_id)
+    return word_id
 
 
 def get_words_by_character(character_id: int) -> List[Dict]:
     """Get all words related to a character"""
-    conn = get_db()
+    conn = get_db(readonly=True)
     cursor = conn.cursor()
     
-    cursor.execute("""
-        SELECT * FROM words 
-        WHERE character_id = ?
-        ORDER BY created_at DESC
-    """, (character_id,))
+    cursor.execute(WORDS_BY_CHARACTER, (character_id,))
     rows = cursor.fetchall()
     conn.close()
     
@@ -765,7 +973,7 @@ def get_words_by_character(character_id: int) -> List[Dict]:
 
 def get_all_words() -> List[Dict]:
     """Get all words (for word learning page)"""
-    conn = get_db()
+    conn = get_db(readonly=True)
     cursor = conn.cursor()
     
     cursor.execute("""
@@ -793,62 +1001,64 @@ def get_all_words() -> List[Dict]:
 
 def update_word(word_id: int, updates: Dict) -> bool:
     """Update word information"""
-    conn = get_db()
-    cursor = conn.cursor()
+    allowed_fields = ['word', 'pinyin', 'chinese_meaning', 
+                     'english_translation', 'display', 'is_ai_generated']
     
-    try:
-        allowed_fields = ['word', 'pinyin', 'chinese_meaning', 
-                         'english_translation', 'display', 'is_ai_generated']
-        
-        set_clauses = []
-        values = []
-        
-        for field in allowed_fields:
-            if field in updates:
-                set_clauses.append(f"{field} = ?")
-                values.append(updates[field])
-        
-        if not set_clauses:
-            return False
-        
-        values.append(word_id)
-        
+    set_clauses = []
+    values = []
+    
+    for field in allowed_fields:
+        if field in updates:
+            set_clauses.append(f"{field} = ?")
+            values.append(updates[field])
+    
+    if not set_clauses:
+        return False
+    
+    values.append(word_id)
+    
+    def write(cursor):
         cursor.execute(f"""
             UPDATE words 
             SET {', '.join(set_clauses)}, updated_at = CURRENT_TIMESTAMP
             WHERE id = ?
         """, values)
-        
-        conn.commit()
-        return True
+        _after_word_write(cursor, word_id)
+        cursor.execute("SELECT character_id FROM words WHERE id = ?", (word_id,))
+        return cursor.fetchone()
+    
+    try:
+        row = run_write(write)
     except Exception as e:
-        print(f"Error updating word: {e}")
-        conn.rollback()
+        logger.error("Error updating word: %s", e)
         return False
-    finally:
-        conn.close()
+    if row:
+        change_feed.content_changed('word', word_id, 'upsert', row['character_id'])
+    return True
 
 
 def delete_word(word_id: int) -> bool:
     """Delete a word"""
-    conn = get_db()
-    cursor = conn.cursor()
+    def write(cursor):
+        cursor.execute("SELECT character_id FROM words WHERE id = ?", (word_id,))
+        row = cursor.fetchone()
+        cursor.execute("DELETE FROM words WHERE id = ?", (word_id,))
+        _after_word_write(cursor, word_id)
+        return row
     
     try:
-        cursor.execute("DELETE FROM words WHERE id = ?", (word_id,))
-        conn.commit()
-        return True
+        row = run_write(write)
     except Exception as e:
-        print(f"Error deleting word: {e}")
-        conn.rollback()
+        logger.error("Error deleting word: %s", e)
         return False
-    finally:
-        conn.close()
+    if row:
+        change_feed.content_changed('word', word_id, 'delete', row['character_id'])
+    return True
 
 
 def get_word_by_id(word_id: int) -> Optional[Dict]:
     """Get word by ID"""
-    conn = get_db()
+    conn = get_db(readonly=True)
     cursor = conn.cursor()
     
     cursor.execute("""
@@ -878,15 +1088,10 @@ def get_word_by_id(word_id: int) -> Optional[Dict]:
 
 def get_word_by_text(word_text: str) -> Optional[Dict]:
     """Get word by word text"""
-    conn = get_db()
+    conn = get_db(readonly=True)
     cursor = conn.cursor()
     
-    cursor.execute("""
-        SELECT w.*, c.character as related_character
-        FROM words w
-        LEFT JOIN characters c ON w.character_id = c.id
-        WHERE w.word = ?
-    """, (word_text,))
+    cursor.execute(WORD_BY_TEXT, (word_text,))
     row = cursor.fetchone()
     conn.close()
     
@@ -925,7 +1130,7 @@ if __name__ == "__main__":
 
 def get_all_users() -> List[Dict]:
     """Get all users"""
-    conn = get_db()
+    conn = get_db(readonly=True)
     cursor = conn.cursor()
     
     cursor.execute("""
@@ -947,7 +1152,7 @@ def get_all_users() -> List[Dict]:
 
 def get_user_by_id(user_id: int) -> Optional[Dict]:
     """Get user by ID"""
-    conn = get_db()
+    conn = get_db(readonly=True)
     cursor = conn.cursor()
     
     cursor.execute("""
@@ -999,7 +1204,7 @@ def update_user(user_id: int, display_name: str = None, avatar: str = None) -> b
         conn.commit()
         return True
     except Exception as e:
-        print(f"Error updating user: {e}")
+        logger.error("Error updating user: %s", e)
         return False
     finally:
         conn.close()
@@ -1015,7 +1220,7 @@ def delete_user(user_id: int) -> bool:
         conn.commit()
         return cursor.rowcount > 0
     except Exception as e:
-        print(f"Error deleting user: {e}")
+        logger.error("Error deleting user: %s", e)
         return False
     finally:
         conn.close()
@@ -1025,16 +1230,10 @@ def delete_user(user_id: int) -> bool:
 
 def get_user_character_progress(user_id: int) -> List[Dict]:
     """Get all character progress for a user"""
-    conn = get_db()
+    conn = get_db(readonly=True, user_id=user_id)
     cursor = conn.cursor()
     
-    cursor.execute("""
-        SELECT ucp.*, c.character, c.pinyin
-        FROM user_character_progress ucp
-        JOIN characters c ON ucp.character_id = c.id
-        WHERE ucp.user_id = ?
-        ORDER BY ucp.learned_date DESC
-    """, (user_id,))
+    cursor.execute(USER_PROGRESS, (user_id,))
     rows = cursor.fetchall()
     conn.close()
     
@@ -1052,88 +1251,235 @@ def get_user_character_progress(user_id: int) -> List[Dict]:
 
 def update_user_character_progress(user_id: int, character_id: int, is_learned: bool = True, proficiency: int = None) -> bool:
     """Update user's progress on a character"""
-    conn = get_db()
-    cursor = conn.cursor()
+    def write(cursor):
+        cursor.execute(PROGRESS_IS_LEARNED, (user_id, character_id))
+        previous = cursor.fetchone()
+        # New rows start at proficiency 0; existing rows keep theirs when none is given
+        cursor.execute(UPSERT_USER_PROGRESS,
+                       (user_id, character_id, is_learned, proficiency or 0, proficiency))
+        if review_log:
+            reviewed_at = review_log.now()
+            review_log.record(cursor, user_id, character_id, is_learned, proficiency, reviewed_at)
+            learning_rollups.record_reviews(cursor, user_id, [{
+                'day': reviewed_at[:10],
+                'proficiency': proficiency,
+                'newly_learned': is_learned and not (previous and previous['is_learned']),
+            }])
     
     try:
-        # Check if record exists
-        cursor.execute("""
-            SELECT id FROM user_character_progress 
-            WHERE user_id = ? AND character_id = ?
-        """, (user_id, character_id))
-        row = cursor.fetchone()
-        
-        if row:
-            # Update existing
-            if proficiency is not None:
-                cursor.execute("""
-                    UPDATE user_character_progress 
-                    SET is_learned = ?, proficiency = ?, review_count = review_count + 1,
-                        last_reviewed = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
-                    WHERE user_id = ? AND character_id = ?
-                """, (is_learned, proficiency, user_id, character_id))
-            else:
-                cursor.execute("""
-                    UPDATE user_character_progress 
-                    SET is_learned = ?, review_count = review_count + 1,
-                        last_reviewed = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
-                    WHERE user_id = ? AND character_id = ?
-                """, (is_learned, user_id, character_id))
-        else:
-            # Create new
-            cursor.execute("""
-                INSERT INTO user_character_progress 
-                (user_id, character_id, is_learned, proficiency, learned_date)
-                VALUES (?, ?, ?, ?, CURRENT_DATE)
-            """, (user_id, character_id, is_learned, proficiency or 0))
-        
-        conn.commit()
+        run_write(write)
+        note_user_write(user_id)
+        change_feed.progress_changed(user_id, character_id, is_learned, proficiency)
         return True
     except Exception as e:
-        print(f"Error updating progress: {e}")
+        logger.error("Error updating progress: %s", e)
         return False
-    finally:
-        conn.close()
+
+
+def update_user_character_progress_bulk(user_id: int, updates: List[Dict]) -> int:
+    """Apply many progress updates (a finished quiz or review session) in one transaction
+
+    Each update has character_id, is_learned, proficiency and an optional
+    reviewed_at; every one is kept in the review log. Returns the number applied.
+    """
+    if not updates:
+        return 0
+    
+    def write(cursor):
+        character_ids = sorted({u['character_id'] for u in updates})
+        cursor.execute(f"""
+            SELECT character_id, is_learned FROM user_character_progress
+            WHERE user_id = ? AND character_id IN ({', '.join(['?'] * len(character_ids))})
+        """, [user_id] + character_ids)
+        learned = {row['character_id']: bool(row['is_learned']) for row in cursor.fetchall()}
+        cursor.executemany(UPSERT_USER_PROGRESS, [
+            (user_id, u['character_id'], u.get('is_learned', True), u.get('proficiency') or 0, u.get('proficiency'))
+            for u in updates
+        ])
+        if review_log:
+            reviewed_at = review_log.now()
+            events = [{**u, 'user_id': user_id, 'reviewed_at': u.get('reviewed_at') or reviewed_at} for u in updates]
+            review_log.record_many(cursor, events)
+            reviews = []
+            for event in events:
+                is_learned = event.get('is_learned', True)
+                reviews.append({
+                    'day': event['reviewed_at'][:10],
+                    'proficiency': event.get('proficiency'),
+                    'newly_learned': is_learned and not learned.get(event['character_id'], False),
+                })
+                learned[event['character_id']] = is_learned
+            learning_rollups.record_reviews(cursor, user_id, reviews)
+    
+    run_write(write)
+    note_user_write(user_id)
+    for u in updates:
+        change_feed.progress_changed(user_id, u['character_id'], u.get('is_learned', True), u.get('proficiency'))
+    return len(updates)
 
 
 def get_user_learning_stats(user_id: int) -> Dict:
     """Get learning statistics for a user"""
-    conn = get_db()
+    conn = get_db(readonly=True, user_id=user_id)
     cursor = conn.cursor()
     
-    # Total learned
-    cursor.execute("""
-        SELECT COUNT(*) FROM user_character_progress 
-        WHERE user_id = ? AND is_learned = 1
-    """, (user_id,))
-    learned = cursor.fetchone()[0]
+    # One pass over the user's rows; the cutoff is bound as a parameter so the
+    # query runs unchanged on SQLite and PostgreSQL
+    week_ago = (datetime.now() - timedelta(days=7)).date().isoformat()
+    cursor.execute(USER_LEARNING_STATS, (week_ago, user_id))
+    row = cursor.fetchone()
     
-    # Total in progress
-    cursor.execute("""
-        SELECT COUNT(*) FROM user_character_progress 
-        WHERE user_id = ? AND is_learned = 0
-    """, (user_id,))
-    in_progress = cursor.fetchone()[0]
+    conn.close()
     
-    # Average proficiency
-    cursor.execute("""
-        SELECT AVG(proficiency) FROM user_character_progress 
-        WHERE user_id = ?
-    """, (user_id,))
-    avg_proficiency = cursor.fetchone()[0] or 0
+    return {
+        'learned': row['learned'],
+        'in_progress': row['in_progress'],
+        'average_proficiency': round(float(row['avg_proficiency'] or 0), 1),
+        'recent_activity': row['recent']
+    }
+
+
+# ==================== Character Photos ====================
+
+def save_character_photos(photos: List[Dict]) -> int:
+    """Upsert ingested source photos and link them to their character rows
+
+    Each photo dict carries source_path, source_hash, image_path, thumb_path,
+    width, height and an optional character (the Chinese character text).
+    """
+    if not photos:
+        return 0
+    
+    def write(cursor):
+        # Resolve all referenced characters to ids in one query
+        chars = sorted({p['character'] for p in photos if p.get('character')})
+        char_ids = {}
+        if chars:
+            placeholders = ', '.join(['?'] * len(chars))
+            cursor.execute(
+                f"SELECT id, character FROM characters WHERE character IN ({placeholders})",
+                chars
+            )
+            char_ids = {row['character']: row['id'] for row in cursor.fetchall()}
+        
+        cursor.executemany("""
+            INSERT INTO character_photos
+            (character_id, source_path, source_hash, image_path, thumb_path, width, height)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (source_path) DO UPDATE SET
+                character_id = EXCLUDED.character_id,
+                source_hash = EXCLUDED.source_hash,
+                image_path = EXCLUDED.image_path,
+                thumb_path = EXCLUDED.thumb_path,
+                width = EXCLUDED.width,
+                height = EXCLUDED.height,
+                updated_at = CURRENT_TIMESTAMP
+        """, [(
+            char_ids.get(p.get('character')),
+            p['source_path'],
+            p.get('source_hash'),
+            p.get('image_path'),
+            p.get('thumb_path'),
+            p.get('width'),
+            p.get('height')
+        ) for p in photos])
+    
+    try:
+        run_write(write)
+        return len(photos)
+    except Exception as e:
+        logger.error("Error saving character photos: %s", e)
+        return 0
+
+
+def get_character_photos(character_id: int) -> List[Dict]:
+    """Get ingested photos linked to a character"""
+    conn = get_db(readonly=True)
+    cursor = conn.cursor()
     
-    # Recent activity (last 7 days)
     cursor.execute("""
-        SELECT COUNT(*) FROM user_character_progress 
-        WHERE user_id = ? AND learned_date >= DATE('now', '-7 days')
-    """, (user_id,))
-    recent = cursor.fetchone()[0]
+        SELECT id, character_id, source_path, image_path, thumb_path, width, height, created_at
+        FROM character_photos
+        WHERE character_id = ?
+        ORDER BY source_path
+    """, (character_id,))
+    rows = cursor.fetchall()
+    conn.close()
+    
+    return [{
+        'id': row['id'],
+        'character_id': row['character_id'],
+        'source_path': row['source_path'],
+        'image_path': row['image_path'],
+        'thumb_path': row['thumb_path'],
+        'width': row['width'],
+        'height': row['height'],
+        'created_at': _format_datetime(row['created_at'])
+    } for row in rows]
+
+
+# ==================== AI Usage Accounting ====================
+
+def record_ai_usage(subject: str, operation: str, provider: str, model: str,
+                    prompt_tokens: int = 0, completion_tokens: int = 0, total_tokens: int = 0,
+                    latency_ms: int = 0, fields: Optional[List[str]] = None,
+                    character_id: Optional[int] = None) -> bool:
+    """Record token usage of one AI call (linked to the character card when it exists)"""
+    def write(cursor):
+        cursor.execute("""
+            INSERT INTO ai_usage
+            (character_id, subject, operation, fields, provider, model,
+             prompt_tokens, completion_tokens, total_tokens, latency_ms)
+            VALUES (COALESCE(?, (SELECT id FROM characters WHERE character = ?)),
+                    ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (character_id, subject, subject, operation,
+              ','.join(fields) if fields else None, provider, model,
+              prompt_tokens, completion_tokens, total_tokens, latency_ms))
     
+    try:
+        run_write(write)
+        return True
+    except Exception as e:
+        logger.error("Error recording AI usage: %s", e)
+        return False
+
+
+def get_ai_usage_summary(character_id: Optional[int] = None) -> List[Dict]:
+    """Aggregate token usage and latency per operation (optionally for one character)"""
+    conn = get_db(readonly=True)
+    cursor = conn.cursor()
+    
+    where = "WHERE character_id = ?" if character_id is not None else ""
+    params = (character_id,) if character_id is not None else ()
+    cursor.execute(f"""
+        SELECT operation,
+               COUNT(*) AS calls,
+               SUM(prompt_tokens) AS prompt_tokens,
+               SUM(completion_tokens) AS completion_tokens,
+               SUM(total_tokens) AS total_tokens,
+               AVG(total_tokens) AS avg_tokens,
+               AVG(latency_ms) AS avg_latency_ms
+        FROM ai_usage
+        {where}
+        GROUP BY operation
+        ORDER BY operation
+    """, params)
+    rows = cursor.fetchall()
     conn.close()
     
-    return {
-        'learned': learned,
-        'in_progress': in_progress,
-        'average_proficiency': round(avg_proficiency, 1),
-        'recent_activity': recent
-    }
+    return [{
+        'operation': row['operation'],
+        'calls': row['calls'],
+        'prompt_tokens': int(row['prompt_tokens'] or 0),
+        'completion_tokens': int(row['completion_tokens'] or 0),
+        'total_tokens': int(row['total_tokens'] or 0),
+        'avg_tokens': round(float(row['avg_tokens'] or 0), 1),
+        'avg_latency_ms': round(float(row['avg_latency_ms'] or 0), 1)
+    } for row in rows]
+
+
+# ==================== Instrumentation ====================
+# Keep this block last: it wraps every public function defined above with a
+# latency histogram (db_function_duration_seconds) for /metrics.
+
+metrics.instrument_module(globals(), __name__, exclude=('init_db',))
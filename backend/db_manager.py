@@ -1,11 +1,36 @@
 """
 Database Manager - PostgreSQL Primary (Neon)
 All environments (local, mirror, production) use Neon PostgreSQL
+
+Writes go through run_write(). On tuned SQLite that queues them to one writer
+thread, which blocks the caller until its group commit - so routes that write
+are plain `def` and run in the threadpool. The few writes still opening their
+own get_db() connection (schema setup, user accounts, migrations) rely on
+busy_timeout to wait for the writer's lock.
 """
+import functools
+import json
+import logging
+import logging.handlers
 import os
+import queue
+import re
 import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Callable, Optional, Dict, Any, List
+from urllib.parse import urlparse
+
+import metrics
+from metrics import DB_CONNECTIONS_OPENED
+from statements import Statement, to_pyformat
+
+logger = logging.getLogger(__name__)
 
 # Try to import psycopg2
 try:
@@ -23,11 +48,22 @@ DB_PATH = Path(__file__).parent / "data" / "chinese_learning.db"
 
 
 def get_db_type() -> str:
-    """Always use PostgreSQL as primary database"""
-    # Always return postgresql - we use Neon for all environments
+    """PostgreSQL (Neon) is the primary database
+
+    DATABASE_TYPE=sqlite switches to the local SQLite file (benchmarks, offline
+    development); SQLITE_PATH overrides its location.
+    """
+    if os.getenv('DATABASE_TYPE', '').lower() == 'sqlite':
+        return 'sqlite'
     return 'postgresql'
 
 
+def get_sqlite_path() -> Path:
+    """Location of the SQLite database file"""
+    env_path = os.getenv('SQLITE_PATH')
+    return Path(env_path) if env_path else DB_PATH
+
+
 def get_postgres_url() -> Optional[str]:
     """Get PostgreSQL connection URL
     Priority:
@@ -55,35 +91,311 @@ def get_postgres_url() -> Optional[str]:
     return DEFAULT_NEON_URL
 
 
-class PostgresCursorWrapper:
-    """Wrapper to convert SQLite-style ? placeholders to PostgreSQL %s"""
+# ==================== Query Instrumentation ====================
+
+# Statements slower than this (ms) get their plan written to the slow-query log
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '200'))
+# Capture a given statement's plan at most once per interval
+EXPLAIN_INTERVAL_SECONDS = 60
+SLOW_QUERY_LOG = Path(__file__).parent / "data" / "slow_queries.log"
+
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_RE = re.compile(r"%s|\?")
+_VALUE_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_REPEATED_ROWS_RE = re.compile(r"\(\?\.\.\.\)(?:\s*,\s*\(\?\.\.\.\))+")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+@functools.lru_cache(maxsize=2048)
+def fingerprint(sql: str) -> str:
+    """Normalize SQL so statements differing only in values or list lengths group together"""
+    text = _LITERAL_RE.sub('?', sql)
+    text = _NUMBER_RE.sub('?', text)
+    text = _PLACEHOLDER_RE.sub('?', text)
+    text = _VALUE_LIST_RE.sub('(?...)', text)
+    text = _REPEATED_ROWS_RE.sub('(?...), ...', text)
+    return _WHITESPACE_RE.sub(' ', text).strip()
+
+
+def _call_site() -> str:
+    """module.function that issued the statement
+
+    The first frame outside this module, however many cursor wrappers
+    (replica failover, preparing cursors) the call went through.
+    """
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename == __file__:
+        frame = frame.f_back
+    if frame is None:
+        return '?'
+    return f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_name}"
+
+
+class _StatementStats:
+    __slots__ = ('fingerprint', 'calls', 'total', 'max', 'rows', 'slow', 'call_sites', 'last_explain')
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.slow = 0
+        self.call_sites: Dict[str, int] = {}
+        self.last_explain = 0.0
+
+
+_query_stats: Dict[str, _StatementStats] = {}
+_query_stats_lock = threading.Lock()
+_slow_logger: Optional[logging.Logger] = None
+
+
+def _get_slow_logger() -> logging.Logger:
+    """Dedicated rotating file log, configured on first slow query"""
+    global _slow_logger
+    if _slow_logger is None:
+        slow_logger = logging.getLogger('slow_query')
+        slow_logger.propagate = False
+        if not slow_logger.handlers:
+            SLOW_QUERY_LOG.parent.mkdir(parents=True, exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                SLOW_QUERY_LOG, maxBytes=5 * 1024 * 1024, backupCount=3, encoding='utf-8'
+            )
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            slow_logger.addHandler(handler)
+        slow_logger.setLevel(logging.INFO)
+        _slow_logger = slow_logger
+    return _slow_logger
+
+
+def _explain(raw_cursor, dialect: str, sql: str, params, analyze: bool) -> str:
+    """Plan for a slow statement; ANALYZE only re-runs SELECTs (never writes)"""
+    conn = raw_cursor.connection
+    explain_cursor = conn.cursor()
+    try:
+        if dialect == 'postgresql':
+            prefix = "EXPLAIN (ANALYZE, BUFFERS) " if analyze else "EXPLAIN "
+            # A failed EXPLAIN must not abort the caller's transaction
+            use_savepoint = not conn.autocommit
+            if use_savepoint:
+                explain_cursor.execute("SAVEPOINT slow_query_explain")
+            try:
+                explain_cursor.execute(prefix + sql, params or None)
+                lines = [list(row.values())[0] if isinstance(row, dict) else row[0]
+                         for row in explain_cursor.fetchall()]
+            except Exception:
+                if use_savepoint:
+                    explain_cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+                raise
+            if use_savepoint:
+                explain_cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+        else:
+            explain_cursor.execute("EXPLAIN QUERY PLAN " + sql, params or ())
+            lines = [row[3] for row in explain_cursor.fetchall()]
+        return "\n".join(lines)
+    except Exception as e:
+        return f"EXPLAIN failed: {e}"
+    finally:
+        explain_cursor.close()
+
+
+def _record_statement(raw_cursor, dialect: str, sql: str, params, elapsed: float, rows: int,
+                      executed_sql: Optional[str] = None) -> _StatementStats:
+    """Accumulate per-fingerprint totals and log slow statements with their plan"""
+    key = fingerprint(sql)
+    call_site = _call_site()
+    now = time.time()
+    explain = False
+    with _query_stats_lock:
+        stats = _query_stats.get(key)
+        if stats is None:
+            stats = _query_stats[key] = _StatementStats(key)
+        stats.calls += 1
+        stats.total += elapsed
+        stats.max = max(stats.max, elapsed)
+        stats.rows += max(rows, 0)
+        stats.call_sites[call_site] = stats.call_sites.get(call_site, 0) + 1
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            stats.slow += 1
+            if now - stats.last_explain >= EXPLAIN_INTERVAL_SECONDS:
+                stats.last_explain = now
+                explain = True
+
+    if explain:
+        _get_slow_logger().info(json.dumps({
+            'ts': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+            'duration_ms': round(elapsed * 1000, 2),
+            'dialect': dialect,
+            'call_site': call_site,
+            'rows': rows if rows >= 0 else None,
+            'fingerprint': key,
+            'plan': _explain(raw_cursor, dialect, executed_sql or sql, params,
+                             analyze=sql.lstrip()[:6].upper() == 'SELECT'),
+        }, ensure_ascii=False))
+    return stats
+
+
+def get_query_stats(limit: int = 20, order_by: str = 'total') -> List[Dict[str, Any]]:
+    """Top statements by total (or mean/max/calls) time since startup"""
+    with _query_stats_lock:
+        snapshot = [
+            {
+                'fingerprint': s.fingerprint,
+                'calls': s.calls,
+                'total_ms': round(s.total * 1000, 2),
+                'mean_ms': round(s.total / s.calls * 1000, 3),
+                'max_ms': round(s.max * 1000, 2),
+                'rows': s.rows,
+                'slow_calls': s.slow,
+                'call_sites': dict(s.call_sites),
+            }
+            for s in _query_stats.values()
+        ]
+    sort_key = {'total': 'total_ms', 'mean': 'mean_ms', 'max': 'max_ms', 'calls': 'calls'}.get(order_by, 'total_ms')
+    snapshot.sort(key=lambda item: item[sort_key], reverse=True)
+    return snapshot[:limit]
+
+
+def reset_query_stats():
+    with _query_stats_lock:
+        _query_stats.clear()
+
+
+class _TimedCursor:
+    """Times every statement and counts the rows it touches or returns"""
+    dialect = ''
+
     def __init__(self, cursor):
         self.cursor = cursor
+        self._stats: Optional[_StatementStats] = None
+        self._count_fetches = False
     
-    def execute(self, query, params=None):
-        # Convert ? to %s for PostgreSQL
-        converted_query = query.replace('?', '%s')
-        if params:
-            return self.cursor.execute(converted_query, params)
-        return self.cursor.execute(converted_query)
+    def _observe(self, query, params, started, executed_sql=None):
+        elapsed = time.perf_counter() - started
+        rowcount = self.cursor.rowcount
+        self._stats = _record_statement(self.cursor, self.dialect, query, params, elapsed, rowcount, executed_sql)
+        # SQLite reports -1 for SELECT - count rows as they are fetched instead
+        self._count_fetches = rowcount < 0
+    
+    def _fetched(self, count: int):
+        if self._stats is not None and self._count_fetches:
+            with _query_stats_lock:
+                self._stats.rows += count
     
     def fetchone(self):
-        return self.cursor.fetchone()
+        row = self.cursor.fetchone()
+        if row is not None:
+            self._fetched(1)
+        return row
     
     def fetchall(self):
-        return self.cursor.fetchall()
+        rows = self.cursor.fetchall()
+        self._fetched(len(rows))
+        return rows
     
     def __getattr__(self, name):
         return getattr(self.cursor, name)
 
 
-class PostgresConnectionWrapper:
-    """Wrapper to return wrapped cursor"""
-    def __init__(self, conn):
+class PostgresCursorWrapper(_TimedCursor):
+    """Translates SQLite-style ? placeholders; runs registered statements as prepared statements"""
+    dialect = 'postgresql'
+    
+    def execute(self, query, params=None):
+        if not params:
+            # No parameters: psycopg2 sends the text verbatim (no % escaping needed)
+            sql = query
+        elif isinstance(query, Statement):
+            sql = self._prepared(query) or query.pyformat_sql
+        else:
+            sql = to_pyformat(query)
+        started = time.perf_counter()
+        if params:
+            result = self.cursor.execute(sql, params)
+        else:
+            result = self.cursor.execute(sql)
+        self._observe(query, params, started, sql)
+        return result
+    
+    def executemany(self, query, params_seq):
+        sql = query.pyformat_sql if isinstance(query, Statement) else to_pyformat(query)
+        started = time.perf_counter()
+        result = self.cursor.executemany(sql, params_seq)
+        self._observe(query, None, started, sql)
+        return result
+    
+    def _prepared(self, stmt: Statement) -> Optional[str]:
+        """EXECUTE text for stmt on this connection, preparing it first if needed"""
+        conn = self.cursor.connection
+        cache = getattr(conn, 'prepared', None)
+        if cache is None or stmt.name in _unpreparable:
+            return None
+        if stmt.prepared_name in cache:
+            cache.move_to_end(stmt.prepared_name)
+            return stmt.execute_sql
+        if not _prepare(conn, stmt):
+            return None
+        cache[stmt.prepared_name] = True
+        while len(cache) > PREPARED_CACHE_SIZE:
+            evicted, _ = cache.popitem(last=False)
+            with conn.cursor() as cursor:
+                cursor.execute(f"DEALLOCATE {evicted}")
+        return stmt.execute_sql
+
+
+# Statements the server could not prepare (e.g. untyped parameters) run unprepared
+_unpreparable = set()
+
+
+def _prepare(conn, stmt: Statement) -> bool:
+    """PREPARE stmt on conn without disturbing the caller's transaction"""
+    in_transaction = conn.status != psycopg2.extensions.STATUS_READY
+    with conn.cursor() as cursor:
+        try:
+            if in_transaction:
+                cursor.execute("SAVEPOINT prepare_statement")
+            cursor.execute(f"PREPARE {stmt.prepared_name} AS {stmt.prepare_sql}")
+            if in_transaction:
+                cursor.execute("RELEASE SAVEPOINT prepare_statement")
+            return True
+        except psycopg2.Error as e:
+            if in_transaction:
+                cursor.execute("ROLLBACK TO SAVEPOINT prepare_statement")
+            else:
+                conn.rollback()
+            _unpreparable.add(stmt.name)
+            logger.warning("Cannot prepare statement %s, running it unprepared: %s", stmt.name, e)
+            return False
+
+
+class SQLiteCursorWrapper(_TimedCursor):
+    """Timing wrapper for sqlite3 cursors"""
+    dialect = 'sqlite'
+    
+    def execute(self, query, params=()):
+        started = time.perf_counter()
+        self.cursor.execute(query, params)
+        self._observe(query, params, started)
+        return self
+    
+    def executemany(self, query, params_seq):
+        started = time.perf_counter()
+        self.cursor.executemany(query, params_seq)
+        self._observe(query, None, started)
+        return self
+
+
+class _ConnectionWrapper:
+    """Wrapper to return wrapped cursor; close() hands pooled connections back"""
+    cursor_class = None
+    
+    def __init__(self, conn, pool=None):
         self.conn = conn
+        self.pool = pool
+        self._released = False
     
     def cursor(self):
-        return PostgresCursorWrapper(self.conn.cursor())
+        return self.cursor_class(self.conn.cursor())
     
     def commit(self):
         return self.conn.commit()
@@ -92,14 +404,521 @@ class PostgresConnectionWrapper:
         return self.conn.rollback()
     
     def close(self):
-        return self.conn.close()
+        """Return the connection to its pool (or close it when unpooled)"""
+        if self._released:
+            return
+        self._released = True
+        if self.pool is not None:
+            self.pool.release(self.conn)
+        else:
+            self.conn.close()
+    
+    def __del__(self):
+        # Callers that raise before close() must not leak pool slots
+        if 'conn' in self.__dict__:
+            try:
+                self.close()
+            except Exception:
+                pass
     
     def __getattr__(self, name):
         return getattr(self.conn, name)
 
 
-def get_db():
-    """Get database connection (SQLite or PostgreSQL) - returns connection directly"""
+class PostgresConnectionWrapper(_ConnectionWrapper):
+    cursor_class = PostgresCursorWrapper
+
+
+class SQLiteConnectionWrapper(_ConnectionWrapper):
+    cursor_class = SQLiteCursorWrapper
+
+
+# ==================== PostgreSQL Connection Pool ====================
+
+# Pooled connections per database URL (0 = open a new connection per get_db call)
+POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX', '10'))
+# Idle connections older than this are reopened (Neon drops idle connections after ~5 min)
+POOL_RECYCLE_SECONDS = float(os.getenv('DB_POOL_RECYCLE_SECONDS', '240'))
+POOL_TIMEOUT_SECONDS = 30
+# Prepared statements kept per connection (least recently used are DEALLOCATEd)
+PREPARED_CACHE_SIZE = int(os.getenv('DB_PREPARED_CACHE_SIZE', '64'))
+
+
+def prepared_statements_enabled(url: str) -> bool:
+    """DB_PREPARED_STATEMENTS=on/off/auto (default auto)
+
+    auto disables them for Neon '-pooler' hosts: PgBouncer in transaction mode
+    does not keep SQL-level PREPAREd statements across transactions.
+    """
+    mode = os.getenv('DB_PREPARED_STATEMENTS', 'auto').lower()
+    if mode in ('on', 'true', '1'):
+        return True
+    if mode in ('off', 'false', '0'):
+        return False
+    return '-pooler' not in (urlparse(url).hostname or '')
+
+
+if POSTGRES_AVAILABLE:
+    class PreparingConnection(psycopg2.extensions.connection):
+        """psycopg2 connection that remembers which statements it has PREPAREd"""
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.prepared: "OrderedDict[str, bool]" = OrderedDict()
+
+
+class PostgresPool:
+    """Bounded LIFO pool of PostgreSQL connections for one URL"""
+    
+    def __init__(self, url: str, max_size: int = POOL_MAX_SIZE, recycle_seconds: float = POOL_RECYCLE_SECONDS):
+        self.url = url
+        self.max_size = max_size
+        self.recycle_seconds = recycle_seconds
+        self.prepared = prepared_statements_enabled(url)
+        self.label = f"{urlparse(url).hostname}:{urlparse(url).port or 5432}"
+        self._idle: List[tuple] = []  # [(connection, returned_at)]
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self.in_use = 0
+    
+    def _connect(self):
+        conn = psycopg2.connect(self.url, connection_factory=PreparingConnection if self.prepared else None)
+        DB_CONNECTIONS_OPENED.inc(db_type='postgresql')
+        # Use RealDictCursor for dictionary-like access
+        conn.cursor_factory = RealDictCursor
+        return conn
+    
+    def acquire(self):
+        if not self._slots.acquire(timeout=POOL_TIMEOUT_SECONDS):
+            raise RuntimeError(f"PostgreSQL connection pool exhausted ({self.max_size} in use)")
+        try:
+            conn = None
+            stale = []
+            now = time.monotonic()
+            with self._lock:
+                while self._idle:
+                    candidate, returned_at = self._idle.pop()
+                    if candidate.closed or now - returned_at > self.recycle_seconds:
+                        stale.append(candidate)
+                        continue
+                    conn = candidate
+                    break
+                self.in_use += 1
+            for old in stale:
+                try:
+                    old.close()
+                except Exception:
+                    pass
+            return conn if conn is not None else self._connect()
+        except BaseException:
+            with self._lock:
+                self.in_use -= 1
+            self._slots.release()
+            raise
+    
+    def release(self, conn):
+        try:
+            if not conn.closed and conn.status != psycopg2.extensions.STATUS_READY:
+                conn.rollback()  # End whatever the caller left open (reads never commit)
+            if not conn.closed:
+                with self._lock:
+                    self._idle.append((conn, time.monotonic()))
+        except Exception:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._slots.release()
+    
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'idle': len(self._idle), 'in_use': self.in_use, 'max': self.max_size}
+
+
+_pools: Dict[str, PostgresPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(url: str) -> PostgresPool:
+    with _pools_lock:
+        pool = _pools.get(url)
+        if pool is None:
+            pool = _pools[url] = PostgresPool(url)
+        return pool
+
+
+def get_pool_stats() -> Dict[str, Dict[str, int]]:
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {pool.label: pool.stats() for pool in pools}
+
+
+def _pool_series():
+    series = {}
+    for label, stats in get_pool_stats().items():
+        series[(label, 'idle')] = stats['idle']
+        series[(label, 'in_use')] = stats['in_use']
+    return series
+
+
+metrics.gauge("db_pool_connections", "PostgreSQL pool connections by state", ["pool", "state"],
+              callback=_pool_series)
+
+
+def connect_postgres(url: str) -> PostgresConnectionWrapper:
+    """Pooled connection to url (or a fresh one when DB_POOL_MAX=0)"""
+    if POOL_MAX_SIZE <= 0:
+        conn = psycopg2.connect(url)
+        DB_CONNECTIONS_OPENED.inc(db_type='postgresql')
+        conn.cursor_factory = RealDictCursor
+        return PostgresConnectionWrapper(conn)
+    pool = get_pool(url)
+    return PostgresConnectionWrapper(pool.acquire(), pool)
+
+
+# ==================== SQLite Profile ====================
+
+# SQLITE_TUNED=0 falls back to one default-journal connection per call
+SQLITE_TUNED = os.getenv('SQLITE_TUNED', '1') != '0'
+# Idle read-only connections kept per database file
+SQLITE_READERS = int(os.getenv('SQLITE_READERS', '8'))
+# Most queued writes applied in one group commit
+WRITE_BATCH_MAX = 256
+
+SQLITE_PRAGMAS = [
+    "PRAGMA synchronous = NORMAL",     # WAL makes NORMAL crash-safe; no fsync per commit
+    "PRAGMA busy_timeout = 5000",      # Wait for locks instead of failing with "database is locked"
+    "PRAGMA cache_size = -65536",      # 64 MB page cache
+    "PRAGMA mmap_size = 268435456",    # 256 MB memory-mapped reads
+    "PRAGMA temp_store = MEMORY",
+]
+
+WRITE_BATCH_SIZE = metrics.histogram(
+    "sqlite_write_batch_size", "Writes applied per SQLite group commit", [],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+
+_wal_ready = set()
+_wal_lock = threading.Lock()
+
+
+def _ensure_wal(path: Path):
+    """Switch the file to WAL once (the journal mode persists in the database)"""
+    key = str(path)
+    if key in _wal_ready:
+        return
+    with _wal_lock:
+        if key not in _wal_ready:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(key)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.close()
+            _wal_ready.add(key)
+
+
+def _open_sqlite(path: Path, readonly: bool = False, **kwargs) -> sqlite3.Connection:
+    if readonly:
+        conn = sqlite3.connect(path.resolve().as_uri() + "?mode=ro", uri=True, **kwargs)
+    else:
+        conn = sqlite3.connect(str(path), **kwargs)
+    DB_CONNECTIONS_OPENED.inc(db_type='sqlite')
+    conn.row_factory = sqlite3.Row
+    if SQLITE_TUNED:
+        for pragma in SQLITE_PRAGMAS:
+            conn.execute(pragma)
+    return conn
+
+
+class SQLiteReaderPool:
+    """Reusable read-only connections; readers never block the writer under WAL"""
+    
+    def __init__(self, path: Path, max_idle: int = SQLITE_READERS):
+        self.path = path
+        self.max_idle = max_idle
+        self._idle: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+    
+    def acquire(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        # Connections move between request threads, so allow cross-thread use
+        return _open_sqlite(self.path, readonly=True, check_same_thread=False)
+    
+    def release(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+
+class SQLiteWriter:
+    """Single writer thread applying queued write functions in group commits
+
+    Each function runs inside its own SAVEPOINT, so a failing write is rolled
+    back alone while the rest of the batch commits.
+    """
+    
+    def __init__(self, path: Path):
+        self.path = path
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=f"sqlite-writer-{path.name}", daemon=True)
+        self._thread.start()
+    
+    def submit(self, fn: Callable) -> Future:
+        future = Future()
+        self._queue.put((fn, future))
+        return future
+    
+    def _run(self):
+        conn = _open_sqlite(self.path)
+        conn.isolation_level = None  # Explicit BEGIN/COMMIT below
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < WRITE_BATCH_MAX:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._apply(conn, batch)
+    
+    def _apply(self, conn: sqlite3.Connection, batch: List[tuple]):
+        cursor = SQLiteCursorWrapper(conn.cursor())
+        outcomes = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for fn, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT write_item")
+                try:
+                    outcomes.append((future, fn(cursor), None))
+                    conn.execute("RELEASE SAVEPOINT write_item")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO SAVEPOINT write_item")
+                    conn.execute("RELEASE SAVEPOINT write_item")
+                    outcomes.append((future, None, e))
+            conn.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        WRITE_BATCH_SIZE.observe(len(batch))
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+    
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+
+_sqlite_readers: Dict[str, SQLiteReaderPool] = {}
+_sqlite_writers: Dict[str, SQLiteWriter] = {}
+_sqlite_lock = threading.Lock()
+
+
+def _get_reader_pool(path: Path) -> SQLiteReaderPool:
+    with _sqlite_lock:
+        pool = _sqlite_readers.get(str(path))
+        if pool is None:
+            pool = _sqlite_readers[str(path)] = SQLiteReaderPool(path)
+        return pool
+
+
+def _get_writer(path: Path) -> SQLiteWriter:
+    with _sqlite_lock:
+        writer = _sqlite_writers.get(str(path))
+        if writer is None:
+            writer = _sqlite_writers[str(path)] = SQLiteWriter(path)
+        return writer
+
+
+def connect_sqlite(readonly: bool = False) -> SQLiteConnectionWrapper:
+    path = get_sqlite_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if not SQLITE_TUNED:
+        return SQLiteConnectionWrapper(_open_sqlite(path))
+    _ensure_wal(path)
+    if readonly:
+        pool = _get_reader_pool(path)
+        return SQLiteConnectionWrapper(pool.acquire(), pool)
+    return SQLiteConnectionWrapper(_open_sqlite(path))
+
+
+def run_write(fn: Callable):
+    """Run fn(cursor) in a committed write transaction and return its result
+
+    On tuned SQLite the call is queued to the single writer thread and
+    group-committed with other pending writes; fn must not commit itself.
+    """
+    if get_db_type() == 'sqlite' and SQLITE_TUNED:
+        path = get_sqlite_path()
+        _ensure_wal(path)
+        return _get_writer(path).submit(fn).result()
+    
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        result = fn(cursor)
+        conn.commit()
+        return result
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+# ==================== Read Replicas ====================
+
+# After a user's write, their reads stay on the primary this long (covers replica lag)
+REPLICA_STICKY_SECONDS = float(os.getenv('DB_REPLICA_STICKY_SECONDS', '10'))
+# A failed replica is skipped for this long before it is tried again
+REPLICA_RETRY_SECONDS = 30
+
+DB_READS = metrics.counter(
+    "db_reads_routed_total", "Read-only connections by target", ["target"]
+)
+DB_REPLICA_FAILOVERS = metrics.counter(
+    "db_replica_failovers_total", "Reads moved from a failing replica to the primary", ["replica"]
+)
+
+
+def get_replica_urls() -> List[str]:
+    """Read replica URLs from DATABASE_REPLICA_URLS (comma-separated)"""
+    return [url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+
+
+class ReplicaRouter:
+    """Round-robin over healthy replicas with per-user read-your-writes stickiness"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counter = 0
+        self._down_until: Dict[str, float] = {}
+        self._sticky_until: Dict[Any, float] = {}
+    
+    def note_write(self, user_id):
+        """Pin user_id's reads to the primary for REPLICA_STICKY_SECONDS"""
+        now = time.monotonic()
+        with self._lock:
+            if len(self._sticky_until) > 10000:
+                self._sticky_until = {k: t for k, t in self._sticky_until.items() if t > now}
+            self._sticky_until[user_id] = now + REPLICA_STICKY_SECONDS
+    
+    def is_sticky(self, user_id) -> bool:
+        with self._lock:
+            return self._sticky_until.get(user_id, 0) > time.monotonic()
+    
+    def pick(self, urls: List[str]) -> Optional[str]:
+        now = time.monotonic()
+        with self._lock:
+            healthy = [url for url in urls if self._down_until.get(url, 0) <= now]
+            if not healthy:
+                return None
+            self._counter += 1
+            return healthy[self._counter % len(healthy)]
+    
+    def mark_down(self, url: str):
+        with self._lock:
+            self._down_until[url] = time.monotonic() + REPLICA_RETRY_SECONDS
+
+
+replica_router = ReplicaRouter()
+
+
+def note_user_write(user_id):
+    """Call after committing a user's write so their next reads see it"""
+    if get_replica_urls():
+        replica_router.note_write(user_id)
+
+
+class ReplicaCursorWrapper(PostgresCursorWrapper):
+    """Re-runs a statement on the primary when the replica connection fails"""
+    
+    def __init__(self, cursor, owner: "ReplicaConnectionWrapper"):
+        super().__init__(cursor)
+        self.owner = owner
+    
+    def execute(self, query, params=None):
+        try:
+            return super().execute(query, params)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            if not self.owner.fail_over(e):
+                raise
+            self.cursor = self.owner.conn.cursor()
+            return super().execute(query, params)
+
+
+class ReplicaConnectionWrapper(PostgresConnectionWrapper):
+    """Read-only connection to a replica that can fall back to the primary"""
+    
+    def __init__(self, conn, pool, replica_url: str, primary_url: str):
+        super().__init__(conn, pool)
+        self.replica_url = replica_url
+        self.primary_url = primary_url
+        self.on_replica = True
+    
+    def cursor(self):
+        return ReplicaCursorWrapper(self.conn.cursor(), self)
+    
+    def fail_over(self, error) -> bool:
+        """Swap the broken replica connection for a primary one"""
+        if not self.on_replica:
+            return False
+        logger.warning("Replica %s failed, reading from primary: %s", self.pool.label, error)
+        replica_router.mark_down(self.replica_url)
+        DB_REPLICA_FAILOVERS.inc(replica=self.pool.label)
+        self.pool.release(self.conn)
+        self.pool = get_pool(self.primary_url)
+        self.conn = self.pool.acquire()
+        self.on_replica = False
+        return True
+
+
+def _connect_read(primary_url: str, user_id=None):
+    """Route a read-only connection: replica unless sticky, down or unpooled"""
+    replica_urls = get_replica_urls()
+    if not replica_urls or POOL_MAX_SIZE <= 0:
+        return connect_postgres(primary_url)
+    if user_id is not None and replica_router.is_sticky(user_id):
+        DB_READS.inc(target='primary_sticky')
+        return connect_postgres(primary_url)
+    
+    replica_url = replica_router.pick(replica_urls)
+    if replica_url is not None:
+        pool = get_pool(replica_url)
+        try:
+            conn = pool.acquire()
+        except psycopg2.OperationalError as e:
+            logger.warning("Replica %s unavailable, reading from primary: %s", pool.label, e)
+            replica_router.mark_down(replica_url)
+            DB_REPLICA_FAILOVERS.inc(replica=pool.label)
+        else:
+            DB_READS.inc(target='replica')
+            return ReplicaConnectionWrapper(conn, pool, replica_url, primary_url)
+    DB_READS.inc(target='primary')
+    return connect_postgres(primary_url)
+
+
+def get_db(readonly: bool = False, user_id=None):
+    """Get database connection (SQLite or PostgreSQL) - returns connection directly
+
+    readonly=True marks connections that only read: on SQLite they come from
+    the read-only pool, on PostgreSQL they go to a read replica when
+    DATABASE_REPLICA_URLS is set. Pass the user_id whose data is read so
+    that user's reads stay on the primary right after their own writes.
+    """
     db_type = get_db_type()
     
     if db_type == 'postgresql':
@@ -110,16 +929,11 @@ def get_db():
         if not url:
             raise RuntimeError("PostgreSQL URL not configured in settings")
         
-        conn = psycopg2.connect(url)
-        # Use RealDictCursor for dictionary-like access
-        conn.cursor_factory = RealDictCursor
-        return PostgresConnectionWrapper(conn)
+        if readonly:
+            return _connect_read(url, user_id)
+        return connect_postgres(url)
     else:
-        # SQLite
-        DB_PATH.parent.mkdir(exist_ok=True)
-        conn = sqlite3.connect(str(DB_PATH))
-        conn.row_factory = sqlite3.Row
-        return conn
+        return connect_sqlite(readonly)
 
 
 def init_postgres_tables(cursor):
@@ -216,6 +1030,145 @@ def init_postgres_tables(cursor):
         )
     """)
     
+    # Source photos ingested from the Data/YYYY/MM archive
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS character_photos (
+            id SERIAL PRIMARY KEY,
+            character_id INTEGER REFERENCES characters(id) ON DELETE SET NULL,
+            source_path TEXT NOT NULL UNIQUE,
+            source_hash TEXT,
+            image_path TEXT,
+            thumb_path TEXT,
+            width INTEGER,
+            height INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_character_photos_character ON character_photos(character_id)")
+    
+    # Token usage per AI generation call
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ai_usage (
+            id SERIAL PRIMARY KEY,
+            character_id INTEGER REFERENCES characters(id) ON DELETE SET NULL,
+            subject TEXT,
+            operation TEXT NOT NULL,
+            fields TEXT,
+            provider TEXT,
+            model TEXT,
+            prompt_tokens INTEGER DEFAULT 0,
+            completion_tokens INTEGER DEFAULT 0,
+            total_tokens INTEGER DEFAULT 0,
+            latency_ms INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ai_usage_character ON ai_usage(character_id)")
+    
+    # Full-text search documents (maintained by search_index.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS search_documents (
+            doc_type TEXT NOT NULL,
+            doc_id INTEGER NOT NULL,
+            title TEXT,
+            body TEXT,
+            tsv TSVECTOR GENERATED ALWAYS AS (
+                setweight(to_tsvector('simple', COALESCE(title, '')), 'A') ||
+                setweight(to_tsvector('simple', COALESCE(body, '')), 'B')
+            ) STORED,
+            PRIMARY KEY (doc_type, doc_id)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_search_documents_tsv ON search_documents USING GIN (tsv)")
+    
+    # Browse facets per character (maintained by character_facets.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS character_facets (
+            character_id INTEGER PRIMARY KEY REFERENCES characters(id) ON DELETE CASCADE,
+            radical TEXT,
+            stroke_count INTEGER,
+            pinyin_toneless TEXT,
+            pinyin_numbered TEXT,
+            tone INTEGER
+        )
+    """)
+    for column in ('radical', 'stroke_count', 'pinyin_toneless', 'tone'):
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_character_facets_{column} ON character_facets({column})")
+    
+    # Related-character adjacency list (maintained by character_graph.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS character_edges (
+            source_id INTEGER NOT NULL REFERENCES characters(id) ON DELETE CASCADE,
+            source TEXT NOT NULL,
+            target TEXT NOT NULL,
+            relation TEXT NOT NULL,
+            weight INTEGER DEFAULT 1,
+            PRIMARY KEY (source_id, relation, target)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_character_edges_source ON character_edges(source, relation)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_character_edges_target ON character_edges(target, relation)")
+    
+    # One row per word listed in a card's word_groups (maintained by character_word_groups.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS character_word_groups (
+            id SERIAL PRIMARY KEY,
+            character_id INTEGER NOT NULL REFERENCES characters(id) ON DELETE CASCADE,
+            tone_key TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            word TEXT NOT NULL,
+            word_id INTEGER REFERENCES words(id) ON DELETE SET NULL,
+            UNIQUE (character_id, tone_key, position)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_character_word_groups_word ON character_word_groups(word)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_character_word_groups_word_id ON character_word_groups(word_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_words_word ON words(word)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_words_character ON words(character_id)")
+    
+    # Content change log - seq is the offline bundle version (see content_bundle.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS content_changes (
+            seq BIGSERIAL PRIMARY KEY,
+            entity TEXT NOT NULL,
+            entity_id INTEGER NOT NULL,
+            changed_at DOUBLE PRECISION NOT NULL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_content_changes_changed_at ON content_changes(changed_at)")
+    
+    # Append-only review history, partitioned by month (see review_log.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS review_events (
+            user_id INTEGER NOT NULL,
+            character_id INTEGER NOT NULL,
+            reviewed_at TIMESTAMP NOT NULL,
+            is_learned BOOLEAN,
+            proficiency INTEGER
+        ) PARTITION BY RANGE (reviewed_at)
+    """)
+    cursor.execute("CREATE TABLE IF NOT EXISTS review_events_default PARTITION OF review_events DEFAULT")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_review_events_user ON review_events(user_id, reviewed_at)")
+    import review_log
+    review_log.ensure_partitions(cursor)
+
+    # Per-user daily totals for the progress dashboard (see learning_rollups.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_daily_rollups (
+            user_id INTEGER NOT NULL,
+            day DATE NOT NULL,
+            reviews INTEGER NOT NULL DEFAULT 0,
+            new_learned INTEGER NOT NULL DEFAULT 0,
+            sessions INTEGER NOT NULL DEFAULT 0,
+            seconds_practiced INTEGER NOT NULL DEFAULT 0,
+            sentences_practiced INTEGER NOT NULL DEFAULT 0,
+            proficiency_sum INTEGER NOT NULL DEFAULT 0,
+            proficiency_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day)
+        )
+    """)
+    
     # Insert default user
     cursor.execute("""
         INSERT INTO users (id, username, display_name)
@@ -240,7 +1193,7 @@ def init_db():
     conn.commit()
     conn.close()
     
-    print(f"✅ Database initialized ({db_type})")
+    logger.info("Database initialized (%s)", db_type)
 
 
 def _init_sqlite_tables(cursor):
@@ -342,6 +1295,136 @@ def _init_sqlite_tables(cursor):
         )
     """)
     
+    # Source photos ingested from the Data/YYYY/MM archive
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS character_photos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            character_id INTEGER,
+            source_path TEXT NOT NULL UNIQUE,
+            source_hash TEXT,
+            image_path TEXT,
+            thumb_path TEXT,
+            width INTEGER,
+            height INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (character_id) REFERENCES characters(id)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_character_photos_character ON character_photos(character_id)")
+    
+    # Token usage per AI generation call
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ai_usage (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            character_id INTEGER,
+            subject TEXT,
+            operation TEXT NOT NULL,
+            fields TEXT,
+            provider TEXT,
+            model TEXT,
+            prompt_tokens INTEGER DEFAULT 0,
+            completion_tokens INTEGER DEFAULT 0,
+            total_tokens INTEGER DEFAULT 0,
+            latency_ms INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (character_id) REFERENCES characters(id)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ai_usage_character ON ai_usage(character_id)")
+    
+    # Full-text search documents (maintained by search_index.py; text is pre-tokenized)
+    cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(title, body)")
+    
+    # Browse facets per character (maintained by character_facets.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS character_facets (
+            character_id INTEGER PRIMARY KEY,
+            radical TEXT,
+            stroke_count INTEGER,
+            pinyin_toneless TEXT,
+            pinyin_numbered TEXT,
+            tone INTEGER,
+            FOREIGN KEY (character_id) REFERENCES characters(id)
+        )
+    """)
+    for column in ('radical', 'stroke_count', 'pinyin_toneless', 'tone'):
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_character_facets_{column} ON character_facets({column})")
+    
+    # Related-character adjacency list (maintained by character_graph.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS character_edges (
+            source_id INTEGER NOT NULL,
+            source TEXT NOT NULL,
+            target TEXT NOT NULL,
+            relation TEXT NOT NULL,
+            weight INTEGER DEFAULT 1,
+            PRIMARY KEY (source_id, relation, target),
+            FOREIGN KEY (source_id) REFERENCES characters(id)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_character_edges_source ON character_edges(source, relation)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_character_edges_target ON character_edges(target, relation)")
+    
+    # One row per word listed in a card's word_groups (maintained by character_word_groups.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS character_word_groups (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            character_id INTEGER NOT NULL,
+            tone_key TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            word TEXT NOT NULL,
+            word_id INTEGER,
+            UNIQUE (character_id, tone_key, position),
+            FOREIGN KEY (character_id) REFERENCES characters(id),
+            FOREIGN KEY (word_id) REFERENCES words(id)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_character_word_groups_word ON character_word_groups(word)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_character_word_groups_word_id ON character_word_groups(word_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_words_word ON words(word)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_words_character ON words(character_id)")
+    
+    # Content change log - seq is the offline bundle version (see content_bundle.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS content_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity TEXT NOT NULL,
+            entity_id INTEGER NOT NULL,
+            changed_at REAL NOT NULL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_content_changes_changed_at ON content_changes(changed_at)")
+    
+    # Append-only review history (see review_log.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS review_events (
+            user_id INTEGER NOT NULL,
+            character_id INTEGER NOT NULL,
+            reviewed_at TIMESTAMP NOT NULL,
+            is_learned BOOLEAN,
+            proficiency INTEGER
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_review_events_user ON review_events(user_id, reviewed_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_review_events_reviewed_at ON review_events(reviewed_at)")
+
+    # Per-user daily totals for the progress dashboard (see learning_rollups.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_daily_rollups (
+            user_id INTEGER NOT NULL,
+            day DATE NOT NULL,
+            reviews INTEGER NOT NULL DEFAULT 0,
+            new_learned INTEGER NOT NULL DEFAULT 0,
+            sessions INTEGER NOT NULL DEFAULT 0,
+            seconds_practiced INTEGER NOT NULL DEFAULT 0,
+            sentences_practiced INTEGER NOT NULL DEFAULT 0,
+            proficiency_sum INTEGER NOT NULL DEFAULT 0,
+            proficiency_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day)
+        )
+    """)
+    
     # Insert default user
     cursor.execute("""
         INSERT OR IGNORE INTO users (id, username, display_name) 
@@ -1,13 +1,36 @@
 """
-Generate character illustration images using PIL
+Batch-render character illustration images using PIL
+
+Reads every character and its illustration_desc from the database, skips
+outputs whose content hash (character, description and renderer source) is
+unchanged, renders the rest across a multiprocessing pool and writes the image
+paths back in bulk.
+
+Usage:
+    python generate_char_images.py                  # render new/changed illustrations
+    python generate_char_images.py --force          # re-render everything
+    python generate_char_images.py --characters 把 爸
+    python generate_char_images.py --replace-existing   # also replace uploaded/AI images
 """
 from PIL import Image, ImageDraw, ImageFont
+import argparse
+import hashlib
+import json
+import math
 import os
+import random
+import sys
+import time
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from image_generator import generate_simple_image
 
 OUTPUT_DIR = os.path.join(os.path.dirname(__file__), '..', 'frontend', 'public', 'images', 'characters')
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+MANIFEST_FILE = Path(__file__).parent / "data" / "illustration_manifest.json"
 
-def create_illustration_ba():
+def create_illustration_ba(output_path: str):
     """Generate illustration for 把 - a hand holding/grasping"""
     img = Image.new('RGB', (400, 400), color='#FFF5F5')
     draw = ImageDraw.Draw(img)
@@ -43,11 +66,10 @@ def create_illustration_ba():
         draw.ellipse([x, y, x+15, y+15], fill='#FFB6C1')
     
     # Save
-    img.save(os.path.join(OUTPUT_DIR, 'ba_illustration.png'))
-    print("✅ Generated illustration for 把")
+    img.save(output_path)
 
 
-def create_illustration_ba_father():
+def create_illustration_ba_father(output_path: str):
     """Generate illustration for 爸 - father figure"""
     img = Image.new('RGB', (400, 400), color='#FFF8F0')
     draw = ImageDraw.Draw(img)
@@ -97,11 +119,10 @@ def create_illustration_ba_father():
         draw.polygon([(hx+15, hy+5), (hx+25, hy+15), (hx+15, hy+25), (hx+5, hy+15)],
                      fill='#FF69B4')
     
-    img.save(os.path.join(OUTPUT_DIR, 'ba_father_illustration.png'))
-    print("✅ Generated illustration for 爸")
+    img.save(output_path)
 
 
-def create_illustration_bai():
+def create_illustration_bai(output_path: str):
     """Generate illustration for 百 - ruler with grains"""
     img = Image.new('RGB', (400, 400), color='#FFFAF0')
     draw = ImageDraw.Draw(img)
@@ -138,10 +159,10 @@ def create_illustration_bai():
         draw.ellipse([gx, gy, gx + 20, gy + 25], fill=color, outline='#B8860B', width=1)
     
     # More grains scattered around to represent "hundred"
+    rng = random.Random(ord('百'))
     for i in range(20):
-        import random
-        gx = random.randint(180, 350)
-        gy = random.randint(250, 380)
+        gx = rng.randint(180, 350)
+        gy = rng.randint(250, 380)
         draw.ellipse([gx, gy, gx + 15, gy + 18], fill='#FFD700', outline='#DAA520', width=1)
     
     # Text annotation
@@ -155,25 +176,176 @@ def create_illustration_bai():
         color = flower_colors[i % len(flower_colors)]
         # Simple flower
         for angle in range(0, 360, 60):
-            import math
             rad = math.radians(angle)
             px = fx + 20 + int(15 * math.cos(rad))
             py = fy + 20 + int(15 * math.sin(rad))
             draw.ellipse([px-8, py-8, px+8, py+8], fill=color)
         draw.ellipse([fx+12, fy+12, fx+28, fy+28], fill='#FFD700')
     
-    img.save(os.path.join(OUTPUT_DIR, 'bai_illustration.png'))
-    print("✅ Generated illustration for 百")
+    img.save(output_path)
+
+
+# Hand-drawn illustrations take precedence over the generic renderer
+CUSTOM_RENDERERS = {
+    '把': ('ba_illustration.png', create_illustration_ba),
+    '爸': ('ba_father_illustration.png', create_illustration_ba_father),
+    '百': ('bai_illustration.png', create_illustration_bai),
+}
+
+
+def _renderer_fingerprint() -> str:
+    """Hash of the renderer source, so a style change invalidates every output"""
+    digest = hashlib.sha1()
+    for source in (__file__, generate_simple_image.__code__.co_filename):
+        with open(source, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def content_hash(character: str, description: str, renderer_fingerprint: str) -> str:
+    """Content hash of everything that determines an illustration's pixels"""
+    payload = json.dumps([character, description, renderer_fingerprint], ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def load_manifest() -> Dict[str, Dict]:
+    """Load the render manifest (character -> content hash and image path)"""
+    if MANIFEST_FILE.exists():
+        try:
+            with open(MANIFEST_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Error loading manifest, starting fresh: {e}")
+    return {}
+
+
+def save_manifest(manifest: Dict[str, Dict]):
+    """Save the render manifest atomically"""
+    MANIFEST_FILE.parent.mkdir(exist_ok=True)
+    tmp_file = MANIFEST_FILE.with_suffix('.json.tmp')
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, MANIFEST_FILE)
+
+
+def expected_image_path(character: str) -> str:
+    """Web path this tool writes for a character"""
+    if character in CUSTOM_RENDERERS:
+        filename = CUSTOM_RENDERERS[character][0]
+    else:
+        filename = f"{character}_ai_generated.png"
+    return f"/images/characters/{filename}"
+
+
+def render_illustration(job: Dict) -> Dict:
+    """Render one character illustration (runs in a worker process)"""
+    character = job['character']
+    try:
+        if character in CUSTOM_RENDERERS:
+            filename, renderer = CUSTOM_RENDERERS[character]
+            renderer(os.path.join(OUTPUT_DIR, filename))
+            image_path = f"/images/characters/{filename}"
+        else:
+            image_path = generate_simple_image(character, job['illustration_desc'], OUTPUT_DIR)
+        return {**job, 'image_path': image_path, 'error': None}
+    except Exception as e:
+        return {**job, 'image_path': None, 'error': str(e)}
+
+
+def plan_jobs(characters: List[Dict], manifest: Dict[str, Dict], force: bool = False,
+              replace_existing: bool = False) -> List[Dict]:
+    """Pick the characters whose illustration is missing or out of date"""
+    fingerprint = _renderer_fingerprint()
+    jobs = []
+
+    for row in characters:
+        character = row['character']
+        digest = content_hash(character, row['illustration_desc'], fingerprint)
+        image_path = expected_image_path(character)
+        current_image = row['illustration_image']
+
+        # Leave uploaded or AI-generated images alone unless asked to replace them
+        if current_image and current_image != image_path and not replace_existing:
+            continue
+
+        entry = manifest.get(character)
+        output_exists = os.path.exists(os.path.join(OUTPUT_DIR, os.path.basename(image_path)))
+        up_to_date = entry is not None and entry.get('hash') == digest and output_exists
+        if up_to_date and current_image == image_path and not force:
+            continue
+
+        jobs.append({
+            'id': row['id'],
+            'character': character,
+            'illustration_desc': row['illustration_desc'],
+            'hash': digest,
+        })
+
+    return jobs
+
+
+def generate_all(force: bool = False, workers: Optional[int] = None,
+                 only: Optional[List[str]] = None, replace_existing: bool = False) -> Dict[str, int]:
+    """Render illustrations for the whole characters table"""
+    # Imported lazily so worker processes never open a database connection
+    from database import get_characters_for_illustration, update_character_images
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    manifest = load_manifest()
+
+    characters = get_characters_for_illustration()
+    if only:
+        characters = [row for row in characters if row['character'] in only]
+
+    jobs = plan_jobs(characters, manifest, force=force, replace_existing=replace_existing)
+    skipped = len(characters) - len(jobs)
+    print(f"🎨 {len(jobs)} illustrations to render, {skipped} up to date or kept")
+
+    started = time.time()
+    rendered: Dict[int, str] = {}
+    failed = 0
+
+    if jobs:
+        with Pool(processes=workers) as pool:
+            for result in pool.imap_unordered(render_illustration, jobs, chunksize=8):
+                if result['error']:
+                    failed += 1
+                    print(f"  ❌ {result['character']}: {result['error']}")
+                    continue
+                rendered[result['id']] = result['image_path']
+                manifest[result['character']] = {
+                    'hash': result['hash'],
+                    'image_path': result['image_path'],
+                }
+
+    updated = update_character_images(rendered)
+    save_manifest(manifest)
+
+    elapsed = time.time() - started
+    print(f"\n✅ Rendered {len(rendered)} illustrations in {elapsed:.1f}s "
+          f"({failed} failed, {updated} rows updated) -> {OUTPUT_DIR}")
+
+    return {
+        'rendered': len(rendered),
+        'skipped': skipped,
+        'failed': failed,
+        'updated': updated,
+    }
+
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render character illustrations for the whole library")
+    parser.add_argument('--force', action='store_true', help="re-render even if the content hash is unchanged")
+    parser.add_argument('--workers', type=int, default=None, help="process pool size (default: all cores)")
+    parser.add_argument('--characters', nargs='*', help="only render these characters")
+    parser.add_argument('--replace-existing', action='store_true',
+                        help="also replace illustrations that were not rendered by this tool")
+    args = parser.parse_args(argv)
 
-def generate_all():
-    """Generate all character illustrations"""
-    print("🎨 Generating character illustrations...")
-    create_illustration_ba()
-    create_illustration_ba_father()
-    create_illustration_bai()
-    print(f"\n✅ All illustrations saved to: {OUTPUT_DIR}")
+    result = generate_all(force=args.force, workers=args.workers, only=args.characters,
+                          replace_existing=args.replace_existing)
+    return 0 if result['failed'] == 0 else 1
 
 
 if __name__ == "__main__":
-    generate_all()
+    sys.exit(main())
@@ -0,0 +1,295 @@
+"""
+Daily learning rollups for the progress dashboard
+
+user_daily_rollups holds one row per (user, UTC day) with that day's totals:
+reviews, characters newly marked learned, practice sessions, seconds and
+sentences practiced, and the sum/count of review proficiencies (their ratio
+is the day's average proficiency). Rows are updated incrementally, inside the
+same transaction as the write they count:
+
+    progress write     update_user_character_progress[_bulk] -> record_reviews()
+    practice session   POST /api/progress                    -> record_session()
+
+/api/users/{id}/history reads only these rows, so the dashboard costs one
+row per day in its range however long the user has been studying.
+
+Usage:
+    python learning_rollups.py --backfill            # rebuild every user's rows
+    python learning_rollups.py --backfill --user 1   # one user
+
+A backfill rebuilds from review_events (see review_log.py), learned_date for
+cards learned before the review log existed, and data/progress.json sessions.
+It counts new_learned the way the incremental path does: a card only counts
+when a review finds it not learned, and a card whose progress row predates
+its first logged review (learned_date before that day) is taken to have been
+learned already.
+"""
+import argparse
+import json
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from db_manager import get_db, run_write
+
+logger = logging.getLogger(__name__)
+
+SESSIONS_FILE = Path(__file__).parent / "data" / "progress.json"
+
+GRANULARITIES = ('day', 'week', 'month')
+# Longest range one history request may cover
+MAX_HISTORY_DAYS = 5 * 366
+DEFAULT_HISTORY_DAYS = 30
+
+COUNTERS = ('reviews', 'new_learned', 'sessions', 'seconds_practiced', 'sentences_practiced',
+            'proficiency_sum', 'proficiency_count')
+
+UPSERT_ROLLUP = f"""
+    INSERT INTO user_daily_rollups (user_id, day, {', '.join(COUNTERS)})
+    VALUES (?, ?, {', '.join(['?'] * len(COUNTERS))})
+    ON CONFLICT (user_id, day) DO UPDATE SET
+        {', '.join(f'{c} = user_daily_rollups.{c} + excluded.{c}' for c in COUNTERS)}
+"""
+
+
+def today() -> str:
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+def _empty() -> Dict[str, int]:
+    return dict.fromkeys(COUNTERS, 0)
+
+
+def _apply(cursor, user_id: int, days: Dict[str, Dict[str, int]]):
+    """Add per-day counter deltas to the user's rows"""
+    cursor.executemany(UPSERT_ROLLUP, [
+        (user_id, day, *(counts[c] for c in COUNTERS)) for day, counts in sorted(days.items())
+    ])
+
+
+def record_reviews(cursor, user_id: int, reviews: Iterable[Dict]):
+    """Count progress writes (call inside the writing transaction)
+
+    Each review has day ('YYYY-MM-DD', UTC), proficiency (or None) and
+    newly_learned (the card went from not learned to learned).
+    """
+    days = defaultdict(_empty)
+    for review in reviews:
+        counts = days[review['day']]
+        counts['reviews'] += 1
+        counts['new_learned'] += 1 if review['newly_learned'] else 0
+        if review.get('proficiency') is not None:
+            counts['proficiency_sum'] += review['proficiency']
+            counts['proficiency_count'] += 1
+    _apply(cursor, user_id, days)
+
+
+def record_session(user_id: int, day: str, duration_seconds: int, sentences_practiced: int):
+    """Count a saved practice session"""
+    counts = _empty()
+    counts.update(sessions=1, seconds_practiced=max(duration_seconds, 0),
+                  sentences_practiced=max(sentences_practiced, 0))
+    run_write(lambda cursor: _apply(cursor, user_id, {day: counts}))
+
+
+def session_day(timestamp: str) -> str:
+    """UTC day of a session's ISO timestamp (today when it cannot be parsed)"""
+    try:
+        parsed = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return today()
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc)
+    return parsed.date().isoformat()
+
+
+# ==================== History ====================
+
+def _bucket_start(day: date, granularity: str) -> date:
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def _next_bucket(start: date, granularity: str) -> date:
+    if granularity == 'week':
+        return start + timedelta(days=7)
+    if granularity == 'month':
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def _summary(counts: Dict[str, int]) -> Dict:
+    return {
+        'reviews': counts['reviews'],
+        'new_learned': counts['new_learned'],
+        'sessions': counts['sessions'],
+        'minutes_practiced': round(counts['seconds_practiced'] / 60, 1),
+        'sentences_practiced': counts['sentences_practiced'],
+        'average_proficiency': (round(counts['proficiency_sum'] / counts['proficiency_count'], 2)
+                                if counts['proficiency_count'] else None),
+    }
+
+
+def get_history(user_id: int, start: Optional[str] = None, end: Optional[str] = None,
+                granularity: str = 'day') -> Dict:
+    """Per-bucket totals for days start..end (inclusive, UTC), every bucket present
+
+    Raises ValueError for a bad granularity, date or range.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+    end_day = date.fromisoformat(end) if end else date.fromisoformat(today())
+    start_day = date.fromisoformat(start) if start else end_day - timedelta(days=DEFAULT_HISTORY_DAYS - 1)
+    if start_day > end_day:
+        raise ValueError("from must not be after to")
+    if (end_day - start_day).days >= MAX_HISTORY_DAYS:
+        raise ValueError(f"At most {MAX_HISTORY_DAYS} days per request")
+
+    conn = get_db(readonly=True, user_id=user_id)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT day, {', '.join(COUNTERS)} FROM user_daily_rollups
+            WHERE user_id = ? AND day >= ? AND day <= ?
+        """, (user_id, start_day.isoformat(), end_day.isoformat()))
+        rows = cursor.fetchall()
+    finally:
+        conn.close()
+
+    buckets, totals = {}, _empty()
+    bucket = _bucket_start(start_day, granularity)
+    while bucket <= end_day:
+        buckets[bucket] = _empty()
+        bucket = _next_bucket(bucket, granularity)
+    for row in rows:
+        day = row['day'] if isinstance(row['day'], date) else date.fromisoformat(str(row['day']))
+        counts = buckets[_bucket_start(day, granularity)]
+        for c in COUNTERS:
+            counts[c] += row[c]
+            totals[c] += row[c]
+
+    return {
+        'user_id': user_id,
+        'from': start_day.isoformat(),
+        'to': end_day.isoformat(),
+        'granularity': granularity,
+        'buckets': [{'start': bucket.isoformat(), **_summary(counts)} for bucket, counts in buckets.items()],
+        'totals': _summary(totals),
+    }
+
+
+# ==================== Backfill ====================
+
+def _load_sessions() -> List[Dict]:
+    if not SESSIONS_FILE.exists():
+        return []
+    with open(SESSIONS_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _rebuild(cursor, user_ids: List[int]) -> int:
+    """Recompute the rows of user_ids from their sources; returns rows written"""
+    days = defaultdict(lambda: defaultdict(_empty))
+    params = ', '.join(['?'] * len(user_ids))
+
+    # Cards whose row existed before their first logged review: the write that
+    # first counted them is not in the log, so a learned review does not count again
+    cursor.execute(f"""
+        SELECT p.user_id, p.character_id FROM user_character_progress p
+        WHERE p.user_id IN ({params}) AND p.learned_date IS NOT NULL
+          AND p.learned_date < (SELECT date(MIN(e.reviewed_at)) FROM review_events e
+                                WHERE e.user_id = p.user_id AND e.character_id = p.character_id)
+    """, user_ids)
+    learned = {(row['user_id'], row['character_id']) for row in cursor.fetchall()}
+
+    # Reviews, and each time a card went from not learned to learned
+    cursor.execute(f"""
+        SELECT user_id, character_id, reviewed_at, is_learned, proficiency FROM review_events
+        WHERE user_id IN ({params})
+        ORDER BY user_id, character_id, reviewed_at
+    """, user_ids)
+    for row in cursor.fetchall():
+        key = (row['user_id'], row['character_id'])
+        counts = days[row['user_id']][str(row['reviewed_at'])[:10]]
+        counts['reviews'] += 1
+        if row['is_learned'] and key not in learned:
+            counts['new_learned'] += 1
+        if row['is_learned']:
+            learned.add(key)
+        else:
+            learned.discard(key)
+        if row['proficiency'] is not None:
+            counts['proficiency_sum'] += row['proficiency']
+            counts['proficiency_count'] += 1
+
+    # Cards learned before the review log existed count on their learned_date
+    cursor.execute(f"""
+        SELECT p.user_id, p.learned_date FROM user_character_progress p
+        WHERE p.user_id IN ({params}) AND p.is_learned AND p.learned_date IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM review_events e
+                          WHERE e.user_id = p.user_id AND e.character_id = p.character_id)
+    """, user_ids)
+    for row in cursor.fetchall():
+        days[row['user_id']][str(row['learned_date'])[:10]]['new_learned'] += 1
+
+    # Sessions saved before they carried a user_id belong to the default user
+    for session in _load_sessions():
+        if session.get('user_id', 1) in user_ids:
+            counts = days[session.get('user_id', 1)][session_day(session.get('timestamp'))]
+            counts['sessions'] += 1
+            counts['seconds_practiced'] += session.get('duration_seconds', 0)
+            counts['sentences_practiced'] += session.get('sentences_practiced', 0)
+
+    cursor.execute(f"DELETE FROM user_daily_rollups WHERE user_id IN ({params})", user_ids)
+    written = 0
+    for user_id in user_ids:
+        if days.get(user_id):
+            _apply(cursor, user_id, days[user_id])
+            written += len(days[user_id])
+    return written
+
+
+def backfill(user_id: Optional[int] = None) -> int:
+    """Rebuild rollups for one user or all users; returns rows written
+
+    Run while the user is idle: a progress write that commits during the
+    rebuild may be counted twice or not at all.
+    """
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        if user_id is None:
+            cursor.execute("SELECT id FROM users ORDER BY id")
+            user_ids = [row['id'] for row in cursor.fetchall()]
+        else:
+            user_ids = [user_id]
+        written = _rebuild(cursor, user_ids) if user_ids else 0
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    logger.info("Learning rollups rebuilt", extra={'users': len(user_ids), 'rows': written})
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Daily learning rollups")
+    parser.add_argument("--backfill", action="store_true", help="rebuild rollups from the review log and sessions")
+    parser.add_argument("--user", type=int, help="only this user id")
+    args = parser.parse_args(argv)
+
+    if not args.backfill:
+        parser.print_help()
+        return
+    print(f"Wrote {backfill(args.user)} daily rollup rows")
+
+
+if __name__ == "__main__":
+    main()
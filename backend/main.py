@@ -1,11 +1,23 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from pypinyin import pinyin, Style
 import jieba
+import asyncio
+import gzip
 import json
+import logging
+import threading
+from datetime import datetime
 from pathlib import Path
 from typing import List, Dict, Optional
 from pydantic import BaseModel
+from structured_log import setup_logging, RequestIdMiddleware
+
+# Configured before importing database/ai_service, which log at import time
+setup_logging()
+logger = logging.getLogger(__name__)
+
 from database import (
     add_character_full, get_character_full, get_all_characters, get_todays_characters,
     update_character_progress, get_learning_stats, init_db, seed_sample_data,
@@ -13,15 +25,34 @@ from database import (
     get_learned_characters, update_character_by_id,
     # User management
     get_all_users, create_user, get_user_by_id, update_user, delete_user,
-    get_user_character_progress, update_user_character_progress, get_user_learning_stats
+    get_user_character_progress, update_user_character_progress, get_user_learning_stats,
+    update_user_character_progress_bulk,
+    get_character_photos, get_character_by_id, record_ai_usage, get_ai_usage_summary,
+    browse_characters, get_related_characters, get_character_word_groups, get_characters_for_word
 )
 from ai_service import (
     generate_character_content, generate_character_image, test_api_key,
-    AISettings, CharacterContent
+    stream_character_content, stream_word_content,
+    generate_character_fields, missing_character_fields, generate_word_definition, CHARACTER_FIELD_SCHEMA,
+    AISettings, AIUsage, CharacterContent
 )
 from settings_manager import load_settings, save_settings, update_settings
-
-app = FastAPI(title="ChineseFlow API")
+from singleflight import single_flight, get_stats as get_single_flight_stats
+from db_manager import get_query_stats, SLOW_QUERY_MS
+import search_index
+import content_bundle
+import change_feed
+import quiz_engine
+import review_log
+import learning_rollups
+import speech_alignment
+import provider_chain
+import metrics
+from serialization import FastJSONResponse
+
+# orjson for every route; hot routes return FastJSONResponse directly to skip
+# response_model re-validation of payloads database.py already shaped
+app = FastAPI(title="ChineseFlow API", default_response_class=FastJSONResponse)
 
 # CORS configuration
 # Allow origins from environment variable or use defaults
@@ -49,10 +80,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route latency histograms for /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Outermost: every log line and response carries X-Request-ID
+app.add_middleware(RequestIdMiddleware)
+
 # Data directory
 DATA_DIR = Path(__file__).parent / "data"
 DATA_DIR.mkdir(exist_ok=True)
 
+# Sessions are appended to progress.json from threadpool threads - one writer at a time
+_progress_lock = threading.Lock()
+
 # ==================== Models ====================
 
 class Word(BaseModel):
@@ -79,6 +119,7 @@ class ProgressSession(BaseModel):
     timestamp: str
     duration_seconds: int
     sentences_practiced: int
+    user_id: int = 1
 
 
 # Traditional Character Card Format Models
@@ -136,6 +177,7 @@ class LearningStats(BaseModel):
 
 # ==================== Helper Functions ====================
 
+@single_flight('get_pinyin_for_text')
 def get_pinyin_for_text(text: str) -> str:
     """Get pinyin for Chinese text"""
     pinyin_list = pinyin(text, style=Style.TONE)
@@ -299,6 +341,30 @@ async def update_article(article: Article):
     return article
 
 
+class AlignRequest(BaseModel):
+    transcript: str
+    # article_id from the previous alignment; a mismatch means the article was replaced
+    article_id: Optional[str] = None
+    # position from the previous alignment, where the reader had got to
+    position: Optional[int] = None
+
+
+@app.post("/api/article/align")
+def align_transcript(request: AlignRequest):
+    """Locate a speech-recognition transcript chunk in the current article
+
+    Returns the matched span (article character offsets, end exclusive), the
+    sentence reached and the match accuracy.
+    """
+    article = load_article()
+    if not article:
+        raise HTTPException(status_code=404, detail="No article loaded")
+    sentences = [sentence.chinese for sentence in article.sentences]
+    if request.article_id and request.article_id != speech_alignment.article_id(sentences):
+        raise HTTPException(status_code=409, detail="Article has changed; reload it")
+    return speech_alignment.align(sentences, request.transcript, request.position)
+
+
 @app.get("/api/word/{word}", response_model=Word)
 async def get_word_info(word: str):
     """Get information about a specific word"""
@@ -307,19 +373,26 @@ async def get_word_info(word: str):
 
 
 @app.post("/api/progress")
-async def save_progress(session: ProgressSession):
+def save_progress(session: ProgressSession):
     """Save a practice session"""
     progress_file = DATA_DIR / "progress.json"
     
-    progress = []
-    if progress_file.exists():
-        with open(progress_file, "r", encoding="utf-8") as f:
-            progress = json.load(f)
-    
-    progress.append(session.model_dump())
+    with _progress_lock:
+        progress = []
+        if progress_file.exists():
+            with open(progress_file, "r", encoding="utf-8") as f:
+                progress = json.load(f)
+        
+        progress.append(session.model_dump())
+        
+        # Written aside and renamed, so readers never see a half-written file
+        tmp_file = progress_file.with_suffix('.json.tmp')
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(progress, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, progress_file)
     
-    with open(progress_file, "w", encoding="utf-8") as f:
-        json.dump(progress, f, ensure_ascii=False, indent=2)
+    learning_rollups.record_session(session.user_id, learning_rollups.session_day(session.timestamp),
+                                    session.duration_seconds, session.sentences_practiced)
     
     return {"message": "Progress saved successfully"}
 
@@ -339,7 +412,7 @@ async def get_progress():
 # ==================== Character Learning APIs ====================
 
 @app.post("/api/characters", response_model=dict)
-async def create_character(char_data: CharacterCreate):
+def create_character(char_data: CharacterCreate):
     """Add a new character with full traditional format"""
     char_id = add_character_full(
         character=char_data.character,
@@ -364,14 +437,29 @@ async def create_character(char_data: CharacterCreate):
 @app.get("/api/characters")
 async def list_characters():
     """Get all characters"""
-    return get_all_characters()
+    return FastJSONResponse(get_all_characters())
+
+
+@app.get("/api/characters/browse")
+def browse_character_list(radical: Optional[str] = None, stroke_count: Optional[int] = None,
+                          tone: Optional[int] = None, pinyin: Optional[str] = None,
+                          page: int = 1, page_size: int = 50, sort: str = 'stroke_count'):
+    """Browse characters by radical, stroke count, tone or pinyin (e.g. "ba", "ba3")
+
+    Returns one page plus per-facet counts; sort is stroke_count, pinyin, radical or recent.
+    """
+    try:
+        return FastJSONResponse(browse_characters(radical=radical, stroke_count=stroke_count, tone=tone,
+                                                  pinyin=pinyin, page=page, page_size=page_size, sort=sort))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.get("/api/characters/today")
 async def get_today_characters():
     """Get today's scheduled characters"""
     result = get_todays_characters()
-    print(f"DEBUG: Returning {len(result)} characters")
+    logger.debug("Returning today's characters", extra={'count': len(result), 'sample_rate': 0.01})
     return result
 
 
@@ -382,16 +470,40 @@ async def get_learned():
 
 
 @app.get("/api/characters/{character}", response_model=CharacterResponse)
-async def get_character_details(character: str):
+def get_character_details(character: str):
     """Get detailed information about a character in traditional format"""
     char = get_character_full(character)
     if not char:
         raise HTTPException(status_code=404, detail="Character not found")
-    return char
+    return FastJSONResponse(char)
+
+
+@app.get("/api/characters/{character}/related")
+def get_character_related(character: str, depth: int = 1, limit: int = 50):
+    """Related characters up to depth hops away (component, derived, radical, word)"""
+    result = get_related_characters(character, depth=depth, limit=limit)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Character not found")
+    return result
+
+
+@app.get("/api/characters/{character}/word-groups")
+def get_character_word_group_list(character: str):
+    """Words listed on a card by tone key, with their word details when known"""
+    return get_character_word_groups(character)
+
+
+@app.get("/api/characters/{character}/photos")
+async def get_character_photo_list(character: str):
+    """Get source photos ingested from the Data archive for a character"""
+    char = get_character_full(character)
+    if not char:
+        raise HTTPException(status_code=404, detail="Character not found")
+    return get_character_photos(char['id'])
 
 
 @app.post("/api/characters/{character_id}/progress")
-async def mark_character_progress(character_id: int, proficiency: Optional[int] = None):
+def mark_character_progress(character_id: int, proficiency: Optional[int] = None):
     """Mark a character as learned/update progress"""
     update_character_progress(character_id, proficiency)
     return {"message": "Progress updated successfully"}
@@ -466,7 +578,7 @@ async def delete_existing_user(user_id: int):
 @app.get("/api/users/{user_id}/progress")
 async def get_user_progress(user_id: int):
     """Get user's character learning progress"""
-    return get_user_character_progress(user_id)
+    return FastJSONResponse(get_user_character_progress(user_id))
 
 class UserProgressUpdate(BaseModel):
     character_id: int
@@ -474,7 +586,7 @@ class UserProgressUpdate(BaseModel):
     proficiency: Optional[int] = None
 
 @app.post("/api/users/{user_id}/progress")
-async def update_user_progress(user_id: int, progress: UserProgressUpdate):
+def update_user_progress(user_id: int, progress: UserProgressUpdate):
     """Update user's character learning progress"""
     success = update_user_character_progress(
         user_id, 
@@ -486,6 +598,53 @@ async def update_user_progress(user_id: int, progress: UserProgressUpdate):
         raise HTTPException(status_code=400, detail="Failed to update progress")
     return {"message": "Progress updated successfully"}
 
+class UserProgressReview(UserProgressUpdate):
+    # When a review done offline happened (ISO 8601; UTC when no offset is given); defaults to now
+    reviewed_at: Optional[datetime] = None
+
+class UserProgressBatch(BaseModel):
+    reviews: List[UserProgressReview]
+
+@app.post("/api/users/{user_id}/progress/batch")
+def update_user_progress_batch(user_id: int, batch: UserProgressBatch):
+    """Record a whole review session's progress updates in one transaction"""
+    if len(batch.reviews) > 1000:
+        raise HTTPException(status_code=400, detail="At most 1000 reviews per batch")
+    updates = []
+    for review in batch.reviews:
+        update = review.model_dump()
+        if review.reviewed_at is not None:
+            try:
+                update['reviewed_at'] = review_log.to_reviewed_at(review.reviewed_at)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        updates.append(update)
+    try:
+        applied = update_user_character_progress_bulk(user_id, updates)
+    except Exception as e:
+        logger.exception("Batch progress update failed", extra={'user_id': user_id})
+        raise HTTPException(status_code=400, detail=f"Failed to update progress: {e}")
+    return {"message": "Progress updated successfully", "applied": applied}
+
+@app.get("/api/users/{user_id}/history")
+def get_user_history(user_id: int, from_: Optional[str] = Query(None, alias="from"),
+                     to: Optional[str] = None, granularity: str = 'day'):
+    """Daily, weekly or monthly learning totals for the dashboard (dates are UTC, to inclusive)
+
+    Reads only the pre-aggregated daily rollups; defaults to the last 30 days.
+    """
+    try:
+        history = learning_rollups.get_history(user_id, from_, to, granularity)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return FastJSONResponse(history)
+
+@app.get("/api/users/{user_id}/reviews")
+def get_user_reviews(user_id: int, since: Optional[str] = None, until: Optional[str] = None,
+                     character_id: Optional[int] = None, limit: int = 1000):
+    """A user's individual reviews, newest first (since/until bound the months scanned)"""
+    return FastJSONResponse(review_log.get_review_events(user_id, since, until, character_id, limit))
+
 @app.get("/api/users/{user_id}/stats")
 async def get_user_stats(user_id: int):
     """Get user's learning statistics"""
@@ -508,7 +667,7 @@ class AIGenerateResponse(BaseModel):
 
 
 @app.post("/api/ai/generate-content", response_model=AIGenerateResponse)
-async def ai_generate_content(request: AIGenerateRequest):
+def ai_generate_content(request: AIGenerateRequest):
     """Generate character content using AI"""
     try:
         settings = AISettings(
@@ -517,9 +676,12 @@ async def ai_generate_content(request: AIGenerateRequest):
             model=request.model
         )
         
-        print(f"Generating content for character: {request.character}, model: {request.model}")
+        logger.info("Generating content", extra={'character': request.character, 'model': request.model})
         
-        content = generate_character_content(request.character, settings)
+        def on_usage(usage: AIUsage):
+            record_ai_usage(request.character, 'full', **usage.model_dump())
+        
+        content = generate_character_content(request.character, settings, on_usage=on_usage)
         
         if content:
             return AIGenerateResponse(success=True, data=content)
@@ -527,13 +689,88 @@ async def ai_generate_content(request: AIGenerateRequest):
             return AIGenerateResponse(success=False, error="AI 返回内容解析失败，请检查 API Key 是否正确")
     
     except Exception as e:
-        import traceback
         error_msg = str(e)
-        print(f"AI generation error: {error_msg}")
-        traceback.print_exc()
+        logger.exception("AI generation error", extra={'character': request.character})
         return AIGenerateResponse(success=False, error=f"API 调用失败: {error_msg}")
 
 
+class AIGenerateFieldsRequest(BaseModel):
+    provider: str
+    api_key: str
+    model: str
+    fields: Optional[List[str]] = None  # Default: every field that is empty on the card
+
+
+@app.post("/api/characters/{character_id}/generate-fields")
+def ai_generate_fields(character_id: int, request: AIGenerateFieldsRequest):
+    """Generate only the missing/selected fields of a card and merge them into the row"""
+    char = get_character_by_id(character_id)
+    if not char:
+        raise HTTPException(status_code=404, detail="Character not found")
+    
+    if request.fields is not None:
+        unknown = [field for field in request.fields if field not in CHARACTER_FIELD_SCHEMA]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)} "
+                                                        f"(valid: {', '.join(CHARACTER_FIELD_SCHEMA)})")
+    
+    fields = request.fields if request.fields is not None else missing_character_fields(char)
+    if not fields:
+        return {"success": True, "updated_fields": [], "data": {}, "usage": None}
+    
+    settings = AISettings(
+        provider=request.provider,
+        api_key=request.api_key,
+        model=request.model
+    )
+    data, usage = generate_character_fields(char['character'], fields, settings, known=char)
+    
+    if usage:
+        record_ai_usage(char['character'], 'partial', fields=fields, character_id=character_id,
+                        **usage.model_dump())
+    if not data:
+        return {"success": False, "error": "AI 返回内容解析失败", "usage": usage}
+    
+    if not update_character_by_id(character_id, **data):
+        raise HTTPException(status_code=500, detail="Failed to update character")
+    return {"success": True, "updated_fields": list(data), "data": data, "usage": usage}
+
+
+@app.get("/api/ai/usage")
+async def get_ai_usage(character_id: Optional[int] = None):
+    """Token usage and latency per generation type (full vs partial), optionally per character"""
+    return get_ai_usage_summary(character_id)
+
+
+def _sse_event(event: str, data) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _sse_stream(events):
+    """Relay (event, data) tuples from a generation stream as SSE frames"""
+    for event, data in events:
+        yield _sse_event(event, data)
+
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # Disable proxy buffering so fields arrive immediately
+}
+
+
+@app.post("/api/ai/generate-content/stream")
+async def ai_generate_content_stream(request: AIGenerateRequest):
+    """Stream character content generation over SSE, one event per completed field"""
+    settings = AISettings(
+        provider=request.provider,
+        api_key=request.api_key,
+        model=request.model
+    )
+    events = stream_character_content(request.character, settings)
+    return StreamingResponse(_sse_stream(events), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
 class AIGenerateImageRequest(BaseModel):
     character: str
     illustration_desc: str
@@ -575,10 +812,8 @@ async def ai_generate_image(request: AIGenerateImageRequest):
             return AIGenerateImageResponse(success=False, error=message, message=message)
     
     except Exception as e:
-        import traceback
         error_detail = str(e)
-        print(f"Image generation exception: {error_detail}")
-        traceback.print_exc()
+        logger.exception("Image generation exception", extra={'character': request.character})
         return AIGenerateImageResponse(success=False, error=error_detail, message=f"生成失败: {error_detail}")
 
 
@@ -586,7 +821,7 @@ class AIGenerateWordRequest(BaseModel):
     word: str
 
 @app.post("/api/ai/generate-word")
-async def ai_generate_word(request: AIGenerateWordRequest):
+def ai_generate_word(request: AIGenerateWordRequest):
     """Generate word details using AI"""
     try:
         settings_dict = load_settings()
@@ -609,15 +844,33 @@ async def ai_generate_word(request: AIGenerateWordRequest):
             return {"success": False, "error": "Failed to generate word content"}
     
     except Exception as e:
-        import traceback
         error_detail = str(e)
-        print(f"Word generation exception: {error_detail}")
-        traceback.print_exc()
+        logger.exception("Word generation exception", extra={'word': request.word})
         return {"success": False, "error": error_detail}
 
 
+@app.post("/api/ai/generate-word/stream")
+async def ai_generate_word_stream(request: AIGenerateWordRequest):
+    """Stream word content generation over SSE, one event per completed field"""
+    settings_dict = load_settings()
+    if not settings_dict.get('apiKey'):
+        return StreamingResponse(
+            iter([_sse_event("error", "AI settings not configured")]),
+            media_type="text/event-stream",
+            headers=SSE_HEADERS
+        )
+    
+    settings = AISettings(
+        provider=settings_dict.get('provider', 'kimi'),
+        api_key=settings_dict.get('apiKey'),
+        model=settings_dict.get('model', 'kimi-latest')
+    )
+    events = stream_word_content(request.word, settings)
+    return StreamingResponse(_sse_stream(events), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
 @app.post("/api/characters/{character_id}/update")
-async def update_character_full(character_id: int, update_data: dict):
+def update_character_full(character_id: int, update_data: dict):
     """Update character with AI generated content"""
     try:
         success = update_character_by_id(
@@ -721,7 +974,7 @@ class WordUpdate(BaseModel):
 
 
 @app.post("/api/words")
-async def create_word(word_data: WordCreate):
+def create_word(word_data: WordCreate):
     """Add a new word"""
     word_id = add_word(
         word=word_data.word,
@@ -740,13 +993,13 @@ async def create_word(word_data: WordCreate):
 @app.get("/api/words")
 async def list_words():
     """Get all words for display"""
-    return get_all_words()
+    return FastJSONResponse(get_all_words())
 
 
 @app.get("/api/words/character/{character_id}")
 async def get_character_words(character_id: int):
     """Get words related to a character"""
-    return get_words_by_character(character_id)
+    return FastJSONResponse(get_words_by_character(character_id))
 
 
 @app.get("/api/words/search/{word_text}")
@@ -759,6 +1012,12 @@ async def search_word(word_text: str):
         raise HTTPException(status_code=404, detail="Word not found")
 
 
+@app.get("/api/words/search/{word_text}/characters")
+def get_word_characters(word_text: str):
+    """Character cards whose word groups list this word"""
+    return get_characters_for_word(word_text)
+
+
 @app.get("/api/words/{word_id}")
 async def get_word(word_id: int):
     """Get word by ID"""
@@ -770,7 +1029,7 @@ async def get_word(word_id: int):
 
 
 @app.put("/api/words/{word_id}")
-async def update_word_api(word_id: int, updates: WordUpdate):
+def update_word_api(word_id: int, updates: WordUpdate):
     """Update word information"""
     success = update_word(word_id, updates.model_dump(exclude_unset=True))
     if success:
@@ -780,7 +1039,7 @@ async def update_word_api(word_id: int, updates: WordUpdate):
 
 
 @app.delete("/api/words/{word_id}")
-async def delete_word_api(word_id: int):
+def delete_word_api(word_id: int):
     """Delete a word"""
     success = delete_word(word_id)
     if success:
@@ -790,7 +1049,7 @@ async def delete_word_api(word_id: int):
 
 
 @app.post("/api/words/{word_id}/generate")
-async def generate_word_content(word_id: int):
+def generate_word_content(word_id: int):
     """Generate word content using AI"""
     word = get_word_by_id(word_id)
     if not word:
@@ -807,45 +1066,219 @@ async def generate_word_content(word_id: int):
         model=settings_dict['model']
     )
     
-    # Generate content using AI
-    system_prompt = f"""你是一个中文词典专家。请为词语"{word['word']}"生成详细的解释。
-请按照以下JSON格式返回：
-
-{{
-    "pinyin": "拼音（带声调）",
-    "chinese_meaning": "中文详细解释",
-    "english_translation": "英文翻译"
-}}
-
-要求：
-1. 拼音必须带声调
-2. 中文解释要详细、准确
-3. 英文翻译要地道
-"""
+    data = generate_word_definition(word['word'], settings)
+    if not data:
+        raise HTTPException(status_code=500, detail="Failed to generate content")
     
-    try:
-        from ai_service import _call_kimi
-        content = _call_kimi(system_prompt, f"请解释词语：{word['word']}", settings)
-        
-        if content:
-            # Parse the response
-            import json
-            data = json.loads(content)
-            
-            # Update word
-            update_word(word_id, {
-                'pinyin': data.get('pinyin', word['pinyin']),
-                'chinese_meaning': data.get('chinese_meaning', word['chinese_meaning']),
-                'english_translation': data.get('english_translation', word['english_translation']),
-                'is_ai_generated': True
-            })
-            
-            return {"message": "Content generated successfully", "data": data}
-        else:
-            raise HTTPException(status_code=500, detail="Failed to generate content")
+    update_word(word_id, {
+        'pinyin': data.get('pinyin', word['pinyin']),
+        'chinese_meaning': data.get('chinese_meaning', word['chinese_meaning']),
+        'english_translation': data.get('english_translation', word['english_translation']),
+        'is_ai_generated': True
+    })
     
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return {"message": "Content generated successfully", "data": data}
+
+
+# ==================== Search API ====================
+
+@app.get("/api/search")
+def search(q: str, limit: int = 20, type: Optional[str] = None):
+    """Full-text search over character cards and words, best matches first
+
+    type narrows results to 'character' or 'word'.
+    """
+    try:
+        results = search_index.search(q, limit=limit, doc_type=type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return FastJSONResponse({"query": q, "results": results})
+
+
+# ==================== Quiz API ====================
+
+@app.get("/api/quiz")
+def get_quiz(count: int = 10, user_id: Optional[int] = None, types: Optional[str] = None,
+             seed: Optional[int] = None, options: int = 4):
+    """Multiple-choice questions from the cards and words, the user's due cards first
+
+    types: comma-separated char_pinyin, pinyin_char, char_meaning, word_meaning.
+    Pass the returned seed back to get the same quiz again.
+    """
+    try:
+        quiz = quiz_engine.generate_quiz(count, user_id, types.split(',') if types else None, seed, options)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return FastJSONResponse(quiz)
+
+
+# ==================== Offline Bundle API ====================
+
+def _bundle_response(request: Request, version: int, path: Path, cache_control: str):
+    """The gzip'd bundle as-is when the client accepts gzip; 304 when its copy is current"""
+    headers = {
+        "ETag": f'"content-{version}"',
+        "Cache-Control": cache_control,
+        "X-Bundle-Version": str(version),
+        "Vary": "Accept-Encoding",
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+        return FileResponse(path, media_type="application/x-ndjson", headers=headers)
+    return Response(gzip.decompress(path.read_bytes()), media_type="application/x-ndjson", headers=headers)
+
+
+@app.get("/api/bundle")
+def get_content_bundle(request: Request):
+    """Every card and word as JSON lines, for offline use (sync afterwards with /api/bundle/delta)"""
+    version, path = content_bundle.build_bundle()
+    # Revalidate on every use - the ETag makes an unchanged bundle a 304
+    return _bundle_response(request, version, path, "public, no-cache")
+
+
+@app.get("/api/bundle/delta")
+def get_content_bundle_delta(since: int):
+    """Cards and words changed after bundle version since, plus ids deleted since
+
+    410 means the change log no longer reaches back that far - download /api/bundle again.
+    """
+    try:
+        return FastJSONResponse(content_bundle.get_delta(since))
+    except content_bundle.DeltaUnavailable as e:
+        raise HTTPException(status_code=410, detail=str(e))
+
+
+@app.get("/api/bundle/{version}")
+def get_content_bundle_version(version: int, request: Request):
+    """A specific bundle version (immutable, so cacheable forever) while it is still kept"""
+    path = content_bundle.bundle_path(version)
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Bundle version not available")
+    return _bundle_response(request, version, path, "public, max-age=31536000, immutable")
+
+
+# ==================== Change Feed API ====================
+
+def _subscribe(topics: str):
+    """Subscribe to comma-separated topics; raises HTTPException for bad or excess requests"""
+    try:
+        return change_feed.feed.subscribe(change_feed.parse_topics(topics.split(',')))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except change_feed.TooManySubscribers as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+@app.get("/api/changes/stream")
+async def stream_changes(topics: str = "content"):
+    """Push card, word and progress changes over SSE
+
+    topics: comma-separated content, character:<id>, progress:<user_id>.
+    Each "changes" event carries a batch; a {"type": "resync"} entry means
+    events were dropped and the client should refetch.
+    """
+    subscription = _subscribe(topics)
+
+    async def events():
+        try:
+            yield _sse_event("subscribed", {"topics": sorted(subscription.topics)})
+            while True:
+                batch = await subscription.next_batch()
+                yield ": keep-alive\n\n" if batch is None else _sse_event("changes", batch)
+        finally:
+            change_feed.feed.unsubscribe(subscription)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@app.websocket("/api/changes/ws")
+async def changes_websocket(websocket: WebSocket, topics: str = "content"):
+    """Push changes over a WebSocket; send {"subscribe": [...]} / {"unsubscribe": [...]} to change topics"""
+    try:
+        subscription = _subscribe(topics)
+    except HTTPException as e:
+        await websocket.close(code=1008 if e.status_code == 400 else 1013, reason=e.detail)
+        return
+    await websocket.accept()
+
+    async def receive():
+        while True:
+            message = await websocket.receive_json()
+            try:
+                added = change_feed.parse_topics(message.get("subscribe") or [])
+                removed = change_feed.parse_topics(message.get("unsubscribe") or [])
+                topics = change_feed.parse_topics((subscription.topics | added) - removed)
+            except (ValueError, AttributeError) as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+                continue
+            # Replaced, not mutated: publishers read it from other threads
+            subscription.topics = topics
+            await websocket.send_json({"type": "subscribed", "topics": sorted(topics)})
+
+    async def send():
+        await websocket.send_json({"type": "subscribed", "topics": sorted(subscription.topics)})
+        while True:
+            batch = await subscription.next_batch()
+            message = {"type": "ping"} if batch is None else {"type": "changes", "events": batch}
+            # A client this slow is dropped rather than buffered for
+            await asyncio.wait_for(websocket.send_json(message), change_feed.SEND_TIMEOUT_SECONDS)
+
+    tasks = [asyncio.create_task(receive()), asyncio.create_task(send())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if not isinstance(task.exception(), WebSocketDisconnect):
+                logger.info("Change feed connection closed: %r", task.exception())
+    finally:
+        for task in tasks:
+            task.cancel()
+        change_feed.feed.unsubscribe(subscription)
+        if websocket.client_state.name == "CONNECTED":
+            await websocket.close()
+
+
+# ==================== Diagnostics ====================
+
+def _single_flight_series(field: str):
+    """Scrape-time collector for one single-flight counter, per operation"""
+    return lambda: {(name, ): stats[field] for name, stats in get_single_flight_stats().items()}
+
+
+metrics.counter("singleflight_calls_total", "Calls made through single-flight groups",
+                ["operation"], callback=_single_flight_series('calls'))
+metrics.counter("singleflight_coalesced_total", "Calls that shared an in-flight computation",
+                ["operation"], callback=_single_flight_series('coalesced'))
+metrics.gauge("singleflight_in_flight", "Single-flight computations currently running",
+              ["operation"], callback=_single_flight_series('in_flight'))
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/api/singleflight/stats")
+async def single_flight_stats():
+    """How many concurrent duplicate calls were coalesced, per operation"""
+    return get_single_flight_stats()
+
+
+@app.get("/api/ai/providers")
+async def ai_provider_status():
+    """Circuit breaker state per AI provider (closed, half_open, open)"""
+    return provider_chain.get_status()
+
+
+@app.get("/api/db/query-stats")
+async def db_query_stats(limit: int = 20, order_by: str = 'total'):
+    """Top SQL statements by total time (order_by: total, mean, max, calls)"""
+    return {
+        'slow_query_ms': SLOW_QUERY_MS,
+        'statements': get_query_stats(limit=limit, order_by=order_by),
+    }
 
 
 # ==================== Seed Data Endpoint ====================
@@ -859,8 +1292,8 @@ async def seed_data():
 
 if __name__ == "__main__":
     import uvicorn
-    print("🚀 Starting ChineseFlow API server...")
-    print("📚 API Documentation: http://localhost:8000/docs")
+    logger.info("Starting ChineseFlow API server")
+    logger.info("API Documentation: http://localhost:8000/docs")
     
     # Seed sample data on startup if database is empty
     import sqlite3
@@ -871,7 +1304,7 @@ if __name__ == "__main__":
     conn.close()
     
     if count == 0:
-        print("📝 Seeding sample data...")
+        logger.info("Seeding sample data")
         seed_sample_data()
     
     uvicorn.run(app, host="0.0.0.0", port=8000)
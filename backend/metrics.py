@@ -0,0 +1,304 @@
+"""
+Lightweight Prometheus-style metrics
+
+Counters, gauges and histograms with labels, rendered in the Prometheus text
+exposition format by /metrics. Each observation is a dict lookup, a bisect and
+an addition under a per-metric lock, so collection is cheap enough to leave on
+in production. No prometheus_client dependency.
+"""
+import bisect
+import functools
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds (5 ms .. 60 s - covers DB queries and LLM calls)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count (or read from a callback at scrape time)"""
+    kind = "counter"
+
+    def __init__(self, *args, callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._callback = callback
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        if self._callback is not None:
+            try:
+                items.extend(self._callback().items())
+            except Exception:
+                pass  # A broken collector must not break the scrape
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(_Metric):
+    """Value that goes up and down (or is read from a callback at scrape time)"""
+    kind = "gauge"
+
+    def __init__(self, *args, callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._callback = callback
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        if self._callback is not None:
+            try:
+                items.extend(self._callback().items())
+            except Exception:
+                pass  # A broken collector must not break the scrape
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Histogram(_Metric):
+    """Bucketed distribution with _bucket/_sum/_count series"""
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def time(self, **labels):
+        """Context manager that observes the elapsed time of its block"""
+        return _Timer(self, labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._values.items()]
+        lines = self.header()
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series[:-1]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {_format_value(cumulative)}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'started')
+
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        labels = dict(self.labels)
+        if 'outcome' in self.histogram.labelnames:
+            labels['outcome'] = 'error' if exc_type else 'success'
+        self.histogram.observe(time.perf_counter() - self.started, **labels)
+        return False
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing  # Re-registration (e.g. module reload) reuses the series
+            self._metrics[metric.name] = metric
+            return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Starlette appends "; charset=utf-8" to text/* media types
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+def counter(name: str, documentation: str, labelnames: Iterable[str] = (), callback=None) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames, callback=callback))
+
+
+def gauge(name: str, documentation: str, labelnames: Iterable[str] = (), callback=None) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames, callback=callback))
+
+
+def histogram(name: str, documentation: str, labelnames: Iterable[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets=buckets))
+
+
+def render() -> str:
+    """Render every registered metric in the Prometheus text format"""
+    return REGISTRY.render()
+
+
+# ==================== Application Metrics ====================
+
+HTTP_REQUEST_DURATION = histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route", "status"]
+)
+HTTP_REQUESTS_IN_PROGRESS = gauge(
+    "http_requests_in_progress", "HTTP requests currently being served", ["method"]
+)
+DB_FUNCTION_DURATION = histogram(
+    "db_function_duration_seconds", "Latency of database.py functions", ["function", "outcome"]
+)
+DB_CONNECTIONS_OPENED = counter(
+    "db_connections_opened_total", "Database connections opened", ["db_type"]
+)
+AI_REQUEST_DURATION = histogram(
+    "ai_provider_request_duration_seconds", "Latency of AI provider calls",
+    ["provider", "operation", "outcome"]
+)
+AI_TOKENS = counter(
+    "ai_tokens_total", "Tokens consumed by AI provider calls", ["provider", "kind"]
+)
+
+
+def instrument_function(fn: Callable, histogram: Histogram = DB_FUNCTION_DURATION) -> Callable:
+    """Wrap a function so each call is observed in histogram{function, outcome}"""
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        outcome = 'success'
+        try:
+            return fn(*args, **kwargs)
+        except BaseException:
+            outcome = 'error'
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - started, function=name, outcome=outcome)
+
+    return wrapper
+
+
+def instrument_module(namespace: Dict, module_name: str, histogram: Histogram = DB_FUNCTION_DURATION,
+                      exclude: Iterable[str] = ()):
+    """Instrument every public function defined in a module (call with globals())"""
+    excluded = set(exclude)
+    for name, value in list(namespace.items()):
+        if (callable(value) and not isinstance(value, type) and not name.startswith('_')
+                and getattr(value, '__module__', None) == module_name and name not in excluded):
+            namespace[name] = instrument_function(value, histogram)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording per-route latency (route template, not raw path)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        method = scope['method']
+        status = {'code': 500}
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+            await send(message)
+
+        HTTP_REQUESTS_IN_PROGRESS.inc(method=method)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUESTS_IN_PROGRESS.dec(method=method)
+            route = scope.get('route')
+            # Unmatched paths share one label so scanners cannot blow up cardinality
+            route_path = getattr(route, 'path', None) or 'unmatched'
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - started,
+                                          method=method, route=route_path, status=status['code'])
@@ -0,0 +1,249 @@
+"""
+Ingest source card photos from the Data/YYYY/MM archive
+
+Walks the dated archive incrementally, decodes/orients/downscales new or
+changed photos on a process pool into web-ready derivatives, and links each
+photo to its character row.
+
+Usage:
+    python photo_ingest.py                 # ingest new/changed photos
+    python photo_ingest.py --force         # re-process everything
+    python photo_ingest.py --workers 4     # limit the process pool
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from PIL import Image, ImageOps
+
+# HEIC decoding is optional - JPEG twins are used when it is missing
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+    HEIF_AVAILABLE = True
+except ImportError:
+    HEIF_AVAILABLE = False
+
+ARCHIVE_DIR = Path(__file__).parent / ".." / "Data"
+OUTPUT_DIR = Path(__file__).parent / ".." / "frontend" / "public" / "images" / "photos"
+MANIFEST_FILE = Path(__file__).parent / "data" / "photo_manifest.json"
+
+# Optional sidecar mapping "2026/01/IMG_3063.jpeg" (or "IMG_3063") -> "把"
+CHARACTER_MAP_FILE = ARCHIVE_DIR / "photo_characters.json"
+
+# Preferred source format first - a HEIC and JPEG with the same stem are the same shot
+SOURCE_EXTENSIONS = ['.jpeg', '.jpg', '.png', '.heic', '.heif']
+
+# Web derivatives: (suffix, max edge in px)
+DERIVATIVES = [
+    ("", 1600),
+    ("_thumb", 400),
+]
+JPEG_QUALITY = 82
+
+
+def file_signature(path: Path) -> str:
+    """Cheap change detector based on file size and mtime (no content read)"""
+    stat = path.stat()
+    return hashlib.sha1(f"{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()
+
+
+def load_manifest() -> Dict[str, Dict]:
+    """Load the ingest manifest (relative source path -> signature and outputs)"""
+    if MANIFEST_FILE.exists():
+        try:
+            with open(MANIFEST_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Error loading manifest, starting fresh: {e}")
+    return {}
+
+
+def save_manifest(manifest: Dict[str, Dict]):
+    """Save the ingest manifest atomically"""
+    MANIFEST_FILE.parent.mkdir(exist_ok=True)
+    tmp_file = MANIFEST_FILE.with_suffix('.json.tmp')
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, MANIFEST_FILE)
+
+
+def load_character_map() -> Dict[str, str]:
+    """Load the optional photo -> character sidecar mapping"""
+    if CHARACTER_MAP_FILE.exists():
+        with open(CHARACTER_MAP_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+
+def resolve_character(rel_path: str, character_map: Dict[str, str]) -> Optional[str]:
+    """Find the character a photo belongs to
+
+    Priority:
+    1. Sidecar mapping by relative path
+    2. Sidecar mapping by file stem
+    3. First CJK character in the file name (e.g. 把_01.jpeg)
+    """
+    stem = Path(rel_path).stem
+    if rel_path in character_map:
+        return character_map[rel_path]
+    if stem in character_map:
+        return character_map[stem]
+    for ch in stem:
+        if '一' <= ch <= '鿿':
+            return ch
+    return None
+
+
+def discover_photos(archive_dir: Path) -> List[Path]:
+    """Walk Data/YYYY/MM and pick one source file per photo stem"""
+    photos = []
+    for month_dir in sorted(archive_dir.glob("[0-9][0-9][0-9][0-9]/[0-9][0-9]")):
+        if not month_dir.is_dir():
+            continue
+
+        by_stem: Dict[str, Path] = {}
+        for path in month_dir.iterdir():
+            ext = path.suffix.lower()
+            if ext not in SOURCE_EXTENSIONS:
+                continue
+            if ext in ('.heic', '.heif') and not HEIF_AVAILABLE:
+                continue
+            current = by_stem.get(path.stem)
+            if current is None or SOURCE_EXTENSIONS.index(ext) < SOURCE_EXTENSIONS.index(current.suffix.lower()):
+                by_stem[path.stem] = path
+
+        photos.extend(by_stem[stem] for stem in sorted(by_stem))
+    return photos
+
+
+def process_photo(source: str, rel_path: str, output_dir: str) -> Dict:
+    """Decode, orient and downscale one photo (runs in a worker process)"""
+    rel = Path(rel_path)
+    target_dir = Path(output_dir) / rel.parent
+    target_dir.mkdir(parents=True, exist_ok=True)
+
+    with Image.open(source) as img:
+        # Let the JPEG decoder skip DCT detail we are about to throw away
+        largest_edge = max(size for _, size in DERIVATIVES)
+        img.draft('RGB', (largest_edge, largest_edge))
+        img = ImageOps.exif_transpose(img)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        outputs = {}
+        width, height = img.size
+        for suffix, max_edge in DERIVATIVES:
+            derivative = img.copy()
+            derivative.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            filename = f"{rel.stem}{suffix}.jpg"
+            derivative.save(target_dir / filename, "JPEG", quality=JPEG_QUALITY,
+                            optimize=True, progressive=True)
+            outputs[suffix or "image"] = f"/images/photos/{rel.parent.as_posix()}/{filename}"
+            if not suffix:
+                width, height = derivative.size
+
+    return {
+        'image_path': outputs["image"],
+        'thumb_path': outputs["_thumb"],
+        'width': width,
+        'height': height,
+    }
+
+
+def ingest(force: bool = False, workers: Optional[int] = None, link: bool = True) -> Dict[str, int]:
+    """Ingest new/changed photos from the archive and link them to characters"""
+    archive_dir = ARCHIVE_DIR.resolve()
+    manifest = {} if force else load_manifest()
+    character_map = load_character_map()
+
+    pending = []
+    skipped = 0
+    for path in discover_photos(archive_dir):
+        rel_path = path.relative_to(archive_dir).as_posix()
+        signature = file_signature(path)
+        entry = manifest.get(rel_path)
+        if entry and entry.get('signature') == signature:
+            skipped += 1
+            continue
+        pending.append((path, rel_path, signature))
+
+    print(f"📷 {len(pending)} photos to process, {skipped} unchanged")
+    if not HEIF_AVAILABLE:
+        print("ℹ️  pillow-heif not installed - HEIC-only photos are skipped")
+
+    processed = []
+    failed = 0
+    started = time.time()
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(process_photo, str(path), rel_path, str(OUTPUT_DIR.resolve())): (rel_path, signature)
+                for path, rel_path, signature in pending
+            }
+            for future in as_completed(futures):
+                rel_path, signature = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"  ❌ {rel_path}: {e}")
+                    continue
+
+                result['source_path'] = rel_path
+                result['source_hash'] = signature
+                result['character'] = resolve_character(rel_path, character_map)
+                processed.append(result)
+                print(f"  ✅ {rel_path} -> {result['image_path']}")
+
+    linked = 0
+    if link and processed:
+        # Imported lazily so worker processes never open a database connection
+        from database import save_character_photos
+        linked = save_character_photos(processed)
+
+    # Only photos that reached the database count as done; the rest are retried next run
+    if linked == len(processed) or not link:
+        for result in processed:
+            manifest[result['source_path']] = {
+                'signature': result['source_hash'],
+                'image_path': result['image_path'],
+                'thumb_path': result['thumb_path'],
+                'character': result['character'],
+            }
+        save_manifest(manifest)
+    else:
+        print(f"⚠️  Linking failed - {len(processed)} photos will be re-processed next run")
+
+    elapsed = time.time() - started
+    print(f"\n✅ Processed {len(processed)} photos in {elapsed:.1f}s "
+          f"({failed} failed, {skipped} unchanged, {linked} linked)")
+
+    return {
+        'processed': len(processed),
+        'skipped': skipped,
+        'failed': failed,
+        'linked': linked,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest Data/YYYY/MM card photos")
+    parser.add_argument('--force', action='store_true', help="re-process photos even if unchanged")
+    parser.add_argument('--workers', type=int, default=None, help="process pool size (default: all cores)")
+    parser.add_argument('--no-link', action='store_true', help="only build derivatives, skip the database")
+    args = parser.parse_args(argv)
+
+    result = ingest(force=args.force, workers=args.workers, link=not args.no_link)
+    return 0 if result['failed'] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
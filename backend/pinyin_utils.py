@@ -0,0 +1,62 @@
+"""
+Pinyin normalisation helpers
+
+Card pinyin is stored with tone marks (bǎ, lǜ). Browsing and search need
+forms that can be typed on any keyboard:
+
+    toneless("lǜ")   -> "lv"
+    numbered("lǜ")   -> "lv4"
+    tone("bǎ")       -> 3
+
+ü is written as "v" (the pypinyin / IME convention); the neutral tone is 5.
+Input that already uses tone numbers ("ba3", "lu:4") is accepted as well.
+"""
+import re
+from typing import List, Tuple
+
+NEUTRAL_TONE = 5
+
+_MARKED = {
+    'ā': ('a', 1), 'á': ('a', 2), 'ǎ': ('a', 3), 'à': ('a', 4),
+    'ē': ('e', 1), 'é': ('e', 2), 'ě': ('e', 3), 'è': ('e', 4),
+    'ī': ('i', 1), 'í': ('i', 2), 'ǐ': ('i', 3), 'ì': ('i', 4),
+    'ō': ('o', 1), 'ó': ('o', 2), 'ǒ': ('o', 3), 'ò': ('o', 4),
+    'ū': ('u', 1), 'ú': ('u', 2), 'ǔ': ('u', 3), 'ù': ('u', 4),
+    'ǖ': ('v', 1), 'ǘ': ('v', 2), 'ǚ': ('v', 3), 'ǜ': ('v', 4), 'ü': ('v', 0),
+    'ń': ('n', 2), 'ň': ('n', 3), 'ǹ': ('n', 4), 'ḿ': ('m', 2),
+}
+
+_SYLLABLE_RE = re.compile(r"[a-zü:āáǎàēéěèīíǐìōóǒòūúǔùǖǘǚǜńňǹḿ]+[1-5]?")
+
+
+def syllables(pinyin: str) -> List[str]:
+    """Split "bǎ shǒu" / "ba3'shou3" into lower-case syllables"""
+    return _SYLLABLE_RE.findall((pinyin or '').lower())
+
+
+def split_tone(syllable: str) -> Tuple[str, int]:
+    """("lǜ") -> ("lv", 4); a syllable without a tone gets the neutral tone"""
+    syllable = syllable.replace('u:', 'v')
+    tone = 0
+    if syllable and syllable[-1].isdigit():
+        syllable, tone = syllable[:-1], int(syllable[-1])
+    letters = []
+    for ch in syllable:
+        base, mark = _MARKED.get(ch, (ch, 0))
+        letters.append(base)
+        tone = tone or mark
+    return ''.join(letters), tone or NEUTRAL_TONE
+
+
+def toneless(pinyin: str) -> str:
+    return ' '.join(split_tone(s)[0] for s in syllables(pinyin))
+
+
+def numbered(pinyin: str) -> str:
+    return ' '.join(base + str(tone) for base, tone in map(split_tone, syllables(pinyin)))
+
+
+def tone(pinyin: str) -> int:
+    """Tone of the first syllable (0 when there is no pinyin)"""
+    parts = syllables(pinyin)
+    return split_tone(parts[0])[1] if parts else 0
@@ -0,0 +1,261 @@
+"""
+AI provider failover with circuit breakers
+
+A generation request tries an ordered chain of providers: the one it asked
+for first, then every other provider that has a key configured, in
+PROVIDER_ORDER. Fallback keys come from settings.json ("fallbackProviders":
+[{"provider": "openai", "apiKey": "...", "model": "..."}]) or the environment
+(OPENAI_API_KEY, OPENAI_MODEL, ...).
+
+Each provider has a circuit breaker over a rolling window of its calls:
+
+    closed     calls pass; the breaker opens when, over at least MIN_CALLS in
+               the window, the error rate or the share of slow calls reaches
+               the threshold
+    open       calls are skipped (costs nothing) for OPEN_SECONDS
+    half_open  one probe call is let through; success closes the breaker,
+               failure re-opens it
+
+So a degraded provider costs its first few failures, then nothing until it
+is probed again. Latency is the provider's own: time spent in our rate
+limiter (queueing for a token, backing off between retries) is left out.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Iterator, List, TypeVar
+
+import metrics
+import rate_limiter
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_ORDER = ('kimi', 'openrouter', 'openai', 'siliconflow')
+
+WINDOW_SECONDS = 60
+MIN_CALLS = 5
+ERROR_RATE = 0.5
+SLOW_CALL_SECONDS = float(os.getenv('AI_SLOW_CALL_SECONDS', '20'))
+SLOW_CALL_RATE = 0.5
+OPEN_SECONDS = 30
+
+# Retries per provider when another provider can take over
+FAILOVER_RETRIES = 1
+
+STATES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+T = TypeVar('T')
+
+
+class ProvidersUnavailable(Exception):
+    """Every provider in the chain failed or has its breaker open"""
+
+
+class CircuitBreaker:
+    """Rolling-window breaker for one provider"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = 'closed'
+        self._calls = deque()  # (time, ok, latency)
+        self._opened_until = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may go to this provider now (claims the probe when half-open)"""
+        with self._lock:
+            if self.state == 'open':
+                if time.monotonic() < self._opened_until:
+                    return False
+                self.state, self._probing = 'half_open', False
+            if self.state == 'half_open':
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def release(self):
+        """An allowed call was never made - give the probe back"""
+        with self._lock:
+            self._probing = False
+
+    def record(self, ok: bool, latency: float):
+        now = time.monotonic()
+        ok_and_fast = ok and latency < SLOW_CALL_SECONDS
+        with self._lock:
+            if self.state == 'half_open':
+                self._probing = False
+                if ok_and_fast:
+                    self._close()
+                else:
+                    self._open(now, 'probe failed')
+                return
+            self._calls.append((now, ok, latency))
+            while self._calls and self._calls[0][0] < now - WINDOW_SECONDS:
+                self._calls.popleft()
+            if self.state != 'closed' or len(self._calls) < MIN_CALLS:
+                return
+            errors = sum(1 for _, call_ok, _ in self._calls if not call_ok)
+            slow = sum(1 for _, call_ok, call_latency in self._calls if call_ok and call_latency >= SLOW_CALL_SECONDS)
+            if errors / len(self._calls) >= ERROR_RATE:
+                self._open(now, f"{errors}/{len(self._calls)} calls failed")
+            elif slow / len(self._calls) >= SLOW_CALL_RATE:
+                self._open(now, f"{slow}/{len(self._calls)} calls slower than {SLOW_CALL_SECONDS:.0f}s")
+
+    def _open(self, now: float, reason: str):
+        self.state = 'open'
+        self._opened_until = now + OPEN_SECONDS
+        self._calls.clear()
+        logger.warning("AI provider circuit opened", extra={'provider': self.name, 'reason': reason})
+
+    def _close(self):
+        self.state = 'closed'
+        self._calls.clear()
+        logger.info("AI provider circuit closed", extra={'provider': self.name})
+
+
+breakers: Dict[str, CircuitBreaker] = {name: CircuitBreaker(name) for name in PROVIDER_ORDER}
+
+metrics.gauge("ai_provider_circuit_state", "AI provider circuit breaker state (0 closed, 1 half-open, 2 open)",
+              ["provider"], callback=lambda: {(name, ): STATES[b.state] for name, b in breakers.items()})
+AI_FAILOVERS = metrics.counter("ai_provider_failovers_total", "Generation calls moved on to the next provider",
+                               ["provider", "reason"])
+
+
+def _breaker(provider: str) -> CircuitBreaker:
+    if provider not in breakers:
+        breakers[provider] = CircuitBreaker(provider)
+    return breakers[provider]
+
+
+class _Timer:
+    """Wall time since start, less what the rate limiter slept meanwhile"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.waited = rate_limiter.waited_seconds()
+
+    def elapsed(self) -> float:
+        return max(0.0, time.monotonic() - self.started - (rate_limiter.waited_seconds() - self.waited))
+
+
+def _fallback_settings() -> List[Dict]:
+    """Configured fallback providers as [{'provider', 'api_key', 'model'}], settings.json first"""
+    from settings_manager import load_settings
+
+    configured = [{'provider': entry.get('provider'), 'api_key': entry.get('apiKey'), 'model': entry.get('model')}
+                  for entry in load_settings().get('fallbackProviders') or []]
+    for provider in PROVIDER_ORDER:
+        api_key = os.getenv(f"{provider.upper()}_API_KEY")
+        if api_key:
+            configured.append({'provider': provider, 'api_key': api_key,
+                               'model': os.getenv(f"{provider.upper()}_MODEL")})
+    return configured
+
+
+def candidates(settings):
+    """The chain for a request: its own provider, then configured fallbacks in PROVIDER_ORDER"""
+    from ai_service import AISettings, PROVIDER_ENDPOINTS
+
+    chain = [settings]
+    seen = {settings.provider}
+    fallbacks = sorted(_fallback_settings(), key=lambda entry: PROVIDER_ORDER.index(entry['provider'])
+                       if entry['provider'] in PROVIDER_ORDER else len(PROVIDER_ORDER))
+    for entry in fallbacks:
+        provider = entry['provider']
+        endpoint = PROVIDER_ENDPOINTS.get(provider)
+        if provider in seen or endpoint is None or not entry['api_key']:
+            continue
+        # settings.model names a model of the requested provider - never reuse it
+        model = entry['model'] or endpoint['default_model']
+        if not model:
+            continue
+        seen.add(provider)
+        chain.append(AISettings(provider=provider, api_key=entry['api_key'], model=model))
+    return chain
+
+
+def run(settings, call: Callable[..., T]) -> T:
+    """call(candidate_settings, max_retries) down the chain until one succeeds
+
+    Raises ProvidersUnavailable when every provider failed or is open.
+    """
+    chain = candidates(settings)
+    errors = []
+    for position, candidate in enumerate(chain):
+        breaker = _breaker(candidate.provider)
+        if not breaker.allow():
+            errors.append(f"{candidate.provider}: circuit open")
+            continue
+        last = position == len(chain) - 1
+        timer = _Timer()
+        try:
+            result = call(candidate, rate_limiter.MAX_RETRIES if last else FAILOVER_RETRIES)
+        except rate_limiter.RateLimitExceeded as e:
+            # Our own queue is full - says nothing about the provider's health
+            breaker.release()
+            errors.append(f"{candidate.provider}: {e}")
+            AI_FAILOVERS.inc(provider=candidate.provider, reason='rate_limited')
+            continue
+        except Exception as e:
+            breaker.record(False, timer.elapsed())
+            errors.append(f"{candidate.provider}: {e}")
+            AI_FAILOVERS.inc(provider=candidate.provider, reason='error')
+            logger.warning("AI provider failed", extra={'provider': candidate.provider, 'error': str(e)})
+            continue
+        breaker.record(True, timer.elapsed())
+        return result
+    raise ProvidersUnavailable("所有 AI 服务暂时不可用: " + "; ".join(errors))
+
+
+def stream(settings, open_stream: Callable[..., Iterator[T]]) -> Iterator[T]:
+    """Like run() for streams: fails over until a provider yields its first chunk
+
+    A failure after the first chunk is recorded and re-raised - the caller has
+    already seen partial output, so it cannot be retried elsewhere.
+    """
+    chain = candidates(settings)
+    errors = []
+    for position, candidate in enumerate(chain):
+        breaker = _breaker(candidate.provider)
+        if not breaker.allow():
+            errors.append(f"{candidate.provider}: circuit open")
+            continue
+        last = position == len(chain) - 1
+        timer = _Timer()
+        chunks = open_stream(candidate, rate_limiter.MAX_RETRIES if last else FAILOVER_RETRIES)
+        try:
+            first = next(chunks)
+        except StopIteration:
+            breaker.record(True, timer.elapsed())
+            return
+        except rate_limiter.RateLimitExceeded as e:
+            breaker.release()
+            errors.append(f"{candidate.provider}: {e}")
+            AI_FAILOVERS.inc(provider=candidate.provider, reason='rate_limited')
+            continue
+        except Exception as e:
+            breaker.record(False, timer.elapsed())
+            errors.append(f"{candidate.provider}: {e}")
+            AI_FAILOVERS.inc(provider=candidate.provider, reason='error')
+            logger.warning("AI provider failed", extra={'provider': candidate.provider, 'error': str(e)})
+            continue
+
+        # Judged on time to first chunk - a long answer is not a slow provider
+        breaker.record(True, timer.elapsed())
+        yield first
+        try:
+            yield from chunks
+        except Exception:
+            breaker.record(False, timer.elapsed())
+            raise
+        return
+    raise ProvidersUnavailable("所有 AI 服务暂时不可用: " + "; ".join(errors))
+
+
+def get_status() -> Dict[str, str]:
+    """Breaker state per provider"""
+    return {name: breaker.state for name, breaker in breakers.items()}
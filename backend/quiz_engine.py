@@ -0,0 +1,366 @@
+"""
+Quiz generation from the cards, words and a user's due items
+
+Questions are multiple choice:
+
+    char_pinyin    把 -> which pinyin?          distractors: same syllable in another tone, same final, same radical
+    pinyin_char    bǎ -> which character?       distractors: shared component, same radical, same stroke count
+    char_meaning   把 -> which meaning?         distractors: confusable meaning, shared component, same radical
+    word_meaning   把握 -> which meaning?       distractors: confusable meaning, words sharing a character
+
+Distractors come from QuizIndex: in-memory buckets (radical, stroke count,
+syllable, final, component links from character_edges, meaning keywords,
+words by character and length) built once per content version. Meanings
+confuse when they share a keyword - an English word or a Han character of
+the definition ("hold" in "to hold; grasp" and "to hold up"); keywords too
+common to say anything (the, 的, or any in more than MAX_KEYWORD_SHARE of
+the entries) are dropped. Picking one samples a few
+entries from a bucket - the cost does not grow with the number of cards.
+
+The same seed, content version and user progress give the same quiz; a
+response always carries its seed so a quiz can be replayed.
+
+Usage:
+    python quiz_engine.py --count 5 --seed 42
+"""
+import argparse
+import logging
+import random
+import re
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Sequence
+
+import content_bundle
+import pinyin_utils
+from db_manager import get_db
+from singleflight import single_flight
+
+logger = logging.getLogger(__name__)
+
+QUESTION_TYPES = ('char_pinyin', 'pinyin_char', 'char_meaning', 'word_meaning')
+
+MAX_QUESTIONS = 50
+MIN_OPTIONS = 2
+MAX_OPTIONS = 6
+
+# Progress below this (or not yet learned) makes a card due
+DUE_PROFICIENCY = 4
+
+# Distractor buckets tried in order for each question type
+STRATEGIES = {
+    'char_pinyin': ('syllable', 'final', 'radical'),
+    'pinyin_char': ('component', 'radical', 'stroke_count'),
+    'char_meaning': ('meaning', 'component', 'radical'),
+    'word_meaning': ('meaning', 'shared_char', 'length'),
+}
+
+_INITIAL_RE = re.compile(r'^(zh|ch|sh|[bpmfdtnlgkhjqxrzcsyw])')
+
+_KEYWORD_RE = re.compile(r'[a-z]{3,}|[\u3400-\u9fff]')
+_STOPWORDS = frozenset(
+    'the and for with from that this into used also its one not something someone sth '
+    'sb etc 的 之 一 是 有 在 和 或 等 用 为 与 了 不 人 个 也 其 这 那 某'.split())
+# A keyword in more than this share of cards (or words) is not a sign of confusability
+MAX_KEYWORD_SHARE = 0.05
+# Rarest keywords of an entry that are sampled from
+MAX_KEYWORDS = 4
+
+
+def _final(syllable: str) -> str:
+    """"zhang" -> "ang" (rhyming syllables make plausible wrong pinyin)"""
+    return _INITIAL_RE.sub('', syllable) or syllable
+
+
+def _keywords(meaning: str) -> List[str]:
+    """Distinct content words / Han characters of a definition"""
+    return list(dict.fromkeys(k for k in _KEYWORD_RE.findall(meaning.lower()) if k not in _STOPWORDS))
+
+
+def _meaning_buckets(items: List[Dict]) -> Dict[str, List[int]]:
+    """keyword -> indexes of items whose meaning has it, without over-common keywords"""
+    buckets = defaultdict(list)
+    for i, item in enumerate(items):
+        for keyword in _keywords(item['meaning']):
+            buckets[keyword].append(i)
+    limit = max(50, int(len(items) * MAX_KEYWORD_SHARE))
+    return {keyword: members for keyword, members in buckets.items() if 1 < len(members) <= limit}
+
+
+def _sample(rng: random.Random, population: Sequence, k: int) -> List:
+    """Up to k random entries; O(k) for large populations (random.sample selects, not shuffles)"""
+    return rng.sample(population, min(k, len(population)))
+
+
+class QuizIndex:
+    """Cards and words with distractor buckets, for one content version"""
+
+    def __init__(self, version: int, cards: List[Dict], words: List[Dict], components: Dict[str, set]):
+        self.version = version
+        self.cards = cards
+        self.words = words
+        self.card_by_id = {card['id']: i for i, card in enumerate(cards)}
+        card_by_char = {card['character']: i for i, card in enumerate(cards)}
+
+        self.card_buckets: Dict[str, Dict] = {name: defaultdict(list) for name in
+                                              ('radical', 'stroke_count', 'syllable', 'final', 'component')}
+        self.card_buckets['meaning'] = _meaning_buckets(cards)
+        for i, card in enumerate(cards):
+            for name in ('radical', 'stroke_count', 'syllable', 'final'):
+                if card[name]:
+                    self.card_buckets[name][card[name]].append(i)
+            self.card_buckets['component'][card['character']] = sorted(
+                card_by_char[char] for char in components.get(card['character'], ()) if char in card_by_char)
+
+        self.word_buckets: Dict[str, Dict] = {'shared_char': defaultdict(list), 'length': defaultdict(list),
+                                              'meaning': _meaning_buckets(words)}
+        self.words_by_card: Dict[int, List[int]] = defaultdict(list)
+        for i, word in enumerate(words):
+            for char in set(word['word']):
+                self.word_buckets['shared_char'][char].append(i)
+            self.word_buckets['length'][len(word['word'])].append(i)
+            if word['character_id'] in self.card_by_id:
+                self.words_by_card[word['character_id']].append(i)
+
+    def candidates(self, rng: random.Random, kind: str, strategy: str, item: Dict, k: int) -> List[int]:
+        """Up to k random entries of item's bucket for strategy (k per character / keyword for shared_char, meaning)"""
+        if strategy == 'meaning':
+            buckets = self.word_buckets['meaning'] if kind == 'word' else self.card_buckets['meaning']
+            # Rarest keywords first: they are the most specific
+            keywords = sorted((k for k in _keywords(item['meaning']) if k in buckets), key=lambda k: len(buckets[k]))
+            return [i for keyword in keywords[:MAX_KEYWORDS] for i in _sample(rng, buckets[keyword], k)]
+        if kind == 'word':
+            if strategy == 'length':
+                return _sample(rng, self.word_buckets['length'].get(len(item['word']), ()), k)
+            return [i for char in dict.fromkeys(item['word'])
+                    for i in _sample(rng, self.word_buckets['shared_char'].get(char, ()), k)]
+        key = item['character'] if strategy == 'component' else item[strategy]
+        return _sample(rng, self.card_buckets[strategy].get(key, ()), k) if key else []
+
+
+def _load_index() -> QuizIndex:
+    conn = get_db(readonly=True)
+    cursor = conn.cursor()
+    try:
+        version = content_bundle.current_version(cursor)
+        cursor.execute("""
+            SELECT c.id, c.character, c.pinyin, c.meaning, f.radical, f.stroke_count, f.pinyin_toneless
+            FROM characters c
+            LEFT JOIN character_facets f ON f.character_id = c.id
+            ORDER BY c.id
+        """)
+        card_rows = cursor.fetchall()
+        cursor.execute("""
+            SELECT id, word, pinyin, chinese_meaning, english_translation, character_id
+            FROM words
+            ORDER BY id
+        """)
+        word_rows = cursor.fetchall()
+        cursor.execute("""
+            SELECT source, target, relation FROM character_edges
+            WHERE relation IN ('component', 'derived')
+        """)
+        edge_rows = cursor.fetchall()
+    finally:
+        conn.close()
+
+    cards = []
+    for row in card_rows:
+        syllable = (row['pinyin_toneless'] or '').split(' ')[0]
+        cards.append({
+            'id': row['id'],
+            'character': row['character'],
+            'pinyin': row['pinyin'] or '',
+            'meaning': (row['meaning'] or '').strip(),
+            'radical': row['radical'],
+            'stroke_count': row['stroke_count'],
+            'syllable': syllable or None,
+            'final': _final(syllable) if syllable else None,
+        })
+
+    words = [{
+        'id': row['id'],
+        'word': row['word'],
+        'pinyin': row['pinyin'] or '',
+        'meaning': (row['english_translation'] or row['chinese_meaning'] or '').strip(),
+        'character_id': row['character_id'],
+    } for row in word_rows if row['word']]
+
+    # 把 is built on 巴: 巴, the characters built on 把, and 把's siblings 爸, 吧 ... all confuse with it
+    bases: Dict[str, set] = defaultdict(set)
+    derived: Dict[str, set] = defaultdict(set)
+    for row in edge_rows:
+        base, char = ((row['target'], row['source']) if row['relation'] == 'component'
+                      else (row['source'], row['target']))
+        bases[char].add(base)
+        derived[base].add(char)
+    components: Dict[str, set] = {}
+    for char in set(bases) | set(derived):
+        similar = bases[char] | derived[char]
+        for base in bases[char]:
+            similar |= derived[base]
+        components[char] = similar - {char}
+
+    logger.info("Quiz index built", extra={'version': version, 'cards': len(cards), 'words': len(words)})
+    return QuizIndex(version, cards, words, components)
+
+
+_index: Optional[QuizIndex] = None
+
+
+@single_flight('quiz_index')
+def get_index() -> QuizIndex:
+    """The index for the current content version (rebuilt after content changes)"""
+    global _index
+    conn = get_db(readonly=True)
+    cursor = conn.cursor()
+    try:
+        version = content_bundle.current_version(cursor)
+    finally:
+        conn.close()
+    if _index is None or _index.version != version:
+        _index = _load_index()
+    return _index
+
+
+def _due_card_ids(user_id: int, limit: int) -> List[int]:
+    """A user's cards still being learned, least recently reviewed first"""
+    conn = get_db(readonly=True, user_id=user_id)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT character_id FROM user_character_progress
+            WHERE user_id = ? AND (NOT is_learned OR proficiency < ?)
+            ORDER BY last_reviewed IS NOT NULL, last_reviewed, character_id
+            LIMIT ?
+        """, (user_id, DUE_PROFICIENCY, limit))
+        return [row['character_id'] for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+
+def _options(rng: random.Random, index: QuizIndex, kind: str, item: Dict, strategies: Sequence[str],
+             text: Callable[[Dict], str], count: int,
+             exclude: Optional[Callable[[Dict], bool]] = None) -> List[str]:
+    """count - 1 distinct wrong option texts for item, from its buckets first, then anywhere"""
+    pool = index.words if kind == 'word' else index.cards
+    seen = {text(item)}
+    chosen = []
+
+    def take(candidates) -> bool:
+        for i in candidates:
+            other = pool[i]
+            option = text(other)
+            if other is item or not option or option in seen or (exclude and exclude(other)):
+                continue
+            seen.add(option)
+            chosen.append(option)
+            if len(chosen) == count - 1:
+                return True
+        return False
+
+    # Oversample: some candidates share the answer's text
+    for strategy in strategies:
+        if take(index.candidates(rng, kind, strategy, item, 3 * count)):
+            return chosen
+    for _ in range(3):
+        if take(_sample(rng, range(len(pool)), 5 * count)):
+            return chosen
+    return chosen
+
+
+def _question(rng: random.Random, index: QuizIndex, qtype: str, item: Dict, option_count: int) -> Optional[Dict]:
+    kind, exclude = 'character', None
+    if qtype == 'char_pinyin':
+        prompt, text = item['character'], lambda c: c['pinyin']
+    elif qtype == 'pinyin_char':
+        prompt, text = item['pinyin'], lambda c: c['character']
+        # A homophone would be a right answer too
+        answer_pinyin = pinyin_utils.numbered(item['pinyin'])
+        exclude = lambda c: pinyin_utils.numbered(c['pinyin']) == answer_pinyin
+    elif qtype == 'char_meaning':
+        prompt, text = item['character'], lambda c: c['meaning']
+    else:
+        kind, prompt, text = 'word', item['word'], lambda w: w['meaning']
+
+    if not prompt or not text(item):
+        return None
+    wrong = _options(rng, index, kind, item, STRATEGIES[qtype], text, option_count, exclude)
+    if len(wrong) < MIN_OPTIONS - 1:
+        return None
+
+    options = wrong + [text(item)]
+    rng.shuffle(options)
+    question = {
+        'type': qtype,
+        'prompt': prompt,
+        'options': options,
+        'answer': options.index(text(item)),
+        'subject': {'kind': kind, 'id': item['id']},
+    }
+    if kind == 'word':
+        question['pinyin'] = item['pinyin']
+    return question
+
+
+def _next_item(rng: random.Random, index: QuizIndex, kind: str, due: List[int], used: set) -> Optional[Dict]:
+    """The next unused due card (or word of a due card), else a random one"""
+    if kind == 'word':
+        pool = index.words
+        due = [i for card in due for i in index.words_by_card.get(index.cards[card]['id'], ())]
+    else:
+        pool = index.cards
+    for i in [*due, *_sample(rng, range(len(pool)), 5)]:
+        if (kind, i) not in used:
+            used.add((kind, i))
+            return pool[i]
+    return None
+
+
+def generate_quiz(count: int = 10, user_id: Optional[int] = None, types: Optional[Sequence[str]] = None,
+                  seed: Optional[int] = None, option_count: int = 4) -> Dict:
+    """count questions, due cards (and their words) for user_id first; raises ValueError for bad arguments"""
+    types = list(types or QUESTION_TYPES)
+    unknown = sorted(set(types) - set(QUESTION_TYPES))
+    if unknown:
+        raise ValueError(f"Unknown question types: {', '.join(unknown)} (use {', '.join(QUESTION_TYPES)})")
+    count = max(1, min(count, MAX_QUESTIONS))
+    option_count = max(MIN_OPTIONS, min(option_count, MAX_OPTIONS))
+    if seed is None:
+        seed = random.randrange(2 ** 31)
+    rng = random.Random(seed)
+
+    index = get_index()
+    due = [index.card_by_id[card_id] for card_id in (_due_card_ids(user_id, count) if user_id else [])
+           if card_id in index.card_by_id]
+
+    questions, used = [], set()
+    for attempt in range(4 * count):
+        if len(questions) == count:
+            break
+        qtype = types[attempt % len(types)]
+        item = _next_item(rng, index, 'word' if qtype == 'word_meaning' else 'character', due, used)
+        question = item and _question(rng, index, qtype, item, option_count)
+        if question:
+            questions.append(question)
+
+    return {'seed': seed, 'version': index.version, 'questions': questions}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a quiz")
+    parser.add_argument("--count", type=int, default=10)
+    parser.add_argument("--user", type=int, default=None, help="put this user's due cards first")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--types", default=None, help=f"comma-separated: {', '.join(QUESTION_TYPES)}")
+    args = parser.parse_args(argv)
+
+    quiz = generate_quiz(args.count, args.user, args.types.split(',') if args.types else None, args.seed)
+    print(f"seed {quiz['seed']}, content version {quiz['version']}")
+    for n, question in enumerate(quiz['questions'], 1):
+        print(f"{n}. [{question['type']}] {question['prompt']}")
+        for i, option in enumerate(question['options']):
+            print(f"   {'*' if i == question['answer'] else ' '} {option}")
+
+
+if __name__ == "__main__":
+    main()
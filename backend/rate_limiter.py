@@ -0,0 +1,264 @@
+"""
+AI provider rate limiting with retries
+
+Each provider + API key has a token bucket (refilled at the provider's
+requests-per-minute limit, up to a burst) stored in a local SQLite file, so
+every worker process on the host draws from the same bucket. A call that
+finds the bucket empty sleeps until its token is due instead of sending a
+request the provider would reject.
+
+Throttled and transient failures (429, 5xx, connection errors, timeouts)
+are retried with jittered exponential backoff. A 429's Retry-After also
+pauses the whole bucket until then, so other workers - including those
+already asleep waiting for their token - back off too instead of piling on.
+
+Callers that find the bucket empty queue for the next free slot. The queue
+is bounded by time: a call that would wait longer than MAX_WAIT_SECONDS fails
+fast with RateLimitExceeded instead.
+
+Limits come from PROVIDER_ENDPOINTS[...]['rate_limit'] in ai_service.py and
+can be overridden per provider, e.g. AI_RATE_LIMIT_KIMI="60/5" (60 requests
+a minute, bursts of 5) or "0" to disable.
+"""
+import email.utils
+import hashlib
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+
+import requests
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+STORE_PATH = Path(os.getenv('AI_RATE_LIMIT_STORE', str(Path(__file__).parent / "data" / "rate_limits.db")))
+
+MAX_WAIT_SECONDS = float(os.getenv('AI_RATE_LIMIT_MAX_WAIT', '120'))
+
+MAX_RETRIES = 4
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_CAP_SECONDS = 30.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+RATE_LIMIT_WAIT = metrics.histogram(
+    "ai_rate_limit_wait_seconds", "Time AI calls waited for a rate limit token", ["provider"],
+    buckets=(0.01, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+)
+AI_RETRIES = metrics.counter("ai_provider_retries_total", "AI provider calls retried", ["provider", "reason"])
+AI_RATE_LIMITED = metrics.counter("ai_rate_limit_rejected_total",
+                                  "AI calls rejected because the rate limit queue was full", ["provider"])
+
+
+class RateLimitExceeded(Exception):
+    """The call would wait longer than allowed for a rate limit token"""
+
+
+def limit_for(provider: str, default: Optional[Tuple[float, int]]) -> Optional[Tuple[float, int]]:
+    """(requests per minute, burst) for provider, None for unlimited"""
+    override = os.getenv(f"AI_RATE_LIMIT_{provider.upper()}")
+    if override is None:
+        return default
+    rpm, _, burst = override.partition('/')
+    if float(rpm) <= 0:
+        return None
+    return float(rpm), int(burst or 1)
+
+
+def bucket_key(provider: str, api_key: str) -> str:
+    """Bucket name; the key itself is never stored"""
+    return f"{provider}:{hashlib.sha256((api_key or '').encode()).hexdigest()[:16]}"
+
+
+class TokenBucketStore:
+    """Token buckets in a SQLite file shared by every process on the host
+
+    tokens may go negative: a caller that finds the bucket empty reserves the
+    next free slot and sleeps until then, so queued callers are served in
+    order, one per 1/rate seconds, without polling. not_before is when a
+    429 said the provider will take requests again; no token is used before it.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rate_buckets (
+                    bucket TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    not_before REAL NOT NULL DEFAULT 0
+                )
+            """)
+            # Stores created before pauses were kept apart from the tokens
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(rate_buckets)")]
+            if 'not_before' not in columns:
+                try:
+                    conn.execute("ALTER TABLE rate_buckets ADD COLUMN not_before REAL NOT NULL DEFAULT 0")
+                except sqlite3.OperationalError:
+                    # Another process added it first
+                    pass
+            self._local.conn = conn
+        return conn
+
+    def _update(self, bucket: str, rate: float, burst: int,
+                change: Callable[[float, float, float], Optional[Tuple[float, float]]]):
+        """Apply change(tokens, not_before, now) atomically across processes
+
+        change returns the new (tokens, not_before), or None to leave the bucket as is.
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute("SELECT tokens, updated_at, not_before FROM rate_buckets WHERE bucket = ?",
+                               (bucket,)).fetchone()
+            tokens = float(burst) if row is None else min(float(burst), row[0] + (now - row[1]) * rate)
+            new_state = change(tokens, 0.0 if row is None else row[2], now)
+            if new_state is not None:
+                conn.execute("""
+                    INSERT INTO rate_buckets (bucket, tokens, updated_at, not_before) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (bucket) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at,
+                                                       not_before = excluded.not_before
+                """, (bucket, new_state[0], now, new_state[1]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def reserve(self, bucket: str, rate: float, burst: int, max_wait: float) -> Optional[float]:
+        """Reserve a token; seconds until it may be used, or None when that is beyond max_wait"""
+        result = {}
+
+        def take(tokens: float, not_before: float, now: float) -> Optional[Tuple[float, float]]:
+            wait = max(0.0, (1 - tokens) / rate, not_before - now)
+            if wait > max_wait:
+                return None
+            result['wait'] = wait
+            return tokens - 1, not_before
+
+        self._update(bucket, rate, burst, take)
+        return result.get('wait')
+
+    def pause(self, bucket: str, rate: float, burst: int, seconds: float):
+        """Hold every caller of bucket for seconds from now (the provider answered 429)
+
+        Pauses do not add up: overlapping 429s keep the latest resume time.
+        """
+        self._update(bucket, rate, burst, lambda tokens, not_before, now: (tokens, max(not_before, now + seconds)))
+
+    def paused_until(self, bucket: str) -> float:
+        """Time (epoch seconds) before which bucket's tokens may not be used"""
+        row = self._conn().execute("SELECT not_before FROM rate_buckets WHERE bucket = ?", (bucket,)).fetchone()
+        return 0.0 if row is None else row[0]
+
+
+store = TokenBucketStore(STORE_PATH)
+
+
+_waits = threading.local()
+
+
+def waited_seconds() -> float:
+    """Seconds this thread has slept in the limiter so far (token waits and retry backoff)
+
+    The difference around a provider call is the part of its duration that
+    was spent here rather than on the provider.
+    """
+    return getattr(_waits, 'seconds', 0.0)
+
+
+def _sleep(seconds: float):
+    started = time.monotonic()
+    time.sleep(seconds)
+    _waits.seconds = waited_seconds() + time.monotonic() - started
+
+
+def acquire(provider: str, bucket: str, limit: Tuple[float, int], max_wait: float = MAX_WAIT_SECONDS):
+    """Wait for a token from bucket; raises RateLimitExceeded when the queue is more than max_wait deep"""
+    rpm, burst = limit
+    started = time.time()
+    wait = store.reserve(bucket, rpm / 60, burst, max_wait)
+    if wait is None:
+        AI_RATE_LIMITED.inc(provider=provider)
+        raise RateLimitExceeded("AI 请求排队已满，请稍后再试")
+    while wait > 0:
+        _sleep(wait)
+        # A 429 that arrived while this call slept holds it too
+        now = time.time()
+        wait = store.paused_until(bucket) - now
+        if wait > 0 and now + wait - started > max_wait:
+            RATE_LIMIT_WAIT.observe(now - started, provider=provider)
+            AI_RATE_LIMITED.inc(provider=provider)
+            raise RateLimitExceeded("AI 请求排队已满，请稍后再试")
+    RATE_LIMIT_WAIT.observe(time.time() - started, provider=provider)
+
+
+def retry_after_seconds(response: requests.Response) -> Optional[float]:
+    """Retry-After as seconds (it may be a number or an HTTP date)"""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_seconds(attempt: int) -> float:
+    """Full-jitter exponential backoff for retry attempt (0-based)"""
+    return random.uniform(0, min(BACKOFF_CAP_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+def call(provider: str, api_key: str, limit: Optional[Tuple[float, int]],
+         send: Callable[[], requests.Response], max_retries: int = MAX_RETRIES) -> requests.Response:
+    """Send a provider request under its rate limit, retrying throttled and transient failures
+
+    Returns the last response (the caller handles its status); raises the last
+    connection error, or RateLimitExceeded when the limiter cannot admit the call.
+    """
+    bucket = bucket_key(provider, api_key)
+    attempt = 0
+    while True:
+        if limit:
+            acquire(provider, bucket, limit)
+        try:
+            response = send()
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == max_retries:
+                raise
+            reason, delay = type(e).__name__, backoff_seconds(attempt)
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt == max_retries:
+                return response
+            reason, delay = str(response.status_code), backoff_seconds(attempt)
+            retry_after = retry_after_seconds(response)
+            if retry_after is not None:
+                delay = min(retry_after, MAX_WAIT_SECONDS)
+            response.close()
+
+        AI_RETRIES.inc(provider=provider, reason=reason)
+        logger.warning("Retrying AI provider call",
+                       extra={'provider': provider, 'reason': reason, 'attempt': attempt + 1, 'delay': round(delay, 2)})
+        if limit and reason == '429':
+            # Every caller of the bucket backs off, not just this one; acquire() does the waiting
+            store.pause(bucket, limit[0] / 60, limit[1], delay)
+        else:
+            _sleep(delay)
+        attempt += 1
@@ -0,0 +1,285 @@
+"""
+Append-only review event log
+
+user_character_progress keeps one row per (user, character) - the current
+state. Every progress write also appends a row to review_events in the same
+transaction, so the history behind that state (when each review happened and
+what proficiency it left) is kept for learning curves and analytics.
+
+Storage is split by time:
+
+    PostgreSQL  review_events is range-partitioned by month on reviewed_at
+                (review_events_y2026m10, ...). Queries bounded on reviewed_at
+                only scan the partitions they touch, and old months are
+                dropped whole. Partitions are created PARTITIONS_AHEAD months
+                in advance - at startup, by --maintain, and by the first review
+                each process writes in a new month, so a long-running server
+                stays ahead on its own. A default partition catches anything
+                outside them.
+    SQLite      one table indexed on reviewed_at; old months are deleted.
+
+Either way, months older than RETENTION_MONTHS are first archived to
+data/review_archive/review-events-YYYY-MM.jsonl.gz, then removed.
+
+Usage:
+    python review_log.py --maintain   # create upcoming partitions, archive + drop expired months
+
+Expired months are only archived and dropped by --maintain: run it from cron
+(monthly is enough).
+"""
+import argparse
+import gzip
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from db_manager import get_db, get_db_type
+from serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = Path(__file__).parent / "data" / "review_archive"
+
+RETENTION_MONTHS = int(os.getenv('REVIEW_EVENTS_RETENTION_MONTHS', '24'))
+# Monthly partitions kept ready beyond the current month
+PARTITIONS_AHEAD = 3
+# How far in the future a client's reviewed_at may be (its clock running fast)
+MAX_CLOCK_SKEW_SECONDS = 300
+
+COLUMNS = ('user_id', 'character_id', 'reviewed_at', 'is_learned', 'proficiency')
+
+# Rows per multi-row INSERT (5 parameters each, well under SQLite's variable limit)
+INSERT_CHUNK = 500
+
+# Month (year, month) this process last made sure the partitions ahead exist
+_partitions_checked: Optional[Tuple[int, int]] = None
+
+INSERT_EVENT = f"INSERT INTO review_events ({', '.join(COLUMNS)}) VALUES (?, ?, ?, ?, ?)"
+
+
+def now() -> str:
+    """Current UTC time in the TIMESTAMP format both dialects store"""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def to_reviewed_at(value: datetime) -> str:
+    """A client-supplied review time in the stored format (naive times are UTC)
+
+    Raises ValueError for a time in the future, or older than the retention
+    window - prune() would already have archived its month.
+    """
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    current = datetime.now(timezone.utc).replace(tzinfo=None)
+    if value > current + timedelta(seconds=MAX_CLOCK_SKEW_SECONDS):
+        raise ValueError(f"reviewed_at {value.isoformat()} is in the future")
+    cutoff = _month_start(*_month(current, -RETENTION_MONTHS))
+    formatted = value.strftime('%Y-%m-%d %H:%M:%S')
+    if formatted < cutoff:
+        raise ValueError(f"reviewed_at {value.isoformat()} is older than the {RETENTION_MONTHS}-month review log")
+    return formatted
+
+
+def _month(value: datetime, offset: int = 0) -> Tuple[int, int]:
+    """(year, month) offset months from value's month"""
+    index = value.year * 12 + value.month - 1 + offset
+    return index // 12, index % 12 + 1
+
+
+def _month_start(year: int, month: int) -> str:
+    return f"{year:04d}-{month:02d}-01 00:00:00"
+
+
+def _partition_name(year: int, month: int) -> str:
+    return f"review_events_y{year:04d}m{month:02d}"
+
+
+def _ensure_partitions_this_month(cursor):
+    """Once a month per process, before a write: create any missing partitions ahead (PostgreSQL)"""
+    global _partitions_checked
+    month = _month(datetime.now(timezone.utc))
+    if month == _partitions_checked or get_db_type() != 'postgresql':
+        return
+    ensure_partitions(cursor)
+    _partitions_checked = month
+
+
+def record(cursor, user_id: int, character_id: int, is_learned: bool, proficiency: Optional[int],
+           reviewed_at: Optional[str] = None):
+    """Append one review (call inside the transaction that upserts the progress row)"""
+    _ensure_partitions_this_month(cursor)
+    cursor.execute(INSERT_EVENT, (user_id, character_id, reviewed_at or now(), is_learned, proficiency))
+
+
+def record_many(cursor, events: Iterable[Dict]):
+    """Append many reviews in one statement batch
+
+    Each event has user_id, character_id, is_learned, proficiency and an
+    optional reviewed_at ('YYYY-MM-DD HH:MM:SS' UTC; defaults to now).
+    """
+    _ensure_partitions_this_month(cursor)
+    reviewed_at = now()
+    rows = [(e['user_id'], e['character_id'], e.get('reviewed_at') or reviewed_at,
+             e.get('is_learned', True), e.get('proficiency')) for e in events]
+    # Multi-row VALUES: one round trip per chunk on PostgreSQL, where executemany sends one per row
+    for start in range(0, len(rows), INSERT_CHUNK):
+        chunk = rows[start:start + INSERT_CHUNK]
+        values = ', '.join(['(?, ?, ?, ?, ?)'] * len(chunk))
+        cursor.execute(f"INSERT INTO review_events ({', '.join(COLUMNS)}) VALUES {values}",
+                       [value for row in chunk for value in row])
+
+
+def ensure_partitions(cursor, ahead: int = PARTITIONS_AHEAD):
+    """Create the monthly partitions from last month to ahead months out (PostgreSQL)
+
+    Runs at startup and from --maintain. A month that already has rows in the
+    default partition cannot be attached; those rows stay in the default
+    partition and are pruned from there.
+    """
+    today = datetime.now(timezone.utc)
+    for offset in range(-1, ahead + 1):
+        year, month = _month(today, offset)
+        next_year, next_month = _month(today, offset + 1)
+        cursor.execute("SELECT to_regclass(?) AS oid", (_partition_name(year, month),))
+        if cursor.fetchone()['oid'] is not None:
+            continue
+        cursor.execute("SAVEPOINT review_partition")
+        try:
+            cursor.execute(f"""
+                CREATE TABLE {_partition_name(year, month)} PARTITION OF review_events
+                FOR VALUES FROM ('{_month_start(year, month)}') TO ('{_month_start(next_year, next_month)}')
+            """)
+            cursor.execute("RELEASE SAVEPOINT review_partition")
+        except Exception as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT review_partition")
+            logger.warning("Review partition not created",
+                           extra={'partition': _partition_name(year, month), 'error': str(e)})
+
+
+def get_review_events(user_id: int, since: Optional[str] = None, until: Optional[str] = None,
+                      character_id: Optional[int] = None, limit: int = 1000) -> List[Dict]:
+    """A user's reviews in [since, until), newest first
+
+    Bounds are 'YYYY-MM-DD[ HH:MM:SS]' UTC; giving since keeps the scan to
+    the partitions it covers.
+    """
+    clauses, params = ["user_id = ?"], [user_id]
+    if since:
+        clauses.append("reviewed_at >= ?")
+        params.append(since)
+    if until:
+        clauses.append("reviewed_at < ?")
+        params.append(until)
+    if character_id is not None:
+        clauses.append("character_id = ?")
+        params.append(character_id)
+    params.append(min(max(limit, 1), 10000))
+
+    conn = get_db(readonly=True, user_id=user_id)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT {', '.join(COLUMNS)} FROM review_events
+            WHERE {' AND '.join(clauses)}
+            ORDER BY reviewed_at DESC
+            LIMIT ?
+        """, params)
+        return [{**dict(row), 'reviewed_at': str(row['reviewed_at']), 'is_learned': bool(row['is_learned'])}
+                for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+
+def _expired_months(cursor, cutoff: str) -> List[Tuple[int, int]]:
+    """(year, month) of every month before cutoff that still has events"""
+    cursor.execute("SELECT MIN(reviewed_at) AS oldest FROM review_events WHERE reviewed_at < ?", (cutoff,))
+    oldest = cursor.fetchone()['oldest']
+    if oldest is None:
+        return []
+    oldest = datetime.strptime(str(oldest)[:7], '%Y-%m')
+    months, offset = [], 0
+    while _month_start(*_month(oldest, offset)) < cutoff:
+        months.append(_month(oldest, offset))
+        offset += 1
+    return months
+
+
+def _archive_month(cursor, year: int, month: int, start: str, end: str) -> int:
+    """Append a month's events to its archive file; returns the number written"""
+    cursor.execute(f"""
+        SELECT {', '.join(COLUMNS)} FROM review_events
+        WHERE reviewed_at >= ? AND reviewed_at < ?
+        ORDER BY reviewed_at
+    """, (start, end))
+    rows = cursor.fetchall()
+    if not rows:
+        return 0
+    ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    # Appending adds a gzip member; readers see one continuous stream
+    with gzip.open(ARCHIVE_DIR / f"review-events-{year:04d}-{month:02d}.jsonl.gz", 'ab') as f:
+        for row in rows:
+            f.write(dumps({**dict(row), 'reviewed_at': str(row['reviewed_at']),
+                           'is_learned': bool(row['is_learned'])}) + b"\n")
+    return len(rows)
+
+
+def prune(retention_months: int = RETENTION_MONTHS) -> int:
+    """Archive, then remove, every month older than retention_months; returns events removed"""
+    cutoff = _month_start(*_month(datetime.now(timezone.utc), -retention_months))
+    postgres = get_db_type() == 'postgresql'
+    conn = get_db()
+    cursor = conn.cursor()
+    removed = 0
+    try:
+        for year, month in _expired_months(cursor, cutoff):
+            start, end = _month_start(year, month), _month_start(*_month(datetime(year, month, 1), 1))
+            count = _archive_month(cursor, year, month, start, end)
+            partition = _partition_name(year, month)
+            if postgres:
+                cursor.execute("SELECT to_regclass(?) AS oid", (partition,))
+                if cursor.fetchone()['oid'] is not None:
+                    cursor.execute(f"DROP TABLE {partition}")
+            # Rows outside a monthly partition (SQLite, or the default partition)
+            cursor.execute("DELETE FROM review_events WHERE reviewed_at >= ? AND reviewed_at < ?", (start, end))
+            # Commit per month so an archived month is never archived twice
+            conn.commit()
+            removed += count
+            logger.info("Review events archived", extra={'month': f"{year:04d}-{month:02d}", 'events': count})
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return removed
+
+
+def maintain(retention_months: int = RETENTION_MONTHS) -> int:
+    """Create upcoming partitions (PostgreSQL) and prune expired months"""
+    if get_db_type() == 'postgresql':
+        conn = get_db()
+        try:
+            ensure_partitions(conn.cursor())
+            conn.commit()
+        finally:
+            conn.close()
+    return prune(retention_months)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Review event log maintenance")
+    parser.add_argument("--maintain", action="store_true",
+                        help="create upcoming partitions and archive + drop expired months")
+    parser.add_argument("--retention-months", type=int, default=RETENTION_MONTHS,
+                        help=f"months of events to keep (default {RETENTION_MONTHS})")
+    args = parser.parse_args(argv)
+
+    if not args.maintain:
+        parser.print_help()
+        return
+    print(f"Archived and removed {maintain(args.retention_months)} review events")
+
+
+if __name__ == "__main__":
+    main()
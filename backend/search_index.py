@@ -0,0 +1,323 @@
+"""
+Full-text search over character cards and words
+
+Documents are kept in a side index that database.py updates in the same
+transaction as each character/word write:
+
+- SQLite: FTS5 virtual table search_fts(title, body), ranked with bm25()
+- PostgreSQL: search_documents with a generated tsvector column and a GIN
+  index, ranked with ts_rank_cd()
+
+Chinese text has no spaces, so both backends index pre-tokenized text:
+every CJK character plus every adjacent pair (bigrams), Latin words
+lower-cased and pinyin folded to plain ASCII (bǎ -> ba). A query is
+tokenized the same way and all of its tokens must match, so any substring
+of two or more characters is found without depending on how a word
+segmenter happens to split the surrounding sentence.
+
+Usage:
+    python search_index.py --rebuild      # re-index every character and word
+    python search_index.py 把手            # run a query from the shell
+"""
+import argparse
+import logging
+import re
+import unicodedata
+from typing import Dict, List, Optional
+
+from card_fields import HAN_RANGES
+from db_manager import get_db, get_db_type
+
+logger = logging.getLogger(__name__)
+
+# Row ids in the SQLite FTS table encode (doc_type, id): id * len(DOC_TYPES) + index
+DOC_TYPES = ('character', 'word')
+
+# Title (the character/word itself and its pinyin) outranks body text
+TITLE_WEIGHT = 10.0
+BODY_WEIGHT = 1.0
+
+MAX_RESULTS = 100
+
+_TOKEN_RE = re.compile(rf'[{HAN_RANGES}]+|[a-z0-9]+')
+_CJK_RE = re.compile(rf'[{HAN_RANGES}]')
+
+
+def _fold(text: str) -> str:
+    """Lower-case and strip tone marks (ǎ -> a, ü -> u)"""
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Index tokens: CJK unigrams and bigrams, folded Latin/pinyin words"""
+    tokens = []
+    for run in _TOKEN_RE.findall(_fold(text or '')):
+        if _CJK_RE.match(run):
+            tokens.extend(run)
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def query_tokens(text: str) -> List[str]:
+    """Query tokens: bigrams cover a multi-character run, a lone character stands for itself"""
+    tokens = []
+    for run in _TOKEN_RE.findall(_fold(text)):
+        if _CJK_RE.match(run) and len(run) > 1:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    # Keep order (the last token may become a prefix match) but drop repeats
+    return list(dict.fromkeys(tokens))
+
+
+def _join(*parts) -> str:
+    return ' '.join(token for part in parts for token in tokenize(part))
+
+
+def _rowid(doc_type: str, doc_id: int) -> int:
+    return doc_id * len(DOC_TYPES) + DOC_TYPES.index(doc_type)
+
+
+# ==================== Index Maintenance ====================
+
+def _put(cursor, doc_type: str, doc_id: int, title: str, body: str):
+    if get_db_type() == 'postgresql':
+        cursor.execute("""
+            INSERT INTO search_documents (doc_type, doc_id, title, body)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (doc_type, doc_id) DO UPDATE SET
+                title = EXCLUDED.title,
+                body = EXCLUDED.body
+        """, (doc_type, doc_id, title, body))
+    else:
+        rowid = _rowid(doc_type, doc_id)
+        cursor.execute("DELETE FROM search_fts WHERE rowid = ?", (rowid,))
+        cursor.execute("INSERT INTO search_fts (rowid, title, body) VALUES (?, ?, ?)",
+                       (rowid, title, body))
+
+
+def remove_document(cursor, doc_type: str, doc_id: int):
+    """Drop one document from the index"""
+    if get_db_type() == 'postgresql':
+        cursor.execute("DELETE FROM search_documents WHERE doc_type = ? AND doc_id = ?", (doc_type, doc_id))
+    else:
+        cursor.execute("DELETE FROM search_fts WHERE rowid = ?", (_rowid(doc_type, doc_id),))
+
+
+def index_character(cursor, character_id: int):
+    """(Re-)index one character card from its current row"""
+    cursor.execute("""
+        SELECT character, pinyin, alt_pinyin, meaning, etymology, rhyme_text
+        FROM characters WHERE id = ?
+    """, (character_id,))
+    row = cursor.fetchone()
+    if row is None:
+        remove_document(cursor, 'character', character_id)
+        return
+    _put(cursor, 'character', character_id,
+         _join(row['character'], row['pinyin'], row['alt_pinyin']),
+         _join(row['meaning'], row['etymology'], row['rhyme_text']))
+
+
+def index_word(cursor, word_id: int):
+    """(Re-)index one word from its current row"""
+    cursor.execute("""
+        SELECT word, pinyin, chinese_meaning, english_translation, example_sentence
+        FROM words WHERE id = ?
+    """, (word_id,))
+    row = cursor.fetchone()
+    if row is None:
+        remove_document(cursor, 'word', word_id)
+        return
+    _put(cursor, 'word', word_id,
+         _join(row['word'], row['pinyin']),
+         _join(row['chinese_meaning'], row['english_translation'], row['example_sentence']))
+
+
+def rebuild() -> Dict[str, int]:
+    """Re-index everything from scratch (one transaction)"""
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        if get_db_type() == 'postgresql':
+            cursor.execute("DELETE FROM search_documents")
+        else:
+            cursor.execute("DELETE FROM search_fts")
+
+        cursor.execute("SELECT id FROM characters")
+        character_ids = [row['id'] for row in cursor.fetchall()]
+        cursor.execute("SELECT id FROM words")
+        word_ids = [row['id'] for row in cursor.fetchall()]
+
+        for character_id in character_ids:
+            index_character(cursor, character_id)
+        for word_id in word_ids:
+            index_word(cursor, word_id)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    logger.info("Search index rebuilt", extra={'characters': len(character_ids), 'words': len(word_ids)})
+    return {'characters': len(character_ids), 'words': len(word_ids)}
+
+
+def ensure_index():
+    """Build the index once for databases that predate it"""
+    conn = get_db(readonly=True)
+    cursor = conn.cursor()
+    table = 'search_documents' if get_db_type() == 'postgresql' else 'search_fts'
+    cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {table}) AS indexed, "
+                   f"EXISTS (SELECT 1 FROM characters) AS has_characters")
+    row = cursor.fetchone()
+    conn.close()
+
+    if row['has_characters'] and not row['indexed']:
+        rebuild()
+
+
+# ==================== Search ====================
+
+def _quote_fts(token: str) -> str:
+    return '"' + token.replace('"', '""') + '"'
+
+
+def _quote_tsquery(token: str) -> str:
+    return "'" + token.replace('\\', '\\\\').replace("'", "''") + "'"
+
+
+def _match_ids(cursor, tokens: List[str], doc_type: Optional[str], limit: int, match_all: bool):
+    """[(doc_type, doc_id, score)] best first"""
+    # The last Latin token is still being typed: match it as a prefix
+    prefix = bool(tokens) and not _CJK_RE.match(tokens[-1])
+
+    if get_db_type() == 'postgresql':
+        terms = [_quote_tsquery(token) for token in tokens]
+        if prefix:
+            terms[-1] += ':*'
+        where = "tsv @@ query"
+        params = [(' & ' if match_all else ' | ').join(terms)]
+        if doc_type:
+            where += " AND doc_type = ?"
+            params.append(doc_type)
+        params.append(limit)
+        cursor.execute(f"""
+            SELECT doc_type, doc_id, ts_rank_cd('{{0.1, 0.2, {BODY_WEIGHT / TITLE_WEIGHT}, 1.0}}', tsv, query) AS score
+            FROM search_documents, to_tsquery('simple', ?) AS query
+            WHERE {where}
+            ORDER BY score DESC, doc_id
+            LIMIT ?
+        """, params)
+        return [(row['doc_type'], row['doc_id'], float(row['score'])) for row in cursor.fetchall()]
+
+    terms = [_quote_fts(token) for token in tokens]
+    if prefix:
+        terms[-1] += '*'
+    where = "search_fts MATCH ?"
+    params = [(' AND ' if match_all else ' OR ').join(terms)]
+    if doc_type:
+        where += " AND rowid % ? = ?"
+        params.extend([len(DOC_TYPES), DOC_TYPES.index(doc_type)])
+    params.append(limit)
+    cursor.execute(f"""
+        SELECT rowid, bm25(search_fts, {TITLE_WEIGHT}, {BODY_WEIGHT}) AS rank
+        FROM search_fts
+        WHERE {where}
+        ORDER BY rank
+        LIMIT ?
+    """, params)
+    return [(DOC_TYPES[row['rowid'] % len(DOC_TYPES)], row['rowid'] // len(DOC_TYPES), -row['rank'])
+            for row in cursor.fetchall()]
+
+
+def _load_documents(cursor, hits) -> List[Dict]:
+    """Attach display fields to ranked hits (documents whose row is gone are dropped)"""
+    details = {}
+    character_ids = [doc_id for doc_type, doc_id, _ in hits if doc_type == 'character']
+    word_ids = [doc_id for doc_type, doc_id, _ in hits if doc_type == 'word']
+
+    if character_ids:
+        cursor.execute(f"""
+            SELECT id, character, pinyin, meaning FROM characters
+            WHERE id IN ({', '.join('?' * len(character_ids))})
+        """, character_ids)
+        for row in cursor.fetchall():
+            details[('character', row['id'])] = {
+                'character': row['character'],
+                'pinyin': row['pinyin'],
+                'meaning': row['meaning'],
+            }
+    if word_ids:
+        cursor.execute(f"""
+            SELECT w.id, w.word, w.pinyin, w.chinese_meaning, w.english_translation,
+                   w.character_id, c.character AS related_character
+            FROM words w
+            LEFT JOIN characters c ON w.character_id = c.id
+            WHERE w.id IN ({', '.join('?' * len(word_ids))})
+        """, word_ids)
+        for row in cursor.fetchall():
+            details[('word', row['id'])] = {
+                'word': row['word'],
+                'pinyin': row['pinyin'],
+                'chinese_meaning': row['chinese_meaning'],
+                'english_translation': row['english_translation'],
+                'character_id': row['character_id'],
+                'related_character': row['related_character'],
+            }
+
+    results = []
+    for doc_type, doc_id, score in hits:
+        detail = details.get((doc_type, doc_id))
+        if detail is not None:
+            results.append({'type': doc_type, 'id': doc_id, 'score': round(score, 4), **detail})
+    return results
+
+
+def search(query: str, limit: int = 20, doc_type: Optional[str] = None) -> List[Dict]:
+    """Ranked characters and words matching query
+
+    Every query token must match; when nothing does, documents matching any
+    token are returned instead (still ranked).
+    """
+    if doc_type is not None and doc_type not in DOC_TYPES:
+        raise ValueError(f"Unknown document type: {doc_type}")
+    tokens = query_tokens(query)
+    if not tokens:
+        return []
+    limit = max(1, min(limit, MAX_RESULTS))
+
+    conn = get_db(readonly=True)
+    cursor = conn.cursor()
+    try:
+        hits = _match_ids(cursor, tokens, doc_type, limit, match_all=True)
+        if not hits and len(tokens) > 1:
+            hits = _match_ids(cursor, tokens, doc_type, limit, match_all=False)
+        return _load_documents(cursor, hits)
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Full-text search index")
+    parser.add_argument("query", nargs="?", help="search the index")
+    parser.add_argument("--rebuild", action="store_true", help="re-index all characters and words")
+    parser.add_argument("--type", choices=DOC_TYPES, help="only characters or only words")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    if args.rebuild:
+        counts = rebuild()
+        print(f"Indexed {counts['characters']} characters and {counts['words']} words")
+    if args.query:
+        for result in search(args.query, args.limit, args.type):
+            title = result.get('character') or result.get('word')
+            print(f"{result['score']:>8.3f}  {result['type']:<9} {title}  {result.get('pinyin') or ''}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Fast JSON responses
+
+FastAPI's default path for a route that returns a dict is: validate it
+against response_model (Pydantic), walk it again with jsonable_encoder, then
+json.dumps it. For payloads that database.py already builds with the right
+shape that is three passes where one will do.
+
+FastJSONResponse encodes in a single pass with orjson, falling back to the
+stdlib encoder when orjson is not installed. A route that returns one
+directly skips response_model validation (the model still documents the
+route in OpenAPI).
+
+Either way the payload goes out as database.py built it: no keys are
+added, dropped or coerced.
+"""
+import datetime
+import decimal
+import json
+from typing import Any
+
+from fastapi.responses import Response
+
+# orjson is the fast path; stdlib json is the fallback
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+def _default(value):
+    """Types neither encoder handles natively (PostgreSQL NUMERIC, sets)"""
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Encode content as UTF-8 JSON"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(',', ':'), default=_default).encode('utf-8')
+
+
+class FastJSONResponse(Response):
+    """JSON response encoded in one pass (orjson when installed)"""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,133 @@
+"""
+Single-flight request coalescing
+
+Concurrent identical calls (same operation + arguments) share one in-flight
+computation: the first caller runs it, later callers wait for its result (or
+exception). Nothing is cached once the call completes.
+
+Results are shared between callers, so coalesced functions must return values
+that callers treat as read-only.
+"""
+import functools
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from pydantic import BaseModel
+
+
+class _Call:
+    """One in-flight computation and the callers waiting on it"""
+    __slots__ = ('event', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Any, _Call] = {}
+        self.calls = 0        # Total calls made through do()
+        self.executions = 0   # Calls that actually ran the function
+        self.coalesced = 0    # Calls that piggy-backed on an in-flight execution
+
+    def do(self, key, fn: Callable, *args, **kwargs):
+        """Run fn(*args, **kwargs) unless an identical call is already in flight"""
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executions += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'executions': self.executions,
+                'coalesced': self.coalesced,
+                'in_flight': len(self._calls),
+            }
+
+
+_groups: Dict[str, SingleFlight] = {}
+_groups_lock = threading.Lock()
+
+
+def get_group(name: str) -> SingleFlight:
+    """Get (or create) the named single-flight group"""
+    with _groups_lock:
+        group = _groups.get(name)
+        if group is None:
+            group = _groups[name] = SingleFlight(name)
+        return group
+
+
+def _freeze(value):
+    """Turn arguments into a hashable key (pydantic models, dicts and lists included)"""
+    if isinstance(value, BaseModel):
+        return (type(value).__name__, _freeze(value.model_dump()))
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def single_flight(name: str, exclude: Iterable[str] = ()):
+    """Decorator: coalesce concurrent calls with identical arguments
+
+    exclude: keyword arguments left out of the key (e.g. per-caller callbacks).
+    Only the leading call's excluded arguments are used.
+    """
+    excluded = frozenset(exclude)
+
+    def decorator(fn: Callable):
+        group = get_group(name)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key_kwargs = {k: v for k, v in kwargs.items() if k not in excluded}
+            key = (_freeze(args), _freeze(key_kwargs))
+            return group.do(key, fn, *args, **kwargs)
+
+        wrapper.single_flight = group
+        return wrapper
+
+    return decorator
+
+
+def get_stats() -> Dict[str, Dict[str, int]]:
+    """Per-operation coalescing counters"""
+    with _groups_lock:
+        groups = list(_groups.values())
+    return {group.name: group.stats() for group in groups}
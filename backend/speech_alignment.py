@@ -0,0 +1,219 @@
+"""
+Speech transcript alignment for reading mode
+
+ArticleReader sends what the browser's speech recognition heard; this finds
+where in the article the reader is. Matching is on toneless pinyin, not
+characters, so recognizer homophone slips (他/她, 在/再) still count as read,
+and commonly merged sounds (zh/z, n/l, in/ing, ...) cost half an error.
+
+Each article is indexed once (per content hash): the toneless syllable of
+every Han character, its sentence and offset, and the positions of every
+syllable trigram. An alignment is a semi-global edit distance of the last
+MAX_TRANSCRIPT_SYLLABLES heard against a window of the article:
+
+1. around the reader's last position (the client passes it back), which is
+   where they almost always are
+2. failing that, around the spots the transcript's trigrams point at, so a
+   jump elsewhere in a long article is found without scanning all of it
+
+Offsets in responses count every character of sentence.chinese, punctuation
+included - the same indexing ArticleReader uses for highlighting.
+"""
+import bisect
+import hashlib
+import re
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from pypinyin import Style, lazy_pinyin
+
+# Only the tail of a long transcript is aligned - it says where the reader is now
+MAX_TRANSCRIPT_SYLLABLES = 40
+# Window searched around the last position: a little behind, mostly ahead
+BACKTRACK_SYLLABLES = 20
+LOOKAHEAD_SYLLABLES = 120
+# Trigram anchors tried when the reader is not near their last position
+MAX_ANCHORS = 3
+# Below this the transcript is not considered found in the article
+MIN_ACCURACY = 0.5
+NEAR_COST = 0.5
+INDEX_CACHE_SIZE = 8
+
+_HAN_RE = re.compile(r'[\u3400-\u9fff]')
+_INITIAL_RE = re.compile(r'^(zh|ch|sh|[bpmfdtnlgkhjqxrzcsyw])')
+
+# Sounds many speakers (and recognizers) do not distinguish
+_NEAR_INITIALS = {'zh': 'z', 'ch': 'c', 'sh': 's', 'n': 'l', 'f': 'h'}
+_NEAR_FINALS = {'ing': 'in', 'eng': 'en', 'ang': 'an', 'iang': 'ian', 'uang': 'uan'}
+
+
+def _split(syllable: str) -> Tuple[str, str]:
+    match = _INITIAL_RE.match(syllable)
+    initial = match.group(1) if match else ''
+    return initial, syllable[len(initial):]
+
+
+def _near_form(syllable: str) -> str:
+    initial, final = _split(syllable)
+    return _NEAR_INITIALS.get(initial, initial) + _NEAR_FINALS.get(final, final)
+
+
+def _cost(heard: str, written: str) -> float:
+    if heard == written:
+        return 0.0
+    if _near_form(heard) == _near_form(written):
+        return NEAR_COST
+    return 1.0
+
+
+def to_syllables(text: str) -> List[str]:
+    """Toneless pinyin per Han character of text (everything else dropped)"""
+    han = ''.join(_HAN_RE.findall(text or ''))
+    return lazy_pinyin(han, style=Style.NORMAL) if han else []
+
+
+@dataclass
+class ArticleIndex:
+    """Per-character pinyin of an article, flattened, with a trigram lookup"""
+    article_id: str
+    syllables: List[str] = field(default_factory=list)
+    # Parallel to syllables: (sentence index, offset in sentence, offset in article)
+    positions: List[Tuple[int, int, int]] = field(default_factory=list)
+    offsets: List[int] = field(default_factory=list)
+    trigrams: Dict[Tuple[str, str, str], List[int]] = field(default_factory=lambda: defaultdict(list))
+
+
+def article_id(sentences: List[str]) -> str:
+    """Content hash identifying one version of an article"""
+    return hashlib.sha1('\n'.join(sentences).encode('utf-8')).hexdigest()[:16]
+
+
+def build_index(sentences: List[str]) -> ArticleIndex:
+    index = ArticleIndex(article_id(sentences))
+    offset = 0
+    for sentence_index, sentence in enumerate(sentences):
+        # Whole-sentence conversion so heteronyms (行, 长) get their in-context reading;
+        # non-Han characters come back as '' and keep the offsets aligned
+        readings = lazy_pinyin(sentence, style=Style.NORMAL, errors=lambda chars: [''] * len(chars))
+        if len(readings) != len(sentence):
+            readings = [lazy_pinyin(ch, style=Style.NORMAL)[0] if _HAN_RE.match(ch) else '' for ch in sentence]
+        for char_offset, reading in enumerate(readings):
+            if reading and _HAN_RE.match(sentence[char_offset]):
+                index.syllables.append(reading)
+                index.positions.append((sentence_index, char_offset, offset + char_offset))
+                index.offsets.append(offset + char_offset)
+        offset += len(sentence)
+    for i in range(len(index.syllables) - 2):
+        index.trigrams[tuple(index.syllables[i:i + 3])].append(i)
+    return index
+
+
+_indexes: "OrderedDict[str, ArticleIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_index(sentences: List[str]) -> ArticleIndex:
+    """Cached index for this version of the article"""
+    key = article_id(sentences)
+    with _indexes_lock:
+        if key in _indexes:
+            _indexes.move_to_end(key)
+            return _indexes[key]
+    index = build_index(sentences)
+    with _indexes_lock:
+        _indexes[key] = index
+        while len(_indexes) > INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
+
+
+def _align(heard: List[str], written: List[str], lo: int, hi: int, expected: int) -> Tuple[float, int, int]:
+    """Best match of heard anywhere in written[lo:hi] -> (cost, start, end exclusive)
+
+    Semi-global edit distance: the match may start and end anywhere in the
+    window. Ties go to the end nearest expected.
+    """
+    width = hi - lo
+    # Row for zero syllables heard: free to start at any column
+    costs = [0.0] * (width + 1)
+    starts = list(range(lo, hi + 1))
+    for i, syllable in enumerate(heard, 1):
+        new_costs = [float(i)] + [0.0] * width
+        new_starts = [lo] + [0] * width
+        for j in range(1, width + 1):
+            best, start = costs[j - 1] + _cost(syllable, written[lo + j - 1]), starts[j - 1]
+            if costs[j] + 1 < best:
+                best, start = costs[j] + 1, starts[j]
+            if new_costs[j - 1] + 1 < best:
+                best, start = new_costs[j - 1] + 1, new_starts[j - 1]
+            new_costs[j], new_starts[j] = best, start
+        costs, starts = new_costs, new_starts
+    end = min(range(1, width + 1), key=lambda j: (costs[j], abs(lo + j - expected)))
+    return costs[end], starts[end], lo + end
+
+
+def _anchors(index: ArticleIndex, heard: List[str]) -> List[int]:
+    """Likely article positions of the transcript's start, by trigram votes"""
+    votes = Counter()
+    for i in range(len(heard) - 2):
+        for position in index.trigrams.get(tuple(heard[i:i + 3]), ()):
+            votes[position - i] += 1
+    return [position for position, _ in votes.most_common(MAX_ANCHORS)]
+
+
+def align(sentences: List[str], transcript: str, position: Optional[int] = None) -> Dict:
+    """Locate transcript in the article
+
+    position is the article offset returned by the previous alignment (where
+    the reader had got to). Returns matched, accuracy and, when matched, the
+    span (start/end article offsets, end exclusive), the sentence and offset
+    the reader has reached, and the position to send next time.
+    """
+    index = get_index(sentences)
+    heard = to_syllables(transcript)[-MAX_TRANSCRIPT_SYLLABLES:]
+    result = {'article_id': index.article_id, 'matched': False, 'accuracy': 0.0, 'position': position}
+    if not heard or not index.syllables:
+        return result
+
+    total = len(index.syllables)
+    windows = []
+    if position is not None:
+        # Syllable index of the first Han character at or after the article offset
+        cursor = bisect.bisect_left(index.offsets, position)
+        windows.append((max(0, cursor - BACKTRACK_SYLLABLES),
+                        min(total, cursor + len(heard) + LOOKAHEAD_SYLLABLES), cursor))
+    for anchor in _anchors(index, heard):
+        windows.append((max(0, anchor - BACKTRACK_SYLLABLES), min(total, anchor + len(heard) + BACKTRACK_SYLLABLES),
+                        anchor))
+    if not windows:
+        # No position and no trigram in common (a very short chunk): scan the article
+        windows.append((0, total, 0))
+
+    best = None
+    for lo, hi, expected in windows:
+        if hi <= lo:
+            continue
+        cost, start, end = _align(heard, index.syllables, lo, hi, expected + len(heard))
+        if best is None or cost < best[0]:
+            best = (cost, start, end)
+        if 1 - cost / len(heard) >= MIN_ACCURACY:
+            break
+
+    cost, start, end = best
+    accuracy = round(max(0.0, 1 - cost / len(heard)), 3)
+    result['accuracy'] = accuracy
+    if accuracy < MIN_ACCURACY or end <= start:
+        return result
+
+    sentence_index, char_offset, last_offset = index.positions[end - 1]
+    result.update({
+        'matched': True,
+        'start': index.positions[start][2],
+        'end': last_offset + 1,
+        'sentence_index': sentence_index,
+        'sentence_offset': char_offset,
+        'position': last_offset + 1,
+    })
+    return result
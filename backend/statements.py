@@ -0,0 +1,103 @@
+"""
+Prepared-statement registry
+
+database.py declares its hot queries once with statement(name, sql), using
+SQLite-style ? placeholders. Each statement is translated for both dialects
+when the module is imported:
+
+- SQLite runs the qmark SQL as-is (sqlite3 caches compiled statements per connection)
+- PostgreSQL gets a pyformat (%s) version for plain execution and a $n
+  version for PREPARE, which db_manager runs once per pooled connection and
+  then calls with EXECUTE
+
+Translation is literal-aware: a '?' inside a string literal, quoted identifier
+or comment is left alone, and literal '%' signs are escaped for psycopg2.
+"""
+import functools
+from typing import Dict, Tuple
+
+
+def _scan(sql: str):
+    """Yield (is_placeholder, text) chunks, skipping quoted text and comments"""
+    i, n, start = 0, len(sql), 0
+    while i < n:
+        ch = sql[i]
+        if ch in ("'", '"'):
+            # Quoted literal/identifier; doubled quotes are escapes
+            i += 1
+            while i < n:
+                if sql[i] == ch:
+                    if i + 1 < n and sql[i + 1] == ch:
+                        i += 2
+                        continue
+                    break
+                i += 1
+            i += 1
+        elif ch == '-' and sql.startswith('--', i):
+            end = sql.find('\n', i)
+            i = n if end == -1 else end + 1
+        elif ch == '/' and sql.startswith('/*', i):
+            end = sql.find('*/', i + 2)
+            i = n if end == -1 else end + 2
+        elif ch == '?':
+            yield False, sql[start:i]
+            yield True, '?'
+            i += 1
+            start = i
+        else:
+            i += 1
+    yield False, sql[start:]
+
+
+@functools.lru_cache(maxsize=1024)
+def translate(sql: str) -> Tuple[str, str, int]:
+    """Translate qmark SQL to (pyformat SQL, $n SQL for PREPARE, parameter count)"""
+    pyformat, numbered = [], []
+    count = 0
+    for is_placeholder, text in _scan(sql):
+        if is_placeholder:
+            count += 1
+            pyformat.append('%s')
+            numbered.append(f'${count}')
+        else:
+            pyformat.append(text.replace('%', '%%'))
+            numbered.append(text)
+    return ''.join(pyformat), ''.join(numbered), count
+
+
+def to_pyformat(sql: str) -> str:
+    """qmark -> pyformat for ad-hoc (unregistered) queries"""
+    return translate(sql)[0]
+
+
+class Statement(str):
+    """A registered query: behaves as its qmark SQL, carries the PostgreSQL forms"""
+
+    def __new__(cls, name: str, sql: str):
+        self = super().__new__(cls, sql)
+        self.name = name
+        self.pyformat_sql, self.prepare_sql, self.param_count = translate(sql)
+        # Server-side name; lower-case so it is safe unquoted
+        self.prepared_name = f"cf_{name}".lower()
+        args = f" ({', '.join(['%s'] * self.param_count)})" if self.param_count else ""
+        self.execute_sql = f"EXECUTE {self.prepared_name}{args}"
+        return self
+
+
+_registry: Dict[str, Statement] = {}
+
+
+def statement(name: str, sql: str) -> Statement:
+    """Declare a named statement (once, at import time)"""
+    sql = sql.strip()
+    existing = _registry.get(name)
+    if existing is not None:
+        if existing != sql:
+            raise ValueError(f"Statement {name!r} is already registered with different SQL")
+        return existing
+    stmt = _registry[name] = Statement(name, sql)
+    return stmt
+
+
+def get_statements() -> Dict[str, Statement]:
+    return dict(_registry)
@@ -0,0 +1,215 @@
+"""
+Asynchronous structured logging
+
+Request threads only enqueue log records; a background QueueListener thread
+formats them as JSON lines and writes them to stderr, so a slow terminal or
+log pipe never serialises request handling.
+
+Every record carries the current request id (set by RequestIdMiddleware) and
+passes through API-key redaction before it is queued.
+
+Environment:
+    LOG_LEVEL               root level (default INFO)
+    LOG_LEVELS              per-module levels, e.g. "ai_service=DEBUG,database=WARNING"
+    LOG_DEBUG_SAMPLE_RATE   fraction of DEBUG records kept (default 1.0); a record
+                            can override it with extra={'sample_rate': 0.01}
+    LOG_FORMAT              "json" (default) or "text"
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import uuid
+from datetime import datetime, timezone
+from typing import Optional
+
+# Current request id - propagated into threadpool routes by contextvars
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('request_id', default=None)
+
+# Bounded so a stuck writer cannot grow memory without limit; overflow is dropped
+QUEUE_SIZE = 10000
+
+# Attributes every LogRecord has - anything else came in through extra=
+_RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_REDACTIONS = [
+    # sk-... style provider keys (OpenAI, Kimi, OpenRouter, SiliconFlow)
+    (re.compile(r'\bsk-[A-Za-z0-9_\-]{8,}'), 'sk-***'),
+    (re.compile(r'(Bearer\s+)[A-Za-z0-9_\-\.=]+', re.IGNORECASE), r'\1***'),
+    # api_key=..., "apiKey": "...", 'api-key': '...'
+    (re.compile(r'''(["']?api[_\-]?key["']?\s*[:=]\s*["']?)[^"'\s,}&]+''', re.IGNORECASE), r'\1***'),
+]
+
+
+def redact(text: str) -> str:
+    """Mask API keys and bearer tokens in a string"""
+    for pattern, replacement in _REDACTIONS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def get_request_id() -> Optional[str]:
+    return request_id_var.get()
+
+
+class ContextFilter(logging.Filter):
+    """Stamp the request id and drop sampled-out DEBUG records (runs on the calling thread)"""
+
+    def __init__(self, debug_sample_rate: float = 1.0):
+        super().__init__()
+        self.debug_sample_rate = debug_sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno <= logging.DEBUG:
+            rate = getattr(record, 'sample_rate', self.debug_sample_rate)
+            if rate < 1.0 and random.random() >= rate:
+                return False
+        record.request_id = request_id_var.get()
+        return True
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that keeps the record structured instead of pre-formatting it"""
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass  # Never block a request thread on logging
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve args and tracebacks here: they may reference objects that change later
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = redact(record.getMessage())
+        record.args = None
+        if record.exc_info:
+            record.exc_text = redact(logging.Formatter().formatException(record.exc_info))
+            record.exc_info = None
+        for key, value in list(record.__dict__.items()):
+            if key not in _RESERVED_ATTRS and isinstance(value, str):
+                setattr(record, key, redact(value))
+        return record
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, request_id, extra fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        if getattr(record, 'request_id', None):
+            entry['request_id'] = record.request_id
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and key not in ('request_id', 'sample_rate'):
+                entry[key] = value
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable fallback for local development"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)-7s %(name)s [%(request_id)s] %(message)s')
+
+    def format(self, record: logging.LogRecord) -> str:
+        if not hasattr(record, 'request_id'):
+            record.request_id = None
+        return super().format(record)
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def parse_levels(spec: str) -> dict:
+    """Parse "module=LEVEL,other=LEVEL" into {module: level}"""
+    levels = {}
+    for item in spec.split(','):
+        if '=' not in item:
+            continue
+        name, level = item.split('=', 1)
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(level: Optional[str] = None, module_levels: Optional[dict] = None,
+                  debug_sample_rate: Optional[float] = None, fmt: Optional[str] = None):
+    """Install the queue-backed handler on the root logger (idempotent)"""
+    global _listener
+    if _listener is not None:
+        return
+
+    level = (level or os.getenv('LOG_LEVEL', 'INFO')).upper()
+    if module_levels is None:
+        module_levels = parse_levels(os.getenv('LOG_LEVELS', ''))
+    if debug_sample_rate is None:
+        debug_sample_rate = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', '1.0'))
+    fmt = fmt or os.getenv('LOG_FORMAT', 'json')
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(TextFormatter() if fmt == 'text' else JSONFormatter())
+
+    log_queue = queue.Queue(QUEUE_SIZE)
+    queue_handler = AsyncQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter(debug_sample_rate))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(queue_handler)
+    for name, module_level in module_levels.items():
+        logging.getLogger(name).setLevel(module_level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class RequestIdMiddleware:
+    """Pure ASGI middleware: take X-Request-ID from the client or mint one, echo it back"""
+
+    def __init__(self, app, header: str = 'x-request-id'):
+        self.app = app
+        self.header = header.encode('latin-1')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope.get('headers', []):
+            if name == self.header:
+                request_id = value.decode('latin-1')[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex[:16]
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                message.setdefault('headers', [])
+                message['headers'] = list(message['headers']) + [(self.header, request_id.encode('latin-1'))]
+            await send(message)
+
+        token = request_id_var.set(request_id)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(token)
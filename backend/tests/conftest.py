@@ -0,0 +1,19 @@
+"""
+Test setup: every test session runs against a throwaway SQLite database
+
+The backend modules import flat (from db_manager import ...) and
+database.py initialises the schema on import, so the environment has to be
+in place before anything from the backend is imported.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+_tmp = tempfile.mkdtemp(prefix="chineseflow-tests-")
+os.environ['DATABASE_TYPE'] = 'sqlite'
+os.environ['SQLITE_PATH'] = os.path.join(_tmp, "test.db")
+os.environ['AI_RATE_LIMIT_STORE'] = os.path.join(_tmp, "rate_limits.db")
@@ -0,0 +1,119 @@
+"""
+Version and delta logic of content_bundle: seq gaps, the pruned/future
+window and tombstones for deleted rows
+"""
+from types import SimpleNamespace
+
+import pytest
+
+import content_bundle
+import database
+from db_manager import get_db
+
+NOW = 1_800_000_000.0
+OLD = NOW - content_bundle.GAP_GRACE_SECONDS - 60
+FRESH = NOW - 1
+
+
+@pytest.fixture(autouse=True)
+def frozen_clock(monkeypatch):
+    monkeypatch.setattr(content_bundle, 'time', SimpleNamespace(time=lambda: NOW))
+
+
+@pytest.fixture
+def change_log():
+    """Replace the change log with hand-written (seq, changed_at) rows"""
+    def write(*rows):
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM content_changes")
+        for seq, changed_at in rows:
+            cursor.execute("INSERT INTO content_changes (seq, entity, entity_id, changed_at) VALUES (?, ?, ?, ?)",
+                           (seq, 'character', 1_000_000 + seq, changed_at))
+        conn.commit()
+        conn.close()
+    yield write
+    write()
+
+
+def version():
+    conn = get_db()
+    try:
+        return content_bundle.current_version(conn.cursor())
+    finally:
+        conn.close()
+
+
+def test_contiguous_log_reaches_latest(change_log):
+    change_log((1, OLD), (2, OLD), (3, FRESH))
+    assert version() == 3
+    assert content_bundle.get_delta(0)['version'] == 3
+
+
+def test_fresh_gap_stops_the_version(change_log):
+    # seq 3 may belong to a transaction that has not committed yet
+    change_log((1, OLD), (2, OLD), (4, FRESH))
+    assert version() == 2
+    delta = content_bundle.get_delta(0)
+    assert delta['version'] == 2
+    assert delta['deleted']['characters'] == [1_000_001, 1_000_002]
+
+
+def test_fresh_gap_after_settled_rows_in_the_grace_window(change_log):
+    change_log((1, OLD), (2, FRESH), (4, FRESH), (5, FRESH))
+    assert version() == 2
+
+
+def test_old_gap_is_skipped(change_log):
+    # seq 3 was rolled back long ago; it will never appear
+    change_log((1, OLD), (2, OLD), (4, OLD), (5, FRESH))
+    assert version() == 5
+    assert content_bundle.get_delta(2)['version'] == 5
+
+
+def test_pruned_since_is_unavailable(change_log):
+    change_log((5, OLD), (6, OLD))
+    with pytest.raises(content_bundle.DeltaUnavailable):
+        content_bundle.get_delta(3)
+    # The version just before the oldest kept row is still reachable
+    assert content_bundle.get_delta(4)['version'] == 6
+
+
+def test_future_since_is_unavailable(change_log):
+    change_log((1, OLD), (2, OLD))
+    with pytest.raises(content_bundle.DeltaUnavailable):
+        content_bundle.get_delta(3)
+    assert content_bundle.get_delta(2) == {
+        'since': 2, 'version': 2, 'characters': [], 'words': [],
+        'deleted': {'characters': [], 'words': []},
+    }
+
+
+def test_delta_route_answers_410(change_log):
+    from fastapi.testclient import TestClient
+    import main
+
+    change_log((5, OLD), (6, OLD))
+    client = TestClient(main.app)
+    assert client.get("/api/bundle/delta", params={'since': 3}).status_code == 410
+    assert client.get("/api/bundle/delta", params={'since': 7}).status_code == 410
+    assert client.get("/api/bundle/delta", params={'since': 4}).status_code == 200
+
+
+def test_deleted_word_comes_back_as_tombstone(change_log):
+    change_log()
+    character_id = database.add_character_full(character="测")
+    kept = database.add_word("测试", character_id=character_id)
+    removed = database.add_word("测量", character_id=character_id)
+    assert database.delete_word(removed)
+
+    # AUTOINCREMENT carries on from earlier tests' seqs: start at the oldest kept version
+    conn = get_db()
+    try:
+        since, _ = content_bundle._log_bounds(conn.cursor())
+    finally:
+        conn.close()
+    delta = content_bundle.get_delta(since)
+    assert [card['id'] for card in delta['characters']] == [character_id]
+    assert [word['id'] for word in delta['words']] == [kept]
+    assert delta['deleted'] == {'characters': [], 'words': [removed]}
@@ -0,0 +1,57 @@
+"""
+IncrementalJSONParser: top-level fields come out as soon as they are complete,
+however the model's text is split into chunks
+"""
+import json
+
+from ai_service import IncrementalJSONParser
+
+CARD = {
+    "pinyin": "bǎ",
+    "radical": "扌",
+    "stroke_count": 7,
+    "rhyme_text": "手拿把，\"握\"得牢, {不放}",
+    "word_groups": {"把握": ["把握时机"], "把手": []},
+    "famous_quotes": [{"text": "把酒问青天", "source": "苏轼"}],
+}
+
+
+def feed_all(parser, chunks):
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    return events
+
+
+def test_one_character_at_a_time_yields_every_field_in_order():
+    text = json.dumps(CARD, ensure_ascii=False)
+    events = feed_all(IncrementalJSONParser(), text)
+    assert events == list(CARD.items())
+
+
+def test_field_is_emitted_by_the_chunk_that_completes_it():
+    parser = IncrementalJSONParser()
+    assert parser.feed('{"pinyin": "b') == []
+    assert parser.feed('ǎ", "stroke') == [("pinyin", "bǎ")]
+    assert parser.feed('_count": 7') == []
+    # The closing brace completes the last field
+    assert parser.feed('}') == [("stroke_count", 7)]
+
+
+def test_fences_and_prose_around_the_object_are_skipped():
+    text = "好的，以下是内容：\n```json\n" + json.dumps(CARD, ensure_ascii=False) + "\n```\n希望有帮助 {\"x\": 1}"
+    parser = IncrementalJSONParser()
+    assert dict(feed_all(parser, [text[i:i + 5] for i in range(0, len(text), 5)])) == CARD
+    assert parser.finished
+    assert parser.fields == CARD
+
+
+def test_delimiters_inside_strings_do_not_end_a_value():
+    parser = IncrementalJSONParser()
+    events = feed_all(parser, ['{"a": "x, y} ]', ' \\"z\\"", "b": [1, ', '"]", {"c": 2}]}'])
+    assert events == [("a", 'x, y} ] "z"'), ("b", [1, "]", {"c": 2}])]
+
+
+def test_unparseable_value_falls_back_to_its_text():
+    assert IncrementalJSONParser().feed('{"stroke_count": seven, "pinyin": "bǎ"}') == [
+        ("stroke_count", "seven"), ("pinyin", "bǎ")]
@@ -0,0 +1,166 @@
+"""
+Circuit breaker transitions and failover down the provider chain, on a fake
+monotonic clock
+"""
+from types import SimpleNamespace
+
+import pytest
+
+import provider_chain
+import rate_limiter
+from provider_chain import MIN_CALLS, OPEN_SECONDS, SLOW_CALL_SECONDS, CircuitBreaker, ProvidersUnavailable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(provider_chain, 'time', SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+@pytest.fixture
+def breakers(monkeypatch):
+    """Fresh breakers for a two-provider chain"""
+    fresh = {name: CircuitBreaker(name) for name in ('kimi', 'openai')}
+    monkeypatch.setattr(provider_chain, 'breakers', fresh)
+    monkeypatch.setattr(provider_chain, 'candidates',
+                        lambda settings: [settings, SimpleNamespace(provider='openai')])
+    return fresh
+
+
+def opened(clock):
+    breaker = CircuitBreaker('kimi')
+    for _ in range(MIN_CALLS):
+        breaker.record(False, 0.1)
+    assert breaker.state == 'open'
+    return breaker
+
+
+def test_failures_below_min_calls_keep_it_closed(clock):
+    breaker = CircuitBreaker('kimi')
+    for _ in range(MIN_CALLS - 1):
+        breaker.record(False, 0.1)
+    assert breaker.state == 'closed'
+    assert breaker.allow()
+
+
+def test_error_rate_over_the_window_opens_it(clock):
+    breaker = CircuitBreaker('kimi')
+    for ok in (True, False, True, False, False):
+        breaker.record(ok, 0.1)
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+
+
+def test_slow_successes_open_it(clock):
+    breaker = CircuitBreaker('kimi')
+    for latency in (SLOW_CALL_SECONDS, 0.1, SLOW_CALL_SECONDS + 5, SLOW_CALL_SECONDS, 0.1):
+        breaker.record(True, latency)
+    assert breaker.state == 'open'
+
+
+def test_calls_older_than_the_window_are_forgotten(clock):
+    breaker = CircuitBreaker('kimi')
+    for _ in range(MIN_CALLS - 1):
+        breaker.record(False, 0.1)
+    clock.now += provider_chain.WINDOW_SECONDS + 1
+    breaker.record(False, 0.1)
+    assert breaker.state == 'closed'
+
+
+def test_open_admits_one_probe_after_open_seconds(clock):
+    breaker = opened(clock)
+    clock.now += OPEN_SECONDS - 1
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+    assert breaker.state == 'half_open'
+    # The probe is taken; nobody else gets through until it reports
+    assert not breaker.allow()
+
+
+@pytest.mark.parametrize("ok, latency, state", [
+    (True, 0.1, 'closed'),
+    (False, 0.1, 'open'),
+    (True, SLOW_CALL_SECONDS, 'open'),
+])
+def test_probe_outcome_closes_or_reopens(clock, ok, latency, state):
+    breaker = opened(clock)
+    clock.now += OPEN_SECONDS
+    assert breaker.allow()
+    breaker.record(ok, latency)
+    assert breaker.state == state
+    assert breaker.allow() == (state == 'closed')
+
+
+def test_released_probe_can_be_claimed_again(clock):
+    breaker = opened(clock)
+    clock.now += OPEN_SECONDS
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+
+def test_run_fails_over_and_records_each_provider(clock, breakers):
+    def call(candidate, max_retries):
+        if candidate.provider == 'kimi':
+            raise RuntimeError("502")
+        return 'answer'
+
+    assert provider_chain.run(SimpleNamespace(provider='kimi'), call) == 'answer'
+    assert [ok for _, ok, _ in breakers['kimi']._calls] == [False]
+    assert [ok for _, ok, _ in breakers['openai']._calls] == [True]
+
+
+def test_a_full_rate_limit_queue_is_not_held_against_the_provider(clock, breakers):
+    def call(candidate, max_retries):
+        raise rate_limiter.RateLimitExceeded("queue full")
+
+    with pytest.raises(ProvidersUnavailable):
+        provider_chain.run(SimpleNamespace(provider='kimi'), call)
+    assert not breakers['kimi']._calls and not breakers['openai']._calls
+
+
+def test_open_providers_are_skipped(clock, breakers):
+    for _ in range(MIN_CALLS):
+        breakers['kimi'].record(False, 0.1)
+    called = []
+    provider_chain.run(SimpleNamespace(provider='kimi'), lambda c, r: called.append(c.provider))
+    assert called == ['openai']
+
+
+def test_latency_leaves_out_rate_limiter_waits(clock, breakers, monkeypatch):
+    waited = {'seconds': 0.0}
+    monkeypatch.setattr(rate_limiter, 'waited_seconds', lambda: waited['seconds'])
+
+    def call(candidate, max_retries):
+        # 40s queued for a token or backing off, 2s on the provider itself
+        waited['seconds'] += 40
+        clock.now += 42
+        return 'answer'
+
+    provider_chain.run(SimpleNamespace(provider='kimi'), call)
+    assert [latency for _, _, latency in breakers['kimi']._calls] == [2]
+
+
+def test_stream_is_judged_on_its_first_chunk(clock, breakers):
+    def open_stream(candidate, max_retries):
+        if candidate.provider == 'kimi':
+            raise RuntimeError("connection reset")
+            yield  # pragma: no cover
+        clock.now += 1
+        yield 'a'
+        clock.now += SLOW_CALL_SECONDS * 3
+        yield 'b'
+
+    assert list(provider_chain.stream(SimpleNamespace(provider='kimi'), open_stream)) == ['a', 'b']
+    assert [ok for _, ok, _ in breakers['kimi']._calls] == [False]
+    assert [(ok, latency) for _, ok, latency in breakers['openai']._calls] == [(True, 1)]
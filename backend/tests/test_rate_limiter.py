@@ -0,0 +1,145 @@
+"""
+Token buckets shared through SQLite: reservation order, pauses from 429s and
+Retry-After parsing, on a fake clock
+"""
+import email.utils
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+import rate_limiter
+from rate_limiter import RateLimitExceeded, TokenBucketStore
+
+NOW = 1_800_000_000.0
+
+
+class FakeClock:
+    """time.time/monotonic/sleep for rate_limiter; sleeping advances the clock"""
+
+    def __init__(self):
+        self.now = NOW
+        self.slept = []
+        self.on_sleep = None
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+        if self.on_sleep:
+            self.on_sleep()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter, 'time', SimpleNamespace(time=clock.time, monotonic=clock.time,
+                                                             sleep=clock.sleep))
+    return clock
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = TokenBucketStore(tmp_path / "rate_limits.db")
+    monkeypatch.setattr(rate_limiter, 'store', store)
+    return store
+
+
+def test_burst_is_free_then_callers_queue_one_slot_apart(clock, store):
+    waits = [store.reserve('b', rate=1.0, burst=2, max_wait=60) for _ in range(5)]
+    assert waits == [0.0, 0.0, 1.0, 2.0, 3.0]
+
+
+def test_tokens_refill_at_the_rate_up_to_the_burst(clock, store):
+    for _ in range(2):
+        store.reserve('b', rate=0.5, burst=2, max_wait=60)
+    clock.now += 2
+    assert store.reserve('b', rate=0.5, burst=2, max_wait=60) == 0.0
+    assert store.reserve('b', rate=0.5, burst=2, max_wait=60) == 2.0
+    clock.now += 3600
+    assert [store.reserve('b', rate=0.5, burst=2, max_wait=60) for _ in range(3)] == [0.0, 0.0, 2.0]
+
+
+def test_a_reservation_beyond_max_wait_is_refused_and_takes_nothing(clock, store):
+    store.reserve('b', rate=1.0, burst=1, max_wait=60)
+    assert store.reserve('b', rate=1.0, burst=1, max_wait=0.5) is None
+    assert store.reserve('b', rate=1.0, burst=1, max_wait=60) == 1.0
+
+
+def test_overlapping_pauses_keep_the_latest_resume_time_instead_of_adding_up(clock, store):
+    for _ in range(4):
+        store.pause('b', rate=1.0, burst=5, seconds=30)
+    assert store.paused_until('b') == NOW + 30
+    # Four 429s in a row still admit a caller willing to wait MAX_WAIT_SECONDS
+    assert store.reserve('b', rate=1.0, burst=5, max_wait=120) == 30.0
+
+    store.pause('b', rate=1.0, burst=5, seconds=10)
+    assert store.paused_until('b') == NOW + 30
+
+
+def test_pause_does_not_spend_tokens(clock, store):
+    store.pause('b', rate=1.0, burst=3, seconds=5)
+    clock.now += 5
+    assert [store.reserve('b', rate=1.0, burst=3, max_wait=60) for _ in range(4)] == [0.0, 0.0, 0.0, 1.0]
+
+
+def test_a_caller_already_asleep_is_held_by_a_later_pause(clock, store):
+    store.reserve('b', rate=1.0, burst=1, max_wait=60)
+
+    def another_worker_gets_429():
+        clock.on_sleep = None
+        store.pause('b', rate=1.0, burst=1, seconds=20)
+
+    clock.on_sleep = another_worker_gets_429
+    rate_limiter.acquire('kimi', 'b', (60, 1))
+    # Slept 1s for its token, then until the pause that started during that sleep ended
+    assert clock.now == NOW + 21
+    assert clock.slept == [1.0, 20.0]
+
+
+def test_acquire_gives_up_when_a_pause_outlasts_max_wait(clock, store):
+    store.reserve('b', rate=1.0, burst=1, max_wait=60)
+    clock.on_sleep = lambda: store.pause('b', rate=1.0, burst=1, seconds=60)
+    with pytest.raises(RateLimitExceeded):
+        rate_limiter.acquire('kimi', 'b', (60, 1), max_wait=10)
+
+
+def test_stores_from_before_pauses_gain_the_column(tmp_path, clock):
+    path = tmp_path / "old.db"
+    conn = sqlite3.connect(str(path))
+    conn.execute("CREATE TABLE rate_buckets (bucket TEXT PRIMARY KEY, tokens REAL NOT NULL, "
+                 "updated_at REAL NOT NULL)")
+    conn.execute("INSERT INTO rate_buckets VALUES ('b', 0, ?)", (NOW,))
+    conn.commit()
+    conn.close()
+
+    store = TokenBucketStore(path)
+    assert store.paused_until('b') == 0.0
+    assert store.reserve('b', rate=1.0, burst=1, max_wait=60) == 1.0
+
+
+def response_with(retry_after=None):
+    response = requests.Response()
+    if retry_after is not None:
+        response.headers['Retry-After'] = retry_after
+    return response
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("7", 7.0),
+    ("1.5", 1.5),
+    ("-3", 0.0),
+    ("soon", None),
+])
+def test_retry_after_seconds(clock, header, expected):
+    assert rate_limiter.retry_after_seconds(response_with(header)) == expected
+
+
+def test_retry_after_as_an_http_date(clock):
+    assert rate_limiter.retry_after_seconds(response_with(email.utils.formatdate(NOW + 90, usegmt=True))) == 90.0
+    assert rate_limiter.retry_after_seconds(response_with(email.utils.formatdate(NOW - 90, usegmt=True))) == 0.0
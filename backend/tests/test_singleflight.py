@@ -0,0 +1,115 @@
+"""
+SingleFlight: concurrent identical calls share one execution, its result or
+its exception; nothing outlives the call
+"""
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight, single_flight
+
+WAITERS = 8
+
+
+def run_concurrently(group, key, fn, count=WAITERS):
+    """Start count callers of group.do(key, fn); returns (threads, outcomes)"""
+    outcomes = []
+
+    def caller():
+        try:
+            outcomes.append(('ok', group.do(key, fn)))
+        except Exception as e:
+            outcomes.append(('error', e))
+
+    threads = [threading.Thread(target=caller) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, outcomes
+
+
+def wait_for_followers(group, count):
+    deadline = time.monotonic() + 5
+    while group.stats()['coalesced'] < count:
+        assert time.monotonic() < deadline, "callers never joined the in-flight call"
+        time.sleep(0.001)
+
+
+def test_concurrent_callers_share_one_execution():
+    group, release, runs = SingleFlight('test'), threading.Event(), []
+
+    def fn():
+        runs.append(1)
+        release.wait(5)
+        return {'answer': 42}
+
+    threads, outcomes = run_concurrently(group, 'k', fn)
+    wait_for_followers(group, WAITERS - 1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(runs) == 1
+    assert [kind for kind, _ in outcomes] == ['ok'] * WAITERS
+    # Every caller gets the very same object
+    assert len({id(value) for _, value in outcomes}) == 1
+    assert group.stats() == {'calls': WAITERS, 'executions': 1, 'coalesced': WAITERS - 1, 'in_flight': 0}
+
+
+def test_the_leaders_exception_reaches_every_caller():
+    group, release = SingleFlight('test'), threading.Event()
+
+    def fn():
+        release.wait(5)
+        raise ValueError("provider down")
+
+    threads, outcomes = run_concurrently(group, 'k', fn)
+    wait_for_followers(group, WAITERS - 1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(outcomes) == WAITERS
+    assert all(kind == 'error' and str(error) == "provider down" for kind, error in outcomes)
+
+
+def test_completed_calls_are_not_cached():
+    group, runs = SingleFlight('test'), []
+    for _ in range(3):
+        group.do('k', lambda: runs.append(1))
+    assert len(runs) == 3
+    assert group.stats()['in_flight'] == 0
+
+
+def test_a_failed_call_does_not_poison_the_key():
+    group = SingleFlight('test')
+
+    def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        group.do('k', fail)
+    assert group.do('k', lambda: 'ok') == 'ok'
+
+
+def test_decorator_keys_on_arguments_but_not_excluded_ones():
+    release, runs = threading.Event(), []
+
+    @single_flight('test-decorator', exclude=('on_progress',))
+    def generate(character, options=None, on_progress=None):
+        runs.append(character)
+        release.wait(5)
+        return character
+
+    callers = [threading.Thread(target=generate, args=('把',), kwargs={'options': {'a': 1, 'b': [2]},
+                                                                          'on_progress': object()})
+               for _ in range(3)]
+    callers.append(threading.Thread(target=generate, args=('握',)))
+    for thread in callers:
+        thread.start()
+    wait_for_followers(generate.single_flight, 2)
+    release.set()
+    for thread in callers:
+        thread.join()
+
+    assert sorted(runs) == sorted(['把', '握'])
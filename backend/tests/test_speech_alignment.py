@@ -0,0 +1,87 @@
+"""
+Transcript alignment: the semi-global edit distance, its near-sound costs,
+and where align() says the reader is
+"""
+import pytest
+
+import speech_alignment
+from speech_alignment import NEAR_COST, _align, align, to_syllables
+
+WRITTEN = "wo men zai jia li chi fan ran hou qu gong yuan san bu".split()
+
+SENTENCES = [
+    "今天天气很好。",
+    "我们在家里吃饭，然后去公园散步。",
+    "公园里有很多人在跑步。",
+    "晚上我们一起看书。",
+]
+
+
+def test_exact_match_inside_the_window():
+    heard = "chi fan ran hou".split()
+    assert _align(heard, WRITTEN, 0, len(WRITTEN), 0) == (0.0, 5, 9)
+
+
+def test_window_bounds_the_search():
+    heard = "chi fan".split()
+    cost, start, end = _align(heard, WRITTEN, 7, len(WRITTEN), 7)
+    assert start >= 7 and end <= len(WRITTEN)
+    assert cost > 0
+
+
+def test_merged_sounds_cost_half_an_error():
+    # zh/z and in/ing are commonly merged; a different syllable is a full error
+    assert _align(["zhai"], ["zai"], 0, 1, 1)[0] == NEAR_COST
+    assert _align(["jin"], ["jing"], 0, 1, 1)[0] == NEAR_COST
+    assert _align(["ma"], ["zai"], 0, 1, 1)[0] == 1.0
+
+
+def test_skipped_and_extra_syllables_cost_one_each():
+    # Reader skipped "ran"
+    assert _align("chi fan hou qu".split(), WRITTEN, 0, len(WRITTEN), 0)[:2] == (1.0, 5)
+    # Recognizer added a syllable
+    assert _align("chi fan a ran hou".split(), WRITTEN, 0, len(WRITTEN), 0) == (1.0, 5, 9)
+
+
+def test_ties_go_to_the_end_nearest_expected():
+    written = "ta shuo hao ta shuo hao".split()
+    assert _align(["ta", "shuo"], written, 0, 6, 2)[1:] == (0, 2)
+    assert _align(["ta", "shuo"], written, 0, 6, 5)[1:] == (3, 5)
+
+
+def test_offsets_count_punctuation_and_homophones_still_match():
+    # 她 for 他-style slips: 再 is heard where 在 is written
+    result = align(SENTENCES, "我们再家里吃饭")
+    assert result['matched'] and result['accuracy'] == 1.0
+    article = ''.join(SENTENCES)
+    assert article[result['start']:result['end']] == "我们在家里吃饭"
+    assert result['sentence_index'] == 1
+    assert SENTENCES[1][result['sentence_offset']] == "饭"
+    assert result['position'] == result['end']
+
+
+def test_reading_on_from_the_last_position():
+    first = align(SENTENCES, "我们在家里吃饭")
+    second = align(SENTENCES, "然后去公园散步", first['position'])
+    assert second['matched']
+    # The comma after 饭 is skipped over
+    assert second['start'] == first['end'] + 1
+    assert ''.join(SENTENCES)[second['start']:second['end']] == "然后去公园散步"
+
+
+def test_a_jump_elsewhere_is_found_through_trigrams(monkeypatch):
+    # A window too small to reach the last sentence from the start of the article
+    monkeypatch.setattr(speech_alignment, 'LOOKAHEAD_SYLLABLES', 2)
+    result = align(SENTENCES, "晚上我们一起看书", position=0)
+    assert result['matched'] and result['sentence_index'] == 3
+
+
+@pytest.mark.parametrize("transcript", ["", "hello", "八九十"])
+def test_nothing_to_match(transcript):
+    result = align(SENTENCES, transcript, position=5)
+    assert not result['matched']
+    assert result['position'] == 5
+
+
+def test_to_syllables_drops_everything_but_han():
+    assert to_syllables("我们, OK 吃饭!") == ["wo", "men", "chi", "fan"]
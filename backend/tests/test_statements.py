@@ -0,0 +1,66 @@
+"""
+Placeholder rewriting in statements: qmark SQL to psycopg2 pyformat and
+PREPARE's $n, leaving quoted text and comments alone
+"""
+import pytest
+
+from statements import Statement, _scan, statement, to_pyformat, translate
+
+
+def test_placeholders_are_numbered_in_order():
+    assert translate("SELECT * FROM words WHERE id = ? AND word = ?") == (
+        "SELECT * FROM words WHERE id = %s AND word = %s",
+        "SELECT * FROM words WHERE id = $1 AND word = $2",
+        2,
+    )
+
+
+def test_scan_splits_around_placeholders_only():
+    chunks = list(_scan("a = ? AND b = '?'"))
+    assert chunks == [(False, "a = "), (True, "?"), (False, " AND b = '?'")]
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT '?' FROM t WHERE a = ?",
+    "SELECT 'it''s ?' FROM t WHERE a = ?",
+    'SELECT "odd?name" FROM t WHERE a = ?',
+    "SELECT a FROM t -- why?\nWHERE a = ?",
+    "SELECT a FROM t /* ? */ WHERE a = ?",
+])
+def test_question_marks_in_literals_and_comments_are_not_placeholders(sql):
+    pyformat, numbered, count = translate(sql)
+    assert count == 1
+    assert pyformat.endswith("a = %s")
+    assert numbered.endswith("a = $1")
+    # Everything before the real placeholder is untouched
+    assert numbered[:-2] == sql[:-1]
+
+
+def test_percent_signs_are_escaped_for_psycopg2_only():
+    sql = r"SELECT * FROM characters WHERE pinyin LIKE ? ESCAPE '\' AND note NOT LIKE '50%'"
+    pyformat, numbered, count = translate(sql)
+    assert pyformat == r"SELECT * FROM characters WHERE pinyin LIKE %s ESCAPE '\' AND note NOT LIKE '50%%'"
+    assert numbered == r"SELECT * FROM characters WHERE pinyin LIKE $1 ESCAPE '\' AND note NOT LIKE '50%'"
+    assert count == 1
+
+
+def test_unterminated_comment_or_literal_swallows_the_rest():
+    assert translate("SELECT 1 /* ? ")[2] == 0
+    assert translate("SELECT 'open ?")[2] == 0
+    assert to_pyformat("SELECT 1 -- ?") == "SELECT 1 -- ?"
+
+
+def test_statement_carries_both_postgres_forms():
+    stmt = Statement('Word_By_Id', "SELECT * FROM words WHERE id = ? AND display = ?")
+    assert stmt == "SELECT * FROM words WHERE id = ? AND display = ?"
+    assert stmt.prepare_sql == "SELECT * FROM words WHERE id = $1 AND display = $2"
+    assert stmt.prepared_name == "cf_word_by_id"
+    assert stmt.execute_sql == "EXECUTE cf_word_by_id (%s, %s)"
+    assert Statement('no_params', "SELECT 1").execute_sql == "EXECUTE cf_no_params"
+
+
+def test_registering_a_name_twice_needs_the_same_sql():
+    first = statement('test_registry_word', "SELECT * FROM words WHERE id = ?")
+    assert statement('test_registry_word', "  SELECT * FROM words WHERE id = ?\n") is first
+    with pytest.raises(ValueError):
+        statement('test_registry_word', "SELECT * FROM words WHERE word = ?")